@@ -0,0 +1,278 @@
+"""
+Local stand-ins for the services behind the sources, so that benchmarks measure the package
+rather than BigQuery, Wikipedia or X.
+
+- FakeBigQueryClient replaces GDELTSource.client and returns synthetic GKG-shaped results.
+- FakeAPIServer serves MediaWiki api.php and X recent search payloads over HTTP, with a
+  configurable latency and X rate limit headers.
+"""
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_gkg_articles(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build n_rows of GKG articles with the GDELTSource.GKG_COLUMNS shape and realistic string lengths.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n_rows)
+    themes = np.array(["PROTEST", "ECON_TAXATION", "GENERAL_GOVERNMENT", "LEADER", "TAX_FNCACT_POLICE", "EDUCATION"])
+    countries = np.array(["United States", "Canada", "France", "Brazil", "India"])
+
+    def joined(values: np.ndarray, count: int) -> np.ndarray:
+        picks = values[rng.integers(0, len(values), size=(n_rows, count))]
+        return np.array([";".join(row) for row in picks.tolist()], dtype=object)
+
+    locations = np.array(
+        [
+            f"1#{country}#{country[:2].upper()}#{country[:2].upper()}#{lat:.4f}#{long:.4f}#{country[:2].upper()}"
+            for country, lat, long in zip(
+                countries[rng.integers(0, len(countries), size=n_rows)].tolist(),
+                rng.uniform(-90, 90, size=n_rows).tolist(),
+                rng.uniform(-180, 180, size=n_rows).tolist(),
+            )
+        ],
+        dtype=object,
+    )
+    creation_ts = pd.Timestamp("2023-11-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 86400, size=n_rows), unit="s")
+
+    return pd.DataFrame(
+        {
+            "gdelt_gkg_article_id": np.char.add("20231101000000-", ids.astype(str)).astype(object),
+            "article_url": np.char.add("https://news.example.com/story/", ids.astype(str)).astype(object),
+            "themes": joined(themes, 8),
+            "locations": locations,
+            "primary_location": locations,
+            "persons": joined(np.array(["joe biden", "justin trudeau", "emmanuel macron"]), 3),
+            "organizations": joined(np.array(["united nations", "world bank", "nato"]), 2),
+            "social_image_url": np.char.add("https://img.example.com/", ids.astype(str)).astype(object),
+            "social_video_url": np.full(n_rows, None, dtype=object),
+            "creation_ts": creation_ts,
+            "bq_partition_id": pd.Timestamp("2023-11-01", tz="UTC"),
+        }
+    )
+
+
+class FakeRowIterator:
+    """
+    Minimal google.cloud.bigquery RowIterator over a DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, page_size: int = None):
+        self._df = df
+        self._page_size = page_size or max(len(df), 1)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        # BigQuery decodes a fresh DataFrame for every result
+        return self._df.copy()
+
+    def to_dataframe_iterable(self):
+        for start in range(0, len(self._df), self._page_size):
+            yield self._df.iloc[start:start + self._page_size].reset_index(drop=True)
+
+    def to_arrow_iterable(self):
+        import pyarrow as pa
+
+        for page in self.to_dataframe_iterable():
+            yield from pa.Table.from_pandas(page, preserve_index=False).to_batches()
+
+
+class FakeQueryJob:
+    def __init__(self, df: pd.DataFrame, total_bytes_processed: int):
+        self._df = df
+        self.total_bytes_processed = total_bytes_processed
+        self.total_bytes_billed = total_bytes_processed
+
+    def result(self, page_size: int = None) -> FakeRowIterator:
+        return FakeRowIterator(self._df, page_size)
+
+
+class FakeBigQueryClient:
+    """
+    Stand-in for bigquery.Client, answering every query with the same synthetic GKG result.
+    """
+
+    def __init__(self, *, n_rows: int, bytes_per_query: int = 2**20, latency: float = 0.0):
+        """
+        Constructor for the FakeBigQueryClient class.
+
+        Parameters:
+        - n_rows: Number of rows returned by every query.
+        - bytes_per_query: Bytes reported by dry runs (default is 1 MB, well under any data limit).
+        - latency: Seconds every query takes before returning (default is 0).
+        """
+        self.articles_df = synthetic_gkg_articles(n_rows)
+        self.bytes_per_query = bytes_per_query
+        self.latency = latency
+        self.queries = []
+
+    def query(self, query: str, job_config=None) -> FakeQueryJob:
+        self.queries.append(query)
+        if job_config is not None and job_config.dry_run:
+            return FakeQueryJob(self.articles_df.iloc[0:0], self.bytes_per_query)
+        time.sleep(self.latency)
+        return FakeQueryJob(self.articles_df, self.bytes_per_query)
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests_received += 1
+        time.sleep(self.server.latency)
+
+        if url.path == "/w/api.php":
+            self._send_json(self.server.mediawiki_response(params))
+        elif url.path == "/2/tweets/search/recent":
+            self._send_json(self.server.x_search_response(params), self.server.x_rate_limit_headers())
+        else:
+            self.send_error(404)
+
+    def _send_json(self, json_response: dict, headers: dict = None) -> None:
+        body = json.dumps(json_response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeAPIServer(ThreadingHTTPServer):
+    """
+    Local HTTP server answering MediaWiki (/w/api.php) and X (/2/tweets/search/recent) requests.
+
+    Use as a context manager. MediaWiki pages all have links_per_page links, categories and
+    external links, and an extract of extract_chars characters, of which a request only returns
+    one, continued with excontinue, as the real API does. X searches match x_total_tweets
+    tweets, paged with next_token, and every response carries x-rate-limit-* headers for a
+    window of x_rate_limit requests every x_window_seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.005,
+        links_per_page: int = 100,
+        extract_chars: int = 2000,
+        x_total_tweets: int = 100,
+        x_rate_limit: int = 100_000,
+        x_window_seconds: float = 1.0,
+    ):
+        super().__init__(("127.0.0.1", 0), FakeAPIHandler)
+        self.latency = latency
+        self.links_per_page = links_per_page
+        self.extract_chars = extract_chars
+        self.x_total_tweets = x_total_tweets
+        self.x_rate_limit = x_rate_limit
+        self.x_window_seconds = x_window_seconds
+        self.requests_received = 0
+        self._window_lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_requests = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def mediawiki_response(self, params: dict) -> dict:
+        if params.get("list") == "search":
+            n_results = int(params.get("srlimit", 10))
+            return {"query": {"search": [{"title": f"Page {i}"} for i in range(n_results)]}}
+
+        props = params.get("prop", "").split("|")
+        titles = params.get("titles", "").split("|")
+        # Like the API, whole-article extracts come one per request, the next one with excontinue
+        extract_index = int(params.get("excontinue", 0))
+        if "excontinue" in params:
+            props = ["extracts"]
+        pages = []
+        for index, title in enumerate(titles):
+            page = {"pageid": zlib.crc32(title.encode("utf-8")), "title": title, "lastrevid": 1}
+            if "info" in props:
+                page["fullurl"] = f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+            if "categories" in props:
+                page["categories"] = [{"ns": 14, "title": f"Category:Topic {i}"} for i in range(10)]
+            if "links" in props:
+                page["links"] = [{"ns": 0, "title": f"Page {i}"} for i in range(self.links_per_page)]
+            if "extlinks" in props:
+                page["extlinks"] = [{"url": f"//example.com/{i}"} for i in range(20)]
+            if "extracts" in props and index == extract_index:
+                page["extract"] = ("Lorem ipsum dolor sit amet. " * (self.extract_chars // 28 + 1))[:self.extract_chars]
+            pages.append(page)
+
+        json_response = {"query": {"pages": pages}}
+        if "extracts" in props and extract_index + 1 < len(titles):
+            json_response["continue"] = {"excontinue": extract_index + 1, "continue": "||"}
+        return json_response
+
+    def x_search_response(self, params: dict) -> dict:
+        offset = int(params.get("next_token", 0))
+        n_results = min(int(params.get("max_results", 10)), self.x_total_tweets - offset)
+        tweets = [
+            {
+                "id": str(10**18 - offset - i),
+                "author_id": str((offset + i) % 50),
+                "created_at": "2023-12-04T19:38:19.000Z",
+                "text": f"Tweet {offset + i} about the protests downtown #protest https://t.co/abc{i}",
+                "public_metrics": {
+                    "retweet_count": i, "reply_count": 0, "like_count": 2 * i,
+                    "quote_count": 0, "bookmark_count": 0, "impression_count": 10 * i,
+                },
+            }
+            for i in range(n_results)
+        ]
+        users = [
+            {
+                "id": author_id,
+                "username": f"user{author_id}",
+                "name": f"User {author_id}",
+                "description": "Writing about current events.",
+                "created_at": "2011-03-03T00:54:44.000Z",
+                "public_metrics": {
+                    "followers_count": 100, "following_count": 10, "tweet_count": 1000,
+                    "listed_count": 1, "like_count": 50,
+                },
+            }
+            for author_id in sorted({tweet["author_id"] for tweet in tweets})
+        ]
+        json_response = {"data": tweets, "includes": {"users": users}, "meta": {"result_count": n_results}}
+        if offset + n_results < self.x_total_tweets:
+            json_response["meta"]["next_token"] = str(offset + n_results)
+        return json_response
+
+    def x_rate_limit_headers(self) -> dict:
+        with self._window_lock:
+            now = time.time()
+            if now - self._window_start >= self.x_window_seconds:
+                self._window_start = now
+                self._window_requests = 0
+            self._window_requests += 1
+            return {
+                "x-rate-limit-limit": str(self.x_rate_limit),
+                "x-rate-limit-remaining": str(max(0, self.x_rate_limit - self._window_requests)),
+                "x-rate-limit-reset": str(self._window_start + self.x_window_seconds),
+            }
@@ -0,0 +1,237 @@
+"""
+Benchmarks of the sources against local stand-ins for BigQuery, MediaWiki and the X API.
+
+Every benchmark runs at several data sizes and reports its throughput, latency percentiles and
+peak Python memory, then compares them with benchmarks/baselines.json.
+
+Usage:
+    python -m benchmarks.run                      # run everything, fail on regressions
+    python -m benchmarks.run --quick              # smallest size of every benchmark
+    python -m benchmarks.run --only wikipedia     # benchmarks whose name contains 'wikipedia'
+    python -m benchmarks.run --update-baselines   # record the current results as the baselines
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import wikipedia
+
+from benchmarks.fakes import FakeAPIServer, FakeBigQueryClient
+from social_signals.common.sinks import PartitionedSink
+from social_signals.gdelt.entities import explode_gkg_entities
+from social_signals.gdelt.source import GDELTSource
+from social_signals.wikipedia.entity_index import EntityIndex
+from social_signals.wikipedia.source import WikipediaSource
+from social_signals.x.source import XSource
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# Metrics where higher is worse, compared with the baselines, and the smallest increase of each
+# that counts as a regression, so that noise on millisecond-scale benchmarks does not
+REGRESSION_METRICS = {"p50_s": 0.005, "peak_mb": 1.0}
+
+
+def gdelt_source(n_rows: int) -> GDELTSource:
+    with patch("google.oauth2.service_account.Credentials.from_service_account_file"), patch("google.cloud.bigquery.Client"):
+        source = GDELTSource(credentials_path="benchmark_credentials.json")
+    source.client = FakeBigQueryClient(n_rows=n_rows)
+    return source
+
+
+def bench_get_gkg_articles(n_rows: int):
+    source = gdelt_source(n_rows)
+
+    def run() -> int:
+        return len(source.get_gkg_articles(articles_date="20231101"))
+    return run
+
+
+def bench_iter_gkg_articles(n_rows: int):
+    source = gdelt_source(n_rows)
+
+    def run() -> int:
+        return sum(len(page) for page in source.iter_gkg_articles(articles_date="20231101", page_size=10000))
+    return run
+
+
+def bench_sink_gkg_articles(n_rows: int, format: str):
+    source = gdelt_source(n_rows)
+
+    def run() -> int:
+        with tempfile.TemporaryDirectory() as root:
+            with PartitionedSink(root=root, format=format) as sink:
+                for batch in source.iter_gkg_articles(articles_date="20231101", page_size=10000, as_arrow=True):
+                    sink.write("gdelt", batch, timestamp_column=GDELTSource.TIMESTAMP_COLUMN)
+            return sink.read("gdelt").num_rows
+    return run
+
+
+def bench_link_gkg_persons(n_articles: int):
+    rng = np.random.default_rng(0)
+    names = np.array([f"person {i}" for i in range(100_000)], dtype=object)
+    index = EntityIndex()
+    index.add_pages(pd.DataFrame({"pageid": np.arange(50_000), "title": [f"Person {i}" for i in range(50_000)]}))
+    articles_df = pd.DataFrame(
+        {
+            "gdelt_gkg_article_id": np.arange(n_articles).astype(str),
+            "persons": [";".join(row) for row in names[rng.integers(0, len(names), size=(n_articles, 4))].tolist()],
+        }
+    )
+    persons_df = explode_gkg_entities(articles_df, ["persons"])["persons"]
+
+    def run() -> int:
+        return len(index.link(persons_df, "person"))
+    return run
+
+
+def bench_get_related_wikipedia_pages_data(n_pages: int, server: FakeAPIServer):
+    api_url = f"{server.url}/w/api.php"
+
+    def run() -> int:
+        source = WikipediaSource(rate_limit=False, api_url=api_url, max_workers=4)
+        # The wikipedia library searches through its own module-level endpoint
+        with patch.object(wikipedia.wikipedia, "API_URL", api_url):
+            source.get_related_wikipedia_pages_data("protest", n_pages, batch_size=50)
+        return len(source.data)
+    return run
+
+
+def bench_x_search(n_results: int, server: FakeAPIServer):
+    source = XSource(x_bearer_token="benchmark")
+    source.SEARCH_URL = f"{server.url}/2/tweets/search/recent"
+
+    def run() -> int:
+        if n_results <= XSource.MAX_PAGE_SIZE:
+            return len(source.search("protest", "2023-12-04T00:00:00Z", n_results))
+        return sum(len(page) for page in source.iter_search("protest", "2023-12-04T00:00:00Z", n_results=n_results))
+    return run
+
+
+def benchmarks(server: FakeAPIServer, quick: bool) -> dict:
+    """
+    Build the benchmark functions, by name. Each returns the number of items it processed.
+    """
+    sizes = {
+        "gdelt.get_gkg_articles": [10_000, 100_000, 500_000],
+        "gdelt.iter_gkg_articles": [10_000, 100_000, 500_000],
+        "sink.parquet": [10_000, 100_000, 500_000],
+        "sink.arrow": [10_000, 100_000, 500_000],
+        "entity_index.link": [10_000, 100_000, 500_000],
+        "wikipedia.get_related_wikipedia_pages_data": [50, 200, 500],
+        "x.search": [100, 1_000, 10_000],
+    }
+    factories = {
+        "gdelt.get_gkg_articles": bench_get_gkg_articles,
+        "gdelt.iter_gkg_articles": bench_iter_gkg_articles,
+        "sink.parquet": lambda size: bench_sink_gkg_articles(size, "parquet"),
+        "sink.arrow": lambda size: bench_sink_gkg_articles(size, "arrow"),
+        "entity_index.link": bench_link_gkg_persons,
+        "wikipedia.get_related_wikipedia_pages_data": lambda size: bench_get_related_wikipedia_pages_data(size, server),
+        "x.search": lambda size: bench_x_search(size, server),
+    }
+    return {
+        f"{name}[{size}]": (factories[name], size)
+        for name, name_sizes in sizes.items()
+        for size in (name_sizes[:1] if quick else name_sizes)
+    }
+
+
+def measure(run, repeat: int) -> dict:
+    """
+    Time repeat calls of run, after a warm-up call, then trace the peak memory of one more call.
+    """
+    run()
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_items = run()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = float(np.percentile(latencies, 50))
+    return {
+        "items": n_items,
+        "throughput_per_s": n_items / p50 if p50 else float("inf"),
+        "p50_s": p50,
+        "p95_s": float(np.percentile(latencies, 95)),
+        "max_s": max(latencies),
+        "peak_mb": peak_bytes / 2**20,
+    }
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list[str]:
+    """
+    List the metrics that got worse than their baseline by more than tolerance, and by more than
+    the smallest increase REGRESSION_METRICS allows them.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        for metric, min_increase in REGRESSION_METRICS.items():
+            limit = max(baseline[metric] * (1 + tolerance), baseline[metric] + min_increase)
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name} {metric}: {result[metric]:.4f} vs baseline {baseline[metric]:.4f} (limit {limit:.4f})"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="Only run the benchmarks whose name contains this string.")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest size of every benchmark.")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed calls per benchmark (default is 10).")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latency of the local HTTP stand-in in seconds.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baselines (default is 0.25).")
+    parser.add_argument("--update-baselines", action="store_true", help="Write the results to baselines.json.")
+    args = parser.parse_args(argv)
+
+    # The dry run guard logs every estimate, which would drown the results
+    logging.getLogger().setLevel(logging.WARNING)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as file:
+            baselines = json.load(file)
+
+    results = {}
+    with FakeAPIServer(latency=args.latency, x_total_tweets=10_000) as server:
+        for name, (factory, size) in benchmarks(server, args.quick).items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = result = measure(factory(size), args.repeat)
+            print(
+                f"{name:<52} {result['throughput_per_s']:>12,.0f} items/s  p50 {result['p50_s'] * 1000:>9.1f} ms  "
+                f"p95 {result['p95_s'] * 1000:>9.1f} ms  peak {result['peak_mb']:>8.1f} MB"
+            )
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_PATH, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Updated {BASELINES_PATH}")
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class CheckpointStore:
+    """
+    Persistent SQLite store of the progress of long-running harvests, so that they can resume after a failure.
+
+    Each harvest is identified by a job name, and its progress is recorded either as a set of
+    completed units (Wikipedia pages, GDELT partitions) or as a cursor (the pagination state of
+    an X search). Sources only record progress once the matching records are durably written
+    to their sink, so a resumed harvest may fetch the last batch again, but never skips one.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str,
+    ):
+        """
+        Constructor for the CheckpointStore class.
+
+        Parameters:
+        - path: Path of the SQLite database file. Created if missing.
+        """
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                create table if not exists completed_units (
+                    job text not null,
+                    unit text not null,
+                    completed_at real not null,
+                    primary key (job, unit)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                create table if not exists cursors (
+                    job text primary key,
+                    cursor text not null,
+                    updated_at real not null
+                )
+                """
+            )
+
+    def completed(self, job: str) -> set:
+        """
+        Read the units a job has completed.
+
+        Returns:
+        The set of completed unit names, empty if the job never ran.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "select unit from completed_units where job = ?",
+                (job,),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_completed(self, job: str, units: list[str]) -> None:
+        """
+        Record units of a job as completed, in a single transaction.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "insert or ignore into completed_units values (?, ?, ?)",
+                [(job, str(unit), now) for unit in units],
+            )
+
+    def get_cursor(self, job: str):
+        """
+        Read the cursor of a job.
+
+        Returns:
+        The JSON value last stored with put_cursor, or None if there is none.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "select cursor from cursors where job = ?",
+                (job,),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_cursor(self, job: str, cursor) -> None:
+        """
+        Store the cursor of a job, a JSON serializable value, replacing the previous one.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "insert or replace into cursors values (?, ?, ?)",
+                (job, json.dumps(cursor), time.time()),
+            )
+
+    def reset(self, job: str) -> None:
+        """
+        Forget the progress of a job, so that its next run starts over.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("delete from completed_units where job = ?", (job,))
+            self._connection.execute("delete from cursors where job = ?", (job,))
+
+    def close(self) -> None:
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
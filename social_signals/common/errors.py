@@ -0,0 +1,9 @@
+class XAPIError(Exception):
+    """
+    Error response of the X API, raised once retries are exhausted or for non-retryable statuses.
+    """
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(status_code, text)
+        self.status_code = status_code
+        self.text = text
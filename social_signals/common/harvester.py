@@ -0,0 +1,185 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import pandas as pd
+
+from social_signals.common.instrumentation import Instrumentation, bind
+from social_signals.common.source import Source
+
+
+class HarvestBatch(NamedTuple):
+    """
+    A DataFrame of records fetched by a harvest, with the source and query it came from.
+    """
+
+    source: str
+    query_index: int
+    data: pd.DataFrame
+
+
+class Harvester:
+    """
+    Runs the queries of several sources concurrently.
+
+    Every query is fetched on a shared pool of threads, at most max_workers at once, and at
+    most concurrency[source] at once for each source. Batches are delivered as soon as they
+    are fetched, so that a harvest takes about as long as its slowest source rather than the
+    sum of all of them.
+    """
+
+    def __init__(
+        self,
+        *,
+        sources: dict,
+        max_workers: int = 8,
+        concurrency: dict = None,
+        instrumentation: Instrumentation = None,
+    ):
+        """
+        Constructor for the Harvester class.
+
+        Parameters:
+        - sources: The sources to harvest, by name. Each must implement the Source protocol.
+        - max_workers: Number of queries fetched concurrently over all sources (default is 8).
+        - concurrency: Maximum number of queries fetched concurrently per source name (default is max_workers for every source).
+        - instrumentation: Receives a harvest.fetch span per query, with the metrics recorded by its source (default is no hooks).
+        """
+        for name, source in sources.items():
+            if not isinstance(source, Source):
+                raise ValueError(f"Source {name} does not implement fetch(query) and TIMESTAMP_COLUMN")
+        concurrency = concurrency or {}
+        unknown_sources = set(concurrency) - set(sources)
+        if unknown_sources:
+            raise ValueError(f"Unknown sources {sorted(unknown_sources)}. Valid sources are {list(sources)}")
+        if max_workers < 1 or any(limit < 1 for limit in concurrency.values()):
+            raise ValueError("max_workers and concurrency limits must be at least 1")
+
+        self.sources = sources
+        self.instrumentation = instrumentation or Instrumentation()
+        self.max_workers = max_workers
+        self.concurrency = {name: concurrency.get(name, max_workers) for name in sources}
+
+    def iter_batches(self, tasks: list):
+        """
+        Fetch queries concurrently, yielding batches in the order they arrive.
+
+        Parameters:
+        - tasks: (source name, query) tuples. Queries of a source are started in the order of tasks.
+
+        Returns:
+        An iterator of HarvestBatch. The first error raised by a source stops the harvest and is raised again.
+        """
+        tasks = list(tasks)
+        unknown_sources = {name for name, _ in tasks} - set(self.sources)
+        if unknown_sources:
+            raise ValueError(f"Unknown sources {sorted(unknown_sources)}. Valid sources are {list(self.sources)}")
+
+        results = queue.Queue(maxsize=2 * self.max_workers)
+        stop = threading.Event()
+        task_done = object()
+        lock = threading.Lock()
+        pending = {name: deque() for name in self.sources}
+        running = dict.fromkeys(self.sources, 0)
+        for query_index, (name, query) in enumerate(tasks):
+            pending[name].append((query_index, query))
+
+        def put(item) -> bool:
+            # Give up once the harvest is stopped, rather than blocking on a full queue forever
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run(name: str, query_index: int, query: dict) -> None:
+            try:
+                with self.instrumentation.span("harvest.fetch", source=name, query_index=query_index):
+                    for data in self.sources[name].fetch(query):
+                        if not put(HarvestBatch(name, query_index, data)):
+                            return
+            except Exception as error:
+                put(error)
+            finally:
+                with lock:
+                    running[name] -= 1
+                    submit_ready(name)
+                put(task_done)
+
+        def submit_ready(name: str) -> None:
+            # Called with the lock held
+            while not stop.is_set() and pending[name] and running[name] < self.concurrency[name]:
+                running[name] += 1
+                executor.submit(bind(run), name, *pending[name].popleft())
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            with lock:
+                for name in self.sources:
+                    submit_ready(name)
+
+            n_done = 0
+            while n_done < len(tasks):
+                item = results.get()
+                if item is task_done:
+                    n_done += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            with lock:
+                stop.set()
+            executor.shutdown(wait=True)
+
+    def harvest_to(self, sink, tasks: list) -> dict:
+        """
+        Fetch queries concurrently and stream their records to a sink as they arrive, without combining them in memory.
+
+        Parameters:
+        - sink: A PartitionedSink, partitioning the records of each source by the date of its TIMESTAMP_COLUMN.
+        - tasks: (source name, query) tuples.
+
+        Returns:
+        The number of records written, by source name. The sink is left open, for further harvests.
+        """
+        n_records = dict.fromkeys(self.sources, 0)
+        for batch in self.iter_batches(tasks):
+            n_records[batch.source] += sink.write(
+                batch.source, batch.data, timestamp_column=self.sources[batch.source].TIMESTAMP_COLUMN
+            )
+        return n_records
+
+    def harvest(self, tasks: list) -> pd.DataFrame:
+        """
+        Fetch queries concurrently and combine their records into a single timestamp-ordered DataFrame.
+
+        Every batch is held in memory until the last query completes, then concatenated and sorted,
+        so peak memory grows with the whole harvest. Sources do not return their records in timestamp
+        order, so they cannot be merged as they arrive. For large runs, use harvest_to instead.
+
+        Parameters:
+        - tasks: (source name, query) tuples.
+
+        Returns:
+        A DataFrame with the columns of every source, plus source, query_index and timestamp columns.
+        Records are sorted by timestamp, in UTC, and records without one come last, in arrival order.
+        """
+        frames = []
+        for batch in self.iter_batches(tasks):
+            timestamp_column = self.sources[batch.source].TIMESTAMP_COLUMN
+            if timestamp_column is not None and timestamp_column in batch.data.columns:
+                timestamps = pd.to_datetime(batch.data[timestamp_column], utc=True)
+            else:
+                timestamps = pd.Series(pd.NaT, index=batch.data.index, dtype="datetime64[ns, UTC]")
+            frames.append(batch.data.assign(source=batch.source, query_index=batch.query_index, timestamp=timestamps))
+
+        if not frames:
+            return pd.DataFrame(columns=["source", "query_index", "timestamp"])
+        df = pd.concat(frames, ignore_index=True)
+        # A stable sort keeps the records of each batch in their original order on ties
+        return df.sort_values("timestamp", kind="mergesort", na_position="last", ignore_index=True)
@@ -0,0 +1,271 @@
+"""
+Spans and metrics reported by the sources.
+
+Every public call of a source runs in a Span, which collects metrics recorded anywhere below
+it, including in worker threads, and is handed to the hooks of the source's Instrumentation
+once it ends. Metrics recorded by the sources:
+
+- http_requests, http_bytes_received: requests sent to MediaWiki or the X API, and the size of their responses
+- http_retries, retry_backoff_s: X API requests retried after a 429 or 5xx response, and the seconds spent backing off
+- bigquery_bytes_estimated, bigquery_bytes_processed, bigquery_bytes_billed: bytes of dry runs and real queries
+- cache_hits, cache_misses: lookups of the GDELT query cache and of the Wikipedia page and search cache
+- rate_limit_wait_s: seconds spent waiting for a rate limiter
+- rows: rows returned
+"""
+
+import contextvars
+import functools
+import logging
+import numbers
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pandas as pd
+
+_current_span = contextvars.ContextVar("social_signals_span", default=None)
+
+
+class Span:
+    """
+    A timed call, with attributes describing it and metrics summed over everything it did.
+    """
+
+    def __init__(self, name: str, attributes: dict = None, parent: "Span" = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.metrics = {}
+        self.parent = parent
+        self.start_time = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, metric: str, value: float = 1) -> None:
+        """
+        Add value to a metric of the span. Unknown (None or non numeric) values are ignored.
+        """
+        if not isinstance(value, numbers.Number) or isinstance(value, bool):
+            return
+        with self._lock:
+            self.metrics[metric] = self.metrics.get(metric, 0) + value
+
+    def set(self, key: str, value) -> None:
+        """
+        Set an attribute of the span.
+        """
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        # Roll the metrics up, so that every span reports the totals of its children
+        if self.parent is not None:
+            for metric, value in self.metrics.items():
+                self.parent.add(metric, value)
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, duration={self.duration}, attributes={self.attributes}, metrics={self.metrics})"
+
+
+def current_span():
+    """
+    The innermost span of the current thread or task, or None.
+    """
+    return _current_span.get()
+
+
+def record(metric: str, value: float = 1) -> None:
+    """
+    Add value to a metric of the current span, if any. Costs a context variable lookup otherwise.
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.add(metric, value)
+
+
+@contextmanager
+def _activated(span: Span):
+    """
+    Make span the current span for the duration of a block.
+    """
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def bind(function):
+    """
+    Wrap a function so that it records into the current span when run by another thread.
+
+    ThreadPoolExecutor workers do not inherit context variables, so functions mapped over a pool
+    are bound to the span of the thread submitting them.
+    """
+    span = _current_span.get()
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        token = _current_span.set(span)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return bound
+
+
+class Instrumentation:
+    """
+    Hook surface shared by the sources: every finished span is passed to each hook.
+
+    A hook is any callable taking a Span, such as LoggingHook, OpenTelemetryHook or a function
+    sending metrics to a monitoring system. Without hooks, spans are still timed but go nowhere.
+    """
+
+    def __init__(
+        self,
+        *,
+        hooks: list = None,
+    ):
+        """
+        Constructor for the Instrumentation class.
+
+        Parameters:
+        - hooks: Callables receiving every finished Span (default is no hooks).
+        """
+        self.hooks = list(hooks or [])
+
+    def add_hook(self, hook) -> None:
+        self.hooks.append(hook)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Run a block in a new span, child of the current one.
+
+        Parameters:
+        - name: Name of the span, such as 'gdelt.get_gkg_articles'.
+        - attributes: Attributes describing the call.
+
+        Returns:
+        A context manager yielding the Span.
+        """
+        span = Span(name, attributes, parent=_current_span.get())
+        try:
+            with _activated(span):
+                yield span
+        except Exception as error:
+            span.set("error", repr(error))
+            raise
+        finally:
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        span.end()
+        for hook in self.hooks:
+            hook(span)
+
+
+def _count_rows(result):
+    # Results are DataFrames or Arrow record batches, or (key, DataFrame) tuples of partition iterators
+    if isinstance(result, tuple) and result:
+        result = result[-1]
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    return getattr(result, "num_rows", None)
+
+
+def _iterate_in_span(instrumentation: Instrumentation, span: Span, iterator: Iterator):
+    """
+    Consume an iterator in its span, which ends once the iterator is exhausted, fails or is closed.
+    """
+    try:
+        while True:
+            with _activated(span):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            span.add("rows", _count_rows(item))
+            yield item
+    except Exception as error:
+        span.set("error", repr(error))
+        raise
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        instrumentation._finish(span)
+
+
+def traced(name: str):
+    """
+    Decorate a source method so that every call runs in a span of the source's instrumentation.
+
+    The span counts the rows of the results. Iterators do their work as they are consumed, so
+    the span of a call returning one stays open, and current while the iterator advances, until
+    the iterator is exhausted or closed.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            span = Span(name, parent=_current_span.get())
+            try:
+                with _activated(span):
+                    result = method(self, *args, **kwargs)
+            except Exception as error:
+                span.set("error", repr(error))
+                instrumentation._finish(span)
+                raise
+
+            if isinstance(result, Iterator):
+                return _iterate_in_span(instrumentation, span, result)
+            span.add("rows", _count_rows(result))
+            instrumentation._finish(span)
+            return result
+        return wrapper
+    return decorator
+
+
+class LoggingHook:
+    """
+    Hook logging a one-line summary of every span.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("social_signals")
+        self.level = level
+
+    def __call__(self, span: Span) -> None:
+        metrics = " ".join(f"{metric}={value:g}" for metric, value in sorted(span.metrics.items()))
+        self.logger.log(self.level, f"{span.name} took {span.duration:.3f}s {metrics}".rstrip())
+
+
+class OpenTelemetryHook:
+    """
+    Hook exporting every span to an OpenTelemetry tracer, with its attributes and metrics as span attributes.
+
+    Spans are exported once they end, so nesting is conveyed by a parent_span attribute rather
+    than by the OpenTelemetry context.
+    """
+
+    def __init__(self, tracer):
+        """
+        Parameters:
+        - tracer: An opentelemetry.trace.Tracer, e.g. opentelemetry.trace.get_tracer('social_signals').
+        """
+        self.tracer = tracer
+
+    def __call__(self, span: Span) -> None:
+        attributes = {
+            **{key: value for key, value in span.attributes.items() if isinstance(value, (str, bool, int, float))},
+            **{f"social_signals.{metric}": value for metric, value in span.metrics.items()},
+        }
+        if span.parent is not None:
+            attributes["parent_span"] = span.parent.name
+
+        start_ns = int(span.start_time * 1e9)
+        otel_span = self.tracer.start_span(span.name, start_time=start_ns, attributes=attributes)
+        otel_span.end(end_time=start_ns + int(span.duration * 1e9))
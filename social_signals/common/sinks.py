@@ -0,0 +1,246 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from social_signals.utils.helpers import format_partition_date, parse_partition_date
+
+EPOCH = date(1970, 1, 1)
+
+
+class PartitionedSink:
+    """
+    Streams the records of several sources to Parquet or Arrow IPC files, partitioned by source and date.
+
+    Files are laid out as root/source=<name>/date=<YYYY-MM-DD>/part-<n>.<format>. Every batch
+    written to a partition is appended to its open file, as a row group or record batch, so
+    records reach the disk as they arrive rather than after the whole harvest. Files are only
+    visible to readers once the sink is closed (or the partition's schema changes), and read
+    back with memory mapping: Arrow IPC files are uncompressed, so reading them maps the
+    columns without copying them.
+    """
+
+    FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+    # Suffix of the files still being written
+    TMP_SUFFIX = ".tmp"
+
+    def __init__(
+        self,
+        *,
+        root: str,
+        format: str = "parquet",
+        compression: str = "snappy",
+    ):
+        """
+        Constructor for the PartitionedSink class.
+
+        Parameters:
+        - root: Directory of the partitions. Created if missing.
+        - format: 'parquet' or 'arrow' (Arrow IPC files, for zero-copy reloads) (default is 'parquet').
+        - compression: Compression codec of Parquet files (default is 'snappy'). Arrow IPC files are never compressed.
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown format {format}. Valid formats are {list(self.FORMATS)}")
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.suffix = self.FORMATS[format]
+        self.compression = compression
+        # Open writer, temporary path and schema of each (source, date) partition
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, source: str, data, timestamp_column: str = None) -> int:
+        """
+        Append records to the partitions of a source, one partition per UTC date of their timestamps.
+
+        Parameters:
+        - source: Name of the source, the first level of partitioning.
+        - data: A pandas DataFrame, pyarrow Table or pyarrow RecordBatch. Arrow data is written without conversion.
+        - timestamp_column: Column whose UTC date partitions the records. Records without one, or
+          without a timestamp, such as Wikipedia pages, go to the partition of the current date (default is None).
+
+        Returns:
+        The number of records written.
+        """
+        if isinstance(data, pd.DataFrame):
+            table = pa.Table.from_pandas(data, preserve_index=False)
+        elif isinstance(data, pa.RecordBatch):
+            table = pa.Table.from_batches([data])
+        else:
+            table = data
+        if table.num_rows == 0:
+            return 0
+
+        # A column missing from every record of a batch has no type of its own: typing it as null
+        # rather than, say, the float of a NaN lets it merge with the batches where it has values
+        for index, field in enumerate(table.schema):
+            if table.column(index).null_count == table.num_rows and not pa.types.is_null(field.type):
+                table = table.set_column(index, pa.field(field.name, pa.null()), pa.nulls(table.num_rows))
+
+        for date, partition in self._split_by_date(table, timestamp_column):
+            self._write_partition(source, date, partition)
+        return table.num_rows
+
+    def flush(self) -> None:
+        """
+        Finish every open file, sync it to disk and make it visible to readers.
+
+        Everything written so far is then durable, and later writes go to new files, so that
+        checkpointed harvests can flush after every batch.
+        """
+        with self._lock:
+            for key in list(self._writers):
+                self._close_partition(key)
+
+    def close(self) -> None:
+        """
+        Finish every open file and make it visible to readers.
+        """
+        self.flush()
+
+    def sources(self) -> list[str]:
+        """
+        Names of the sources with at least one partition.
+        """
+        return sorted(path.name.split("=", 1)[1] for path in self.root.glob("source=*") if path.is_dir())
+
+    def dates(self, source: str) -> list[str]:
+        """
+        Dates of the partitions of a source, as '%Y%m%d' strings.
+        """
+        return sorted(
+            format_partition_date(path.name.split("=", 1)[1])
+            for path in (self.root / f"source={source}").glob("date=*")
+            if path.is_dir()
+        )
+
+    def read(self, source: str, start_date=None, end_date=None, columns: list[str] = None) -> pa.Table:
+        """
+        Read the records of a source back, memory mapping its files.
+
+        Parameters:
+        - source: Name of the source.
+        - start_date: The first partition date to read, as a datetime, date or '%Y%m%d' string (default is the first one).
+        - end_date: The last partition date to read (inclusive), in the same formats (default is the last one).
+        - columns: The columns to read (default is all of them). Files without some of them have them as nulls.
+
+        Returns:
+        A pyarrow Table of the records, in partition then write order. Call to_pandas() on it for a DataFrame.
+        """
+        tables = [self._read_file(path, columns) for path in self._files(source, start_date, end_date)]
+        if not tables:
+            return pa.table({column: pa.array([], type=pa.null()) for column in columns or []})
+        # Batches of a source may differ slightly, e.g. a column that was all null in one of them
+        table = pa.concat_tables(tables, promote_options="permissive")
+        if columns is not None:
+            table = table.select(columns)
+        return table
+
+    def _split_by_date(self, table: pa.Table, timestamp_column: str):
+        today = (datetime.now(timezone.utc).date() - EPOCH).days
+        if timestamp_column is None or timestamp_column not in table.column_names:
+            return [(self._day_to_date(today), table)]
+
+        days = self._days_since_epoch(table.column(timestamp_column), default=today)
+        first_day = days[0]
+        if (days == first_day).all():
+            # The usual case: the whole batch is written as is
+            return [(self._day_to_date(first_day), table)]
+        return [(self._day_to_date(day), table.filter(pa.array(days == day))) for day in np.unique(days)]
+
+    @staticmethod
+    def _days_since_epoch(column: pa.ChunkedArray, default: int) -> np.ndarray:
+        """
+        UTC days since the epoch of a timestamp column, with default for missing timestamps.
+        """
+        if pa.types.is_timestamp(column.type):
+            # Timestamps are stored as UTC integers, so the day is an integer division away
+            values = pc.fill_null(column.cast(pa.int64()), np.iinfo(np.int64).min).to_numpy()
+            valid = values != np.iinfo(np.int64).min
+            ticks_per_day = 86400 * {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}[column.type.unit]
+        else:
+            timestamps = pd.to_datetime(column.to_pandas(), utc=True)
+            values = timestamps.dt.tz_convert(None).to_numpy().view(np.int64)
+            valid = ~timestamps.isna().to_numpy()
+            ticks_per_day = 86400 * 10**9
+        return np.where(valid, values // ticks_per_day, default)
+
+    @staticmethod
+    def _day_to_date(day: int) -> str:
+        return (EPOCH + timedelta(days=int(day))).strftime("%Y%m%d")
+
+    def _write_partition(self, source: str, date: str, table: pa.Table) -> None:
+        key = (source, date)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is not None and not writer[2].equals(table.schema):
+                # A file has a single schema, so a new one starts when it changes
+                self._close_partition(key)
+                writer = None
+            if writer is None:
+                writer = self._open_partition(key, table.schema)
+            writer[0].write_table(table)
+
+    def _open_partition(self, key: tuple, schema: pa.Schema) -> tuple:
+        source, date = key
+        directory = self.root / f"source={source}" / f"date={parse_partition_date(date).isoformat()}"
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Nanosecond timestamps keep the files of successive runs in write order
+        path = directory / f"part-{time.time_ns()}{self.suffix}{self.TMP_SUFFIX}"
+        if self.format == "parquet":
+            writer = pq.ParquetWriter(path, schema, compression=self.compression)
+        else:
+            writer = ipc.new_file(str(path), schema)
+        self._writers[key] = (writer, path, schema)
+        return self._writers[key]
+
+    def _close_partition(self, key: tuple) -> None:
+        # Called with the lock held
+        writer, path, _ = self._writers.pop(key)
+        writer.close()
+        with open(path, "rb") as file:
+            os.fsync(file.fileno())
+        # Rename the finished file, so readers never see a partial one
+        os.replace(path, path.with_suffix(""))
+
+    def _files(self, source: str, start_date, end_date) -> list[Path]:
+        start = parse_partition_date(start_date) if start_date is not None else None
+        end = parse_partition_date(end_date) if end_date is not None else None
+
+        files = []
+        for date in self.dates(source):
+            partition_date = parse_partition_date(date)
+            if (start is not None and partition_date < start) or (end is not None and partition_date > end):
+                continue
+            directory = self.root / f"source={source}" / f"date={partition_date.isoformat()}"
+            files.extend(sorted(directory.glob(f"part-*{self.suffix}"), key=lambda path: int(path.stem.split("-")[1])))
+        return files
+
+    def _read_file(self, path: Path, columns: list[str] = None) -> pa.Table:
+        if self.format == "parquet":
+            schema = pq.read_schema(path)
+            file_columns = None if columns is None else [column for column in columns if column in schema.names]
+            return pq.read_table(path, columns=file_columns, memory_map=True)
+
+        # The table's buffers point into the mapped file, which stays mapped as long as they are alive
+        table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        if columns is not None:
+            table = table.select([column for column in columns if column in table.column_names])
+        return table
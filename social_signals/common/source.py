@@ -0,0 +1,25 @@
+from typing import Iterator, Optional, Protocol, runtime_checkable
+
+import pandas as pd
+
+
+@runtime_checkable
+class Source(Protocol):
+    """
+    Interface shared by GDELTSource, WikipediaSource and XSource, so that they can be harvested together.
+    """
+
+    # Column holding the timestamp of each record, or None if records have no timestamp
+    TIMESTAMP_COLUMN: Optional[str]
+
+    def fetch(self, query: dict) -> Iterator[pd.DataFrame]:
+        """
+        Fetch the records matching a query, as a stream of DataFrames.
+
+        Parameters:
+        - query: Keyword arguments of the source's own streaming method.
+
+        Returns:
+        An iterator of DataFrames of records.
+        """
+        ...
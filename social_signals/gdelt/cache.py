@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+class GKGQueryCache:
+    """
+    On-disk Parquet cache for GKG query results, with size-bounded LRU eviction.
+
+    Entries are keyed by the normalized query parameters. Only closed partitions should be
+    stored, since their content never changes; entries are therefore never invalidated,
+    only evicted (least recently used first) once the cache grows past max_bytes.
+    """
+
+    SUFFIX = ".parquet"
+
+    def __init__(
+        self,
+        *,
+        cache_dir: str,
+        max_bytes: int = 2**30,
+    ):
+        """
+        Constructor for the GKGQueryCache class.
+
+        Parameters:
+        - cache_dir: Directory where the cached Parquet files are stored. Created if missing.
+        - max_bytes: Maximum total size of the cached files in bytes (default is 1 GB).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(params: dict) -> str:
+        """
+        Build the cache key of a set of query parameters.
+
+        Parameters:
+        - params: The normalized query parameters. Values must be JSON serializable.
+
+        Returns:
+        A hex digest that identifies the parameters, independently of their order.
+        """
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, params: dict) -> Path:
+        return self.cache_dir / f"{self.key(params)}{self.SUFFIX}"
+
+    def __contains__(self, params: dict) -> bool:
+        return self._path(params).exists()
+
+    def get(self, params: dict):
+        """
+        Read the cached result for a set of query parameters.
+
+        Parameters:
+        - params: The normalized query parameters.
+
+        Returns:
+        The cached DataFrame, or None if the parameters are not cached.
+        """
+        path = self._path(params)
+        try:
+            articles_df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return articles_df
+
+    def iter_batches(self, params: dict, batch_size: int = 10000, as_arrow: bool = False):
+        """
+        Stream the cached result for a set of query parameters in bounded-size batches.
+
+        Parameters:
+        - params: The normalized query parameters.
+        - batch_size: The maximum number of rows per batch (default is 10000).
+        - as_arrow: Whether to yield pyarrow.RecordBatch objects instead of DataFrames (default is False).
+
+        Returns:
+        An iterator of batches. Raises FileNotFoundError if the parameters are not cached.
+        """
+        # Open the file eagerly, so that a later eviction cannot interrupt the stream
+        path = self._path(params)
+        parquet_file = pq.ParquetFile(path)
+
+        # Mark the entry as recently used
+        os.utime(path)
+
+        batches = parquet_file.iter_batches(batch_size=batch_size)
+        if as_arrow:
+            return batches
+        return (batch.to_pandas() for batch in batches)
+
+    def put(self, params: dict, articles_df: pd.DataFrame) -> None:
+        """
+        Store the result of a query, then evict least recently used entries if needed.
+
+        Parameters:
+        - params: The normalized query parameters.
+        - articles_df: The query result to store.
+        """
+        path = self._path(params)
+
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            articles_df.to_parquet(tmp_path, index=False)
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                # A result larger than the whole cache would evict everything else
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def size(self) -> int:
+        """
+        Total size of the cached files in bytes.
+        """
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def clear(self) -> None:
+        """
+        Remove every cached entry.
+        """
+        for entry in self._entries():
+            entry.unlink(missing_ok=True)
+
+    def _entries(self):
+        return list(self.cache_dir.glob(f"*{self.SUFFIX}"))
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total_bytes -= size
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+
+# Child table built from each semicolon-joined GKG column
+GKG_ENTITY_COLUMNS = {
+    "themes": "theme",
+    "locations": "location",
+    "persons": "person",
+    "organizations": "organization",
+}
+# Fields of a V1 location, separated by '#'
+GKG_LOCATION_FIELDS = [
+    "location_type",
+    "location_name",
+    "country_code",
+    "adm1_code",
+    "latitude",
+    "longitude",
+    "feature_id",
+]
+
+
+def explode_gkg_entities(articles_df: pd.DataFrame, entities: list[str] = None) -> dict:
+    """
+    Split the semicolon-joined entity columns of GKG articles into normalized child tables.
+
+    Splitting is vectorized. Repeated strings (article ids, themes, names, codes) are stored as
+    categoricals and location coordinates as float32, so the child tables take much less memory
+    than the joined strings.
+
+    Parameters:
+    - articles_df: GKG articles, as returned by GDELTSource.get_gkg_articles or GDELTFileSource.get_gkg_articles.
+    - entities: The entity columns to explode, among 'themes', 'locations', 'persons' and 'organizations'
+      (default is every one of them present in articles_df).
+
+    Returns:
+    A dict mapping each entity column to a DataFrame with one row per (article, entity):
+    - themes: gdelt_gkg_article_id, theme_offset, theme
+    - locations: gdelt_gkg_article_id, location_offset, location_type, location_name, country_code,
+      adm1_code, latitude, longitude, feature_id
+    - persons: gdelt_gkg_article_id, person_offset, person
+    - organizations: gdelt_gkg_article_id, organization_offset, organization
+    """
+    if entities is None:
+        entities = [column for column in GKG_ENTITY_COLUMNS if column in articles_df.columns]
+    validate_gkg_entities(entities)
+
+    return {entity: _explode_column(articles_df, entity) for entity in entities}
+
+
+def validate_gkg_entities(entities: list[str]) -> None:
+    """
+    Raise a ValueError if entities contains anything other than GKG entity columns.
+    """
+    unknown_entities = set(entities) - set(GKG_ENTITY_COLUMNS)
+    if unknown_entities:
+        raise ValueError(f"Unknown GKG entity columns {sorted(unknown_entities)}. Valid columns are {list(GKG_ENTITY_COLUMNS)}")
+
+
+def _explode_column(articles_df: pd.DataFrame, entity: str) -> pd.DataFrame:
+    value_column = GKG_ENTITY_COLUMNS[entity]
+    offset_column = f"{value_column}_offset"
+
+    split_values = articles_df[entity].astype(object).str.split(";").explode()
+    positions = pd.Series(np.arange(len(articles_df)), index=articles_df.index)
+    exploded = pd.DataFrame(
+        {
+            "row": positions.reindex(split_values.index).to_numpy(),
+            value_column: split_values.to_numpy(),
+        }
+    )
+    # The offset counts every token, so that it matches the position in the original string
+    exploded[offset_column] = exploded.groupby("row").cumcount().astype("int16")
+
+    # Drop null columns and the empty token left by trailing separators
+    exploded = exploded[exploded[value_column].notna() & (exploded[value_column] != "")]
+
+    article_ids = articles_df["gdelt_gkg_article_id"].to_numpy()[exploded["row"].to_numpy()]
+    entity_df = pd.DataFrame(
+        {
+            "gdelt_gkg_article_id": pd.Categorical(article_ids),
+            offset_column: exploded[offset_column].to_numpy(),
+        }
+    )
+
+    if entity == "locations":
+        fields = exploded[value_column].str.split("#", n=len(GKG_LOCATION_FIELDS) - 1, expand=True)
+        fields = fields.reindex(columns=range(len(GKG_LOCATION_FIELDS)))
+        fields.columns = GKG_LOCATION_FIELDS
+        for field in GKG_LOCATION_FIELDS:
+            if field == "location_type":
+                entity_df[field] = pd.to_numeric(fields[field], errors="coerce").astype("Int8").array
+            elif field in ("latitude", "longitude"):
+                entity_df[field] = pd.to_numeric(fields[field], errors="coerce").astype("float32").to_numpy()
+            else:
+                entity_df[field] = pd.Categorical(fields[field].to_numpy())
+    else:
+        entity_df[value_column] = pd.Categorical(exploded[value_column].to_numpy())
+
+    return entity_df
@@ -0,0 +1,333 @@
+import csv
+import glob
+import os
+import warnings
+from datetime import datetime
+from typing import Union
+from urllib.error import HTTPError
+
+import numpy as np
+import pandas as pd
+
+from social_signals.gdelt.source import GDELTSource
+from social_signals.utils.helpers import format_partition_date, parse_partition_date
+
+
+class GDELTFileSource:
+    """
+    Offline GKG engine over raw GKG 2.0 15-minute CSV files.
+
+    Applies the same source collection, primary location and top-10 theme filters as
+    GDELTSource.get_gkg_articles, with vectorized pandas string operations, and returns
+    the same schema. Files are read in chunks, so memory stays bounded by the chunk size
+    and the number of matching articles.
+    """
+
+    # Columns of a GKG 2.0 file, which has no header row
+    GKG_FILE_COLUMNS = [
+        "GKGRECORDID",
+        "DATE",
+        "SourceCollectionIdentifier",
+        "SourceCommonName",
+        "DocumentIdentifier",
+        "Counts",
+        "V2Counts",
+        "Themes",
+        "V2Themes",
+        "Locations",
+        "V2Locations",
+        "Persons",
+        "V2Persons",
+        "Organizations",
+        "V2Organizations",
+        "V2Tone",
+        "Dates",
+        "GCAM",
+        "SharingImage",
+        "RelatedImages",
+        "SocialImageEmbeds",
+        "SocialVideoEmbeds",
+        "Quotations",
+        "AllNames",
+        "Amounts",
+        "TranslationInfo",
+        "Extras",
+    ]
+    # File column read for each output column
+    GKG_SOURCE_COLUMNS = {
+        "gdelt_gkg_article_id": "GKGRECORDID",
+        "article_url": "DocumentIdentifier",
+        "source_collection_id": "SourceCollectionIdentifier",
+        "themes": "Themes",
+        "locations": "Locations",
+        "persons": "Persons",
+        "organizations": "Organizations",
+        "social_image_url": "SocialImageEmbeds",
+        "social_video_url": "SocialVideoEmbeds",
+        "creation_ts": "DATE",
+    }
+    # Columns lowercased, as in the BigQuery query
+    LOWERCASE_COLUMNS = ["themes", "locations", "persons", "organizations"]
+    # Rank of each location type when picking the primary location (lower is preferred)
+    LOCATION_TYPE_RANKS = {"3": 1, "4": 2, "2": 3, "5": 4, "1": 5}
+    # Number of leading themes a theme filter looks at
+    TOP_THEMES = 10
+    # Files published per day, one every 15 minutes
+    FILE_TIMES = [f"{hour:02d}{minute:02d}00" for hour in range(24) for minute in range(0, 60, 15)]
+
+    def __init__(
+        self,
+        *,
+        data_dir: str,
+        chunksize: int = 50000,
+    ):
+        """
+        Constructor for the GDELTFileSource class.
+
+        Parameters:
+        - data_dir: Local directory, or base URL of a mirror, holding files named '%Y%m%d%H%M%S.gkg.csv[.zip]'.
+        - chunksize: Number of rows read from a file at a time (default is 50000).
+        """
+        self.data_dir = data_dir
+        self.chunksize = chunksize
+
+    def list_files(self, articles_date) -> list[str]:
+        """
+        List the GKG files of a day, in time order.
+
+        Parameters:
+        - articles_date: The date of the files, as a datetime, a date or a '%Y%m%d' string.
+
+        Returns:
+        A list of local paths, or of URLs when data_dir is a URL.
+        """
+        articles_date = format_partition_date(articles_date)
+
+        if self.data_dir.startswith(("http://", "https://")):
+            base_url = self.data_dir.rstrip("/")
+            return [f"{base_url}/{articles_date}{file_time}.gkg.csv.zip" for file_time in self.FILE_TIMES]
+
+        paths = glob.glob(os.path.join(self.data_dir, f"{articles_date}*.gkg.csv")) + glob.glob(
+            os.path.join(self.data_dir, f"{articles_date}*.gkg.csv.zip")
+        )
+        return sorted(paths, key=os.path.basename)
+
+    def get_gkg_articles(
+        self,
+        articles_date: datetime = None,
+        primary_location_country: Union[str, list[str]] = 'united states',
+        theme: Union[str, list[str]] = 'protest',
+        pairs: list[tuple[str, str]] = None,
+        columns: list[str] = None,
+        files: list[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Retrieves GKG articles of a day from GKG 2.0 files.
+
+        Parameters:
+        - articles_date: The date of the articles to retrieve in the format '%Y%m%d'. Default is None (today's date at the time of the call).
+        - primary_location_country: The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme: The theme, or list of themes, to filter the articles. Default is 'protest'.
+        - pairs: Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - columns: The GDELTSource.GKG_COLUMNS to return. Default is None (all columns).
+        - files: The files to read, instead of the files of articles_date in data_dir. Default is None.
+
+        Returns:
+        A DataFrame with the same columns as GDELTSource.get_gkg_articles, ordered by article id.
+        """
+        chunks = list(
+            self.iter_gkg_articles(
+                articles_date=articles_date,
+                primary_location_country=primary_location_country,
+                theme=theme,
+                pairs=pairs,
+                columns=columns,
+                files=files,
+            )
+        )
+        if not chunks:
+            return self._empty_frame(primary_location_country, theme, pairs, columns)
+
+        articles_df = pd.concat(chunks, ignore_index=True)
+        if "gdelt_gkg_article_id" in articles_df.columns:
+            articles_df = articles_df.sort_values("gdelt_gkg_article_id", kind="stable", ignore_index=True)
+        return articles_df
+
+    def iter_gkg_articles(
+        self,
+        articles_date: datetime = None,
+        primary_location_country: Union[str, list[str]] = 'united states',
+        theme: Union[str, list[str]] = 'protest',
+        pairs: list[tuple[str, str]] = None,
+        columns: list[str] = None,
+        files: list[str] = None,
+    ):
+        """
+        Streams the GKG articles of a day from GKG 2.0 files, one filtered chunk at a time.
+
+        Takes the same parameters as get_gkg_articles. Chunks come in file order and are not
+        sorted across files.
+
+        Returns:
+        An iterator of DataFrames with the same columns as GDELTSource.get_gkg_articles.
+        """
+        if articles_date is None:
+            articles_date = datetime.today().strftime('%Y%m%d')
+
+        resolved_pairs = GDELTSource._resolve_pairs(primary_location_country, theme, pairs)
+        if resolved_pairs is None:
+            resolved_pairs = [(primary_location_country, theme)]
+            tag_pairs = False
+        else:
+            tag_pairs = True
+        output_columns = GDELTSource._resolve_columns(columns) or GDELTSource.GKG_COLUMNS
+
+        # Only read the file columns the output and the filters need
+        needed_columns = set(output_columns) | set(GDELTSource.GKG_FILTER_COLUMNS)
+        usecols = [
+            source_column
+            for column, source_column in self.GKG_SOURCE_COLUMNS.items()
+            if column in needed_columns
+        ]
+
+        partition_ts = pd.Timestamp(parse_partition_date(articles_date), tz="UTC")
+        for path in files if files is not None else self.list_files(articles_date):
+            for chunk in self._read_file(path, usecols):
+                articles_df = self.filter_articles(chunk, resolved_pairs, tag_pairs=tag_pairs)
+                if articles_df.empty:
+                    continue
+                articles_df["bq_partition_id"] = partition_ts
+                yield articles_df[output_columns + (["matched_pairs"] if tag_pairs else [])]
+
+    def _read_file(self, path: str, usecols: list[str]):
+        """
+        Reads a GKG file, zipped or not, in chunks of at most chunksize rows.
+        """
+        try:
+            reader = pd.read_csv(
+                path,
+                sep="\t",
+                header=None,
+                names=self.GKG_FILE_COLUMNS,
+                usecols=usecols,
+                dtype=str,
+                quoting=csv.QUOTE_NONE,
+                encoding="utf-8",
+                encoding_errors="replace",
+                on_bad_lines="warn",
+                chunksize=self.chunksize,
+            )
+            with reader:
+                yield from reader
+        except (FileNotFoundError, HTTPError) as error:
+            # Mirrors skip the odd 15-minute slot, so a missing file is not fatal
+            warnings.warn(f"Skipped missing GKG file {path}: {error}", category=UserWarning)
+
+    @classmethod
+    def filter_articles(cls, chunk: pd.DataFrame, pairs: list[tuple[str, str]], tag_pairs: bool = False) -> pd.DataFrame:
+        """
+        Applies the GKG filters to a chunk of raw file rows.
+
+        Parameters:
+        - chunk: Raw rows, with the GKG_FILE_COLUMNS names.
+        - pairs: The (country, theme) pairs to match. An article is kept if it matches any of them.
+        - tag_pairs: Whether to add a matched_pairs column listing the pairs each article matched (default is False).
+
+        Returns:
+        The matching articles, with the GDELTSource.GKG_COLUMNS names (except bq_partition_id).
+        """
+        rename = {source_column: column for column, source_column in cls.GKG_SOURCE_COLUMNS.items()}
+        articles_df = chunk.rename(columns=rename)
+
+        # Keep web articles only
+        source_collection_id = pd.to_numeric(articles_df["source_collection_id"], errors="coerce")
+        articles_df = articles_df[source_collection_id == 1].drop(columns="source_collection_id")
+        if articles_df.empty:
+            return articles_df.assign(primary_location=pd.Series(dtype=object))
+
+        for column in cls.LOWERCASE_COLUMNS:
+            if column in articles_df.columns:
+                articles_df[column] = articles_df[column].str.lower()
+
+        articles_df["primary_location"] = cls.primary_locations(articles_df["locations"])
+
+        # Evaluate each distinct country and theme once, then combine them per pair
+        countries = {country for country, _ in pairs}
+        themes = {pair_theme for _, pair_theme in pairs}
+        primary_location = articles_df["primary_location"]
+        country_masks = {
+            country: primary_location.str.contains(country, regex=False).fillna(False).to_numpy(dtype=bool)
+            for country in countries
+        }
+        theme_masks = cls.top_theme_masks(articles_df["themes"], themes)
+        pair_masks = np.column_stack(
+            [country_masks[country] & theme_masks[pair_theme] for country, pair_theme in pairs]
+        )
+
+        keep = pair_masks.any(axis=1)
+        articles_df = articles_df[keep].copy()
+        if tag_pairs:
+            pair_structs = [
+                {"primary_location_country": country, "theme": pair_theme} for country, pair_theme in pairs
+            ]
+            articles_df["matched_pairs"] = [
+                [pair_structs[index] for index in np.flatnonzero(row)] for row in pair_masks[keep]
+            ]
+
+        if "creation_ts" in articles_df.columns:
+            articles_df["creation_ts"] = pd.to_datetime(
+                articles_df["creation_ts"], format="%Y%m%d%H%M%S", errors="coerce", utc=True
+            )
+
+        return articles_df
+
+    @classmethod
+    def primary_locations(cls, locations: pd.Series) -> pd.Series:
+        """
+        Picks the primary location of each article, preferring the location types 3, 4, 2, 5 and 1 in that order.
+
+        Parameters:
+        - locations: Semicolon-separated location lists.
+
+        Returns:
+        The first location of the best ranked type for each article (null when locations is null).
+        """
+        split_locations = locations.str.split(";").explode()
+        ranks = split_locations.str[:1].map(cls.LOCATION_TYPE_RANKS).fillna(len(cls.LOCATION_TYPE_RANKS) + 1)
+
+        # A stable sort keeps the first location among the ones of the best rank
+        ranked = pd.DataFrame(
+            {"row": split_locations.index, "rank": ranks.to_numpy(), "location": split_locations.to_numpy()}
+        )
+        best = ranked.sort_values(["row", "rank"], kind="stable").drop_duplicates("row")
+        return pd.Series(best["location"].to_numpy(), index=best["row"].to_numpy()).reindex(locations.index)
+
+    @classmethod
+    def top_theme_masks(cls, themes: pd.Series, wanted_themes) -> dict:
+        """
+        Checks which articles have each wanted theme among their first TOP_THEMES themes.
+
+        Parameters:
+        - themes: Semicolon-separated theme lists.
+        - wanted_themes: The themes to look for.
+
+        Returns:
+        A dict mapping each wanted theme to a boolean NumPy array aligned with themes.
+        """
+        top_themes = themes.str.split(";").str[: cls.TOP_THEMES].explode()
+        positions = pd.Series(np.arange(len(themes)), index=themes.index)
+        rows = positions.reindex(top_themes.index).to_numpy()
+
+        masks = {}
+        for wanted_theme in wanted_themes:
+            mask = np.zeros(len(themes), dtype=bool)
+            mask[rows[(top_themes == wanted_theme).to_numpy()]] = True
+            masks[wanted_theme] = mask
+        return masks
+
+    @staticmethod
+    def _empty_frame(primary_location_country, theme, pairs, columns) -> pd.DataFrame:
+        output_columns = GDELTSource._resolve_columns(columns) or GDELTSource.GKG_COLUMNS
+        if GDELTSource._resolve_pairs(primary_location_country, theme, pairs) is not None:
+            output_columns = output_columns + ["matched_pairs"]
+        return pd.DataFrame(columns=output_columns)
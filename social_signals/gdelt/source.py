@@ -1,32 +1,128 @@
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import product
+from typing import Union
 from google.cloud import bigquery
 from google.oauth2 import service_account
 import logging
+import pandas as pd
 
-# Configure the logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from social_signals.common.checkpoint import CheckpointStore
+from social_signals.common.instrumentation import Instrumentation, bind, record, traced
+from social_signals.gdelt.cache import GKGQueryCache
+from social_signals.gdelt.entities import GKG_ENTITY_COLUMNS, explode_gkg_entities, validate_gkg_entities
+from social_signals.utils.helpers import format_partition_date, parse_partition_date, partition_dates
+
+logger = logging.getLogger(__name__)
 
 class GDELTSource:
+    GKG_COLUMNS = [
+        "gdelt_gkg_article_id",
+        "article_url",
+        "themes",
+        "locations",
+        "primary_location",
+        "persons",
+        "organizations",
+        "social_image_url",
+        "social_video_url",
+        "creation_ts",
+        "bq_partition_id",
+    ]
+    # Expressions reading each column from gkg_partitioned
+    GKG_SOURCE_COLUMNS = {
+        "gdelt_gkg_article_id": "GKGRECORDID as gdelt_gkg_article_id",
+        "article_url": "Documentidentifier as article_url",
+        "source_collection_id": "SourceCollectionIdentifier as source_collection_id",
+        "themes": "lower(Themes) as themes",
+        "locations": "lower(Locations) as locations",
+        "persons": "lower(Persons) as persons",
+        "organizations": "lower(Organizations) as organizations",
+        "social_image_url": "SocialImageEmbeds as social_image_url",
+        "social_video_url": "SocialVideoEmbeds as social_video_url",
+        "creation_ts": "parse_timestamp('%Y%m%d%H%M%S', cast(`DATE` as string)) as creation_ts",
+        "bq_partition_id": "_PARTITIONTIME as bq_partition_id",
+    }
+    # Column holding the timestamp of each article
+    TIMESTAMP_COLUMN = "creation_ts"
+    # Columns read whatever the projection, because the filters and the ordering need them
+    GKG_FILTER_COLUMNS = ["gdelt_gkg_article_id", "source_collection_id", "themes", "locations"]
+    # Dimensions articles can be counted by on the server
+    GKG_AGGREGATIONS = {
+        "date": {
+            "select": ["date(creation_ts) as creation_date"],
+            "columns": ["creation_date"],
+            "requires": ["creation_ts"],
+        },
+        "hour": {
+            "select": ["timestamp_trunc(creation_ts, hour) as creation_hour"],
+            "columns": ["creation_hour"],
+            "requires": ["creation_ts"],
+        },
+        "primary_location": {
+            "select": ["primary_location"],
+            "columns": ["primary_location"],
+            "requires": [],
+        },
+        "primary_location_country_code": {
+            "select": ["split(primary_location, '#')[safe_offset(2)] as primary_location_country_code"],
+            "columns": ["primary_location_country_code"],
+            "requires": [],
+        },
+        "theme": {
+            "select": ["theme"],
+            "columns": ["theme"],
+            "requires": [],
+            "join": "cross join unnest(split(themes, ';')) as theme",
+        },
+        "matched_pair": {
+            "select": [
+                "matched_pair.primary_location_country as matched_primary_location_country",
+                "matched_pair.theme as matched_theme",
+            ],
+            "columns": ["matched_primary_location_country", "matched_theme"],
+            "requires": [],
+            "join": "cross join unnest(matched_pairs) as matched_pair",
+        },
+    }
+
     # Function to initialize the BigQuery client
     def __init__(
-            self, 
+            self,
             *,
-            credentials_path: str
+            credentials_path: str,
+            cache: GKGQueryCache = None,
+            instrumentation: Instrumentation = None
     ):
+        """
+        Constructor for the GDELTSource class.
+
+        Parameters:
+        - credentials_path (str): Path to the service account key file used by the BigQuery client.
+        - cache (GKGQueryCache): Optional on-disk cache for the results of closed partitions. Default is None (no caching).
+        - instrumentation (Instrumentation): Receives a span per public call, with BigQuery bytes, cache hits and rows. Default is None (no hooks).
+        """
+        self.cache = cache
+        self.instrumentation = instrumentation or Instrumentation()
         credentials = service_account.Credentials.from_service_account_file(
             credentials_path,
         )
         self.client = bigquery.Client(credentials=credentials)
 
 
+    @traced("gdelt.get_gkg_articles")
     def get_gkg_articles(
             self,
-            database_name: str = 'gdelt-bq', 
-            dataset_name: str = 'gdeltv2', 
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
             articles_date: datetime = datetime.today().strftime('%Y%m%d'),
-            primary_location_country: str = 'united states',
-            theme: str = 'protest',
-            data_limit_gb: int = 1
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            columns: list[str] = None
         ):
         """
         Retrieves GKG articles from the GDELT database on BigQuery.
@@ -35,82 +131,717 @@ class GDELTSource:
         - database_name (str): The name of the BigQuery database to query. Default is 'gdelt-bq'.
         - dataset_name (str): The name of the dataset within the database to query. Default is 'gdeltv2'.
         - articles_date (datetime): The date of the articles to retrieve in the format '%Y%m%d'. Default is today's date.
-        - primary_location_country (str): The primary location country to filter the articles. Default is 'united states'.
-        - theme (str): The theme to filter the articles. Default is 'protest'.
+        - primary_location_country (str or list): The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme (str or list): The theme, or list of themes, to filter the articles. Default is 'protest'.
         - data_limit_gb (int): The maximum data limit in gigabytes that the query can process. Default is 1 GB.
+        - pairs (list): Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - columns (list): The GKG_COLUMNS to return. Only these, plus the columns the filters need, are read from BigQuery. Default is None (all columns).
+
+        When several countries or themes (or explicit pairs) are given, all of them are matched in
+        a single scan of the partition, and a matched_pairs column lists the (primary_location_country,
+        theme) pairs each article matched.
 
         Returns:
         - articles_df (pandas.DataFrame): A DataFrame containing the retrieved GKG articles.
         """
+        # Serve closed partitions from the cache without touching BigQuery
+        cache_params = self._cache_params(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            columns=columns,
+        )
+        if cache_params is not None:
+            articles_df = self.cache.get(cache_params)
+            if articles_df is not None:
+                record("cache_hits")
+                logger.info(f"Cache hit for GKG articles of {cache_params['articles_date']}.")
+                return articles_df
+            record("cache_misses")
+
+        # Define query
+        query, query_parameters = self._build_gkg_query(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            columns=columns,
+        )
+
+        # Check how much data the query will process
+        self._check_data_limit(query, query_parameters, data_limit_gb)
+
+        # If the data processed is under the limit, run the query for real
+        articles_df = self._run_query(query, query_parameters, cache_params)
+
+        return articles_df
+
+
+    @traced("gdelt.iter_gkg_articles")
+    def iter_gkg_articles(
+            self,
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
+            articles_date: datetime = None,
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            columns: list[str] = None,
+            page_size: int = 10000,
+            as_arrow: bool = False
+        ):
+        """
+        Streams GKG articles from the GDELT database on BigQuery in bounded-size pages.
+
+        Takes the same filters and dry run guard as get_gkg_articles, but never materializes the
+        whole result: only one page of at most page_size rows is held in memory at a time.
+        Cached partitions are streamed from their Parquet file. Streamed results are not written
+        to the cache.
+
+        Parameters:
+        - database_name (str): The name of the BigQuery database to query. Default is 'gdelt-bq'.
+        - dataset_name (str): The name of the dataset within the database to query. Default is 'gdeltv2'.
+        - articles_date (datetime): The date of the articles to retrieve in the format '%Y%m%d'. Default is None (today's date at the time of the call).
+        - primary_location_country (str or list): The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme (str or list): The theme, or list of themes, to filter the articles. Default is 'protest'.
+        - data_limit_gb (int): The maximum data limit in gigabytes that the query can process. Default is 1 GB.
+        - pairs (list): Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - columns (list): The GKG_COLUMNS to return. Only these, plus the columns the filters need, are read from BigQuery. Default is None (all columns).
+        - page_size (int): The maximum number of rows per page. Default is 10000.
+        - as_arrow (bool): Whether to yield pyarrow.RecordBatch pages instead of DataFrames. Default is False.
+
+        Returns:
+        - pages (iterator): An iterator of pandas.DataFrame (or pyarrow.RecordBatch) pages, in article id order.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        if articles_date is None:
+            articles_date = datetime.today().strftime('%Y%m%d')
+
+        cache_params = self._cache_params(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            columns=columns,
+        )
+        if cache_params is not None and cache_params in self.cache:
+            record("cache_hits")
+            return self.cache.iter_batches(cache_params, batch_size=page_size, as_arrow=as_arrow)
+        if cache_params is not None:
+            record("cache_misses")
+
+        query, query_parameters = self._build_gkg_query(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            columns=columns,
+        )
+
+        # Check the data limit eagerly, so that it raises before the first page is requested
+        self._check_data_limit(query, query_parameters, data_limit_gb)
+
+        job_config = self._query_job_config(query_parameters, dry_run=False)
+        query_job = self.client.query(query, job_config=job_config)
+
+        # Download the result page by page rather than in one go
+        rows = query_job.result(page_size=page_size)
+        self._record_query_bytes(query_job)
+        if as_arrow:
+            return rows.to_arrow_iterable()
+        return rows.to_dataframe_iterable()
+
+
+    def fetch(self, query: dict):
+        """
+        Fetches GKG articles as a stream of DataFrames, for harvesting alongside other sources.
+
+        Parameters:
+        - query (dict): Keyword arguments of iter_gkg_articles, except as_arrow.
+
+        Returns:
+        - pages (iterator): An iterator of pandas.DataFrame pages of GKG articles.
+        """
+        # The gdelt.iter_gkg_articles span counts the rows of the pages
+        yield from self.iter_gkg_articles(**query, as_arrow=False)
+
+
+    @traced("gdelt.get_gkg_article_counts")
+    def get_gkg_article_counts(
+            self,
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
+            articles_date: datetime = None,
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            group_by: Union[str, list[str]] = 'hour'
+        ):
+        """
+        Counts GKG articles per group, with the grouping and counting done on BigQuery.
+
+        Takes the same filters and dry run guard as get_gkg_articles, but only the aggregated
+        table is returned instead of every matching article.
+
+        Parameters:
+        - database_name (str): The name of the BigQuery database to query. Default is 'gdelt-bq'.
+        - dataset_name (str): The name of the dataset within the database to query. Default is 'gdeltv2'.
+        - articles_date (datetime): The date of the articles to count in the format '%Y%m%d'. Default is None (today's date at the time of the call).
+        - primary_location_country (str or list): The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme (str or list): The theme, or list of themes, to filter the articles. Default is 'protest'.
+        - data_limit_gb (int): The maximum data limit in gigabytes that the query can process. Default is 1 GB.
+        - pairs (list): Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - group_by (str or list): One or more of the GKG_AGGREGATIONS dimensions: 'date', 'hour', 'primary_location',
+          'primary_location_country_code', 'theme' (every theme of the matching articles) or 'matched_pair'
+          (only with several countries, themes or pairs). Default is 'hour'.
+
+        Returns:
+        - counts_df (pandas.DataFrame): A DataFrame with one column per dimension and an article_count column,
+          sorted by the dimensions.
+        """
+        if articles_date is None:
+            articles_date = datetime.today().strftime('%Y%m%d')
+
+        cache_params = self._cache_params(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            group_by=group_by,
+        )
+        if cache_params is not None:
+            counts_df = self.cache.get(cache_params)
+            if counts_df is not None:
+                record("cache_hits")
+                logger.info(f"Cache hit for GKG article counts of {cache_params['articles_date']}.")
+                return counts_df
+            record("cache_misses")
+
+        query, query_parameters = self._build_gkg_query(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            pairs=pairs,
+            group_by=group_by,
+        )
+
+        # The dry run guard applies to the aggregated query as well
+        self._check_data_limit(query, query_parameters, data_limit_gb)
+
+        counts_df = self._run_query(query, query_parameters, cache_params)
+
+        return counts_df
+
+
+    @traced("gdelt.get_gkg_entity_tables")
+    def get_gkg_entity_tables(
+            self,
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
+            articles_date: datetime = None,
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            entities: list[str] = None
+        ):
+        """
+        Retrieves the entities of GKG articles as normalized child tables.
+
+        Only the article ids and the requested entity columns are downloaded; they are then
+        split client side by explode_gkg_entities into compact, categorical tables.
+
+        Parameters:
+        - database_name (str): The name of the BigQuery database to query. Default is 'gdelt-bq'.
+        - dataset_name (str): The name of the dataset within the database to query. Default is 'gdeltv2'.
+        - articles_date (datetime): The date of the articles to retrieve in the format '%Y%m%d'. Default is None (today's date at the time of the call).
+        - primary_location_country (str or list): The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme (str or list): The theme, or list of themes, to filter the articles. Default is 'protest'.
+        - data_limit_gb (int): The maximum data limit in gigabytes that the query can process. Default is 1 GB.
+        - pairs (list): Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - entities (list): The entity columns to explode, among 'themes', 'locations', 'persons' and 'organizations'. Default is None (all of them).
+
+        Returns:
+        - entity_tables (dict): A dict mapping each entity column to its child DataFrame, keyed by gdelt_gkg_article_id.
+        """
+        if articles_date is None:
+            articles_date = datetime.today().strftime('%Y%m%d')
+
+        if entities is None:
+            entities = list(GKG_ENTITY_COLUMNS)
+        validate_gkg_entities(entities)
+
+        articles_df = self.get_gkg_articles(
+            database_name=database_name,
+            dataset_name=dataset_name,
+            articles_date=articles_date,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            data_limit_gb=data_limit_gb,
+            pairs=pairs,
+            columns=['gdelt_gkg_article_id', *entities],
+        )
+
+        return explode_gkg_entities(articles_df, entities)
+
+
+    @traced("gdelt.get_gkg_articles_range")
+    def get_gkg_articles_range(
+            self,
+            start_date: datetime,
+            end_date: datetime,
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            columns: list[str] = None,
+            max_workers: int = 4,
+            as_iterator: bool = False
+        ):
+        """
+        Retrieves GKG articles for every daily partition between two dates (inclusive).
+
+        One query is built per partition. All dry runs are submitted concurrently and the
+        data_limit_gb budget is checked against their total before any query runs for real.
+        The real queries then run on a bounded pool of max_workers threads.
+
+        Parameters:
+        - start_date (datetime): The first partition date, as a datetime, date or '%Y%m%d' string.
+        - end_date (datetime): The last partition date (inclusive), in the same formats as start_date.
+        - database_name (str): The name of the BigQuery database to query. Default is 'gdelt-bq'.
+        - dataset_name (str): The name of the dataset within the database to query. Default is 'gdeltv2'.
+        - primary_location_country (str or list): The primary location country, or list of countries, to filter the articles. Default is 'united states'.
+        - theme (str or list): The theme, or list of themes, to filter the articles. Default is 'protest'.
+        - data_limit_gb (int): The maximum data limit in gigabytes for the whole range. Default is 1 GB.
+        - pairs (list): Explicit (country, theme) pairs to match, instead of every combination of primary_location_country and theme. Default is None.
+        - columns (list): The GKG_COLUMNS to return. Only these, plus the columns the filters need, are read from BigQuery. Default is None (all columns).
+        - max_workers (int): The maximum number of BigQuery jobs in flight at once. Default is 4.
+        - as_iterator (bool): Whether to return an iterator of per-partition DataFrames instead of a single DataFrame. Default is False.
+
+        Returns:
+        - articles_df (pandas.DataFrame): A DataFrame containing the retrieved GKG articles, in partition order.
+          If as_iterator is True, an iterator of (partition_date, pandas.DataFrame) tuples in partition order instead.
+        """
+        results = self._iter_gkg_partitions(
+            partition_dates(start_date, end_date),
+            database_name=database_name,
+            dataset_name=dataset_name,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            data_limit_gb=data_limit_gb,
+            pairs=pairs,
+            columns=columns,
+            max_workers=max_workers,
+        )
+        if as_iterator:
+            return results
+
+        frames = [articles_df for _, articles_df in results]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+    @traced("gdelt.harvest_to")
+    def harvest_to(
+            self,
+            sink,
+            start_date: datetime,
+            end_date: datetime,
+            *,
+            checkpoint: CheckpointStore,
+            job: str,
+            source_name: str = 'gdelt',
+            database_name: str = 'gdelt-bq',
+            dataset_name: str = 'gdeltv2',
+            primary_location_country: Union[str, list[str]] = 'united states',
+            theme: Union[str, list[str]] = 'protest',
+            data_limit_gb: int = 1,
+            pairs: list[tuple[str, str]] = None,
+            columns: list[str] = None,
+            max_workers: int = 4
+        ):
+        """
+        Backfills GKG articles into a sink, checkpointing every partition so that an interrupted backfill resumes where it stopped.
+
+        Partitions are queried as by get_gkg_articles_range, but only the ones the job has not
+        completed yet, and the data_limit_gb budget applies to those only. Every partition is
+        flushed to the sink before it is marked as completed, so at most max_workers partitions
+        are held in memory.
+
+        Parameters:
+        - sink (PartitionedSink): The sink the articles are written to, partitioned by the date of TIMESTAMP_COLUMN.
+        - start_date (datetime): The first partition date, as a datetime, date or '%Y%m%d' string.
+        - end_date (datetime): The last partition date (inclusive), in the same formats as start_date.
+        - checkpoint (CheckpointStore): The store of the progress of the backfill.
+        - job (str): Name of the backfill in checkpoint. Reusing it resumes the backfill.
+        - source_name (str): Source name of the articles in the sink. Default is 'gdelt'.
+        - columns (list): The GKG_COLUMNS to write. TIMESTAMP_COLUMN is always read as well, since the sink partitions by it. Default is None (all columns).
+        - The other parameters are the filters of get_gkg_articles_range.
+
+        Returns:
+        - n_written (int): The number of articles written by this run.
+        """
+        if columns is not None and self.TIMESTAMP_COLUMN not in columns:
+            # Without it, the sink would put every backfilled article in today's partition
+            columns = [*columns, self.TIMESTAMP_COLUMN]
+
+        completed = checkpoint.completed(job)
+        dates = [articles_date for articles_date in partition_dates(start_date, end_date) if articles_date not in completed]
+
+        results = self._iter_gkg_partitions(
+            dates,
+            database_name=database_name,
+            dataset_name=dataset_name,
+            primary_location_country=primary_location_country,
+            theme=theme,
+            data_limit_gb=data_limit_gb,
+            pairs=pairs,
+            columns=columns,
+            max_workers=max_workers,
+        )
+        n_written = 0
+        for articles_date, articles_df in results:
+            n_written += sink.write(source_name, articles_df, timestamp_column=self.TIMESTAMP_COLUMN)
+            sink.flush()
+            checkpoint.mark_completed(job, [articles_date])
+        return n_written
+
+
+    def _iter_gkg_partitions(
+            self,
+            dates: list[str],
+            database_name: str,
+            dataset_name: str,
+            primary_location_country: Union[str, list[str]],
+            theme: Union[str, list[str]],
+            data_limit_gb: int,
+            pairs: list[tuple[str, str]],
+            columns: list[str],
+            max_workers: int
+        ):
+        """
+        Checks the budget of the queries of several partitions, then returns an iterator of their
+        (partition_date, DataFrame) results, run on a bounded pool of max_workers threads.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        # Convert gigabytes to bytes for the dry run limit comparison
+        data_limit_bytes = data_limit_gb * 2**30
+
+        # Define one query per partition, and find the partitions already in the cache
+        queries = []
+        queries_parameters = []
+        tasks = []
+        for articles_date in dates:
+            query, query_parameters = self._build_gkg_query(
+                database_name=database_name,
+                dataset_name=dataset_name,
+                articles_date=articles_date,
+                primary_location_country=primary_location_country,
+                theme=theme,
+                pairs=pairs,
+                columns=columns,
+            )
+            cache_params = self._cache_params(
+                database_name=database_name,
+                dataset_name=dataset_name,
+                articles_date=articles_date,
+                primary_location_country=primary_location_country,
+                theme=theme,
+                pairs=pairs,
+                columns=columns,
+            )
+            if cache_params is not None and cache_params in self.cache:
+                record("cache_hits")
+                tasks.append(partial(self._read_cached_query, query, query_parameters, cache_params))
+            else:
+                if cache_params is not None:
+                    record("cache_misses")
+                queries.append(query)
+                queries_parameters.append(query_parameters)
+                tasks.append(partial(self._run_query, query, query_parameters, cache_params))
+
+        # Dry run every uncached query concurrently and check the budget for the whole range
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            estimated_data_bytes = sum(executor.map(bind(self._estimate_query_bytes), queries, queries_parameters))
+        estimated_data_gb = estimated_data_bytes / 2**30
+
+        logger.info(
+            f"Estimated data usage for {len(queries)} of {len(dates)} partitions: {estimated_data_gb:.3f} GB."
+        )
+
+        if estimated_data_bytes > data_limit_bytes:
+            raise ValueError(f"Queries will process {estimated_data_gb:.3f} GB, which exceeds the limit of {data_limit_gb} GB")
+
+        return self._run_queries(dates, tasks, max_workers)
+
+
+    def _run_queries(self, dates, tasks, max_workers):
+        """
+        Runs per-partition tasks on a bounded thread pool and yields their results in submission order.
+
+        At most max_workers tasks are in flight at once, so results that have not been
+        consumed yet never pile up in memory.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = deque()
+        # Queries run in the pool, but their metrics belong to the span consuming the results
+        work = ((articles_date, bind(task)) for articles_date, task in zip(dates, tasks))
+        try:
+            for articles_date, task in work:
+                pending.append((articles_date, executor.submit(task)))
+                if len(pending) >= max_workers:
+                    break
+
+            while pending:
+                articles_date, future = pending.popleft()
+                articles_df = future.result()
+
+                # Keep the pool busy with the next partition before handing this one over
+                for next_date, next_task in work:
+                    pending.append((next_date, executor.submit(next_task)))
+                    break
+
+                yield articles_date, articles_df
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+    def _check_data_limit(self, query: str, query_parameters: list, data_limit_gb: int) -> None:
+        """
+        Dry runs a query and raises a ValueError if it would process more than data_limit_gb.
+        """
         # Convert gigabytes to bytes for the dry run limit comparison
         data_limit_bytes = data_limit_gb * 2**30  # 1 GB in bytes
 
-        # Define query
-        query = f"""
-            with s_articles as (
+        # Check how much data the query will process
+        estimated_data_bytes = self._estimate_query_bytes(query, query_parameters)
+        estimated_data_gb = estimated_data_bytes / 2**30
 
-                select
-                    GKGRECORDID as gdelt_gkg_article_id,
-                    Documentidentifier as article_url,
-                    SourceCollectionIdentifier as source_collection_id,
-                    lower(Themes) as themes,
-                    lower(Locations) as locations,
-                    lower(Persons) as persons,
-                    lower(Organizations) as organizations,
-                    SocialImageEmbeds as social_image_url,
-                    SocialVideoEmbeds as social_video_url,
-                    parse_timestamp('%Y%m%d%H%M%S', cast(`DATE` as string)) as creation_ts,
-                    _PARTITIONTIME as bq_partition_id
-                
-                from `{database_name}.{dataset_name}.gkg_partitioned`
+        # Log the estimated data usage
+        logger.info(f"Estimated data usage for query: {estimated_data_gb:.3f} GB.")
 
-                where _PARTITIONTIME = parse_timestamp('%Y%m%d%H%M%S', concat('{articles_date}', '000000'))
+        if estimated_data_bytes > data_limit_bytes:
+            raise ValueError(f"Query will process {estimated_data_gb:.3f} GB, which exceeds the limit of {data_limit_gb} GB")
 
-            ),
 
-            filter_source_collections as (
+    def _estimate_query_bytes(self, query: str, query_parameters: list) -> int:
+        """
+        Dry runs a query and returns the number of bytes it would process.
+        """
+        # Create a JobConfig object and set the dry_run flag to True
+        job_config = self._query_job_config(query_parameters, dry_run=True)
 
-                select * from s_articles
-                where source_collection_id = 1
+        # API request - starts the query, but doesn't run it because of the dry_run flag set to True
+        query_job = self.client.query(query, job_config=job_config)
+        record("bigquery_bytes_estimated", query_job.total_bytes_processed)
 
-            ),
+        return query_job.total_bytes_processed
 
-            primary_locations as (
 
-                select
-                    gdelt_gkg_article_id,
-                    article_url,
-                    themes,
-                    locations,
-                    (
-                        select split_location 
-                        from unnest(split(locations, ';')) as split_location
-                        order by 
-                            case substr(split_location, 1, 1)
-                            when '3' then 1
-                            when '4' then 2
-                            when '2' then 3
-                            when '5' then 4
-                            when '1' then 5
-                            else 6
-                            end 
-                        limit 1
-                    ) as primary_location,
-                    persons,
-                    organizations,
-                    social_image_url,
-                    social_video_url,
-                    creation_ts,
-                    bq_partition_id
+    def _run_query(self, query: str, query_parameters: list, cache_params: dict = None):
+        """
+        Runs a query for real and waits for its result as a DataFrame.
 
-                from filter_source_collections
+        The result is stored in the cache when cache_params is given.
+        """
+        job_config = self._query_job_config(query_parameters, dry_run=False)
+        query_job = self.client.query(query, job_config=job_config)
+
+        # Wait for the query to finish
+        articles_df = query_job.result().to_dataframe()
+        self._record_query_bytes(query_job)
+
+        if cache_params is not None:
+            self.cache.put(cache_params, articles_df)
+
+        return articles_df
+
+
+    @staticmethod
+    def _query_job_config(query_parameters: list, dry_run: bool):
+        """
+        Builds the job config of a dry run or real run of a query, with the query parameters of its filters.
+        """
+        return bigquery.QueryJobConfig(dry_run=dry_run, use_query_cache=False, query_parameters=query_parameters)
+
+
+    @staticmethod
+    def _record_query_bytes(query_job) -> None:
+        """
+        Records the bytes processed and billed by a finished query job in the current span.
+        """
+        record("bigquery_bytes_processed", query_job.total_bytes_processed)
+        record("bigquery_bytes_billed", query_job.total_bytes_billed)
+
+
+    def _read_cached_query(self, query: str, query_parameters: list, cache_params: dict):
+        """
+        Reads a query result from the cache, running the query if the entry was evicted meanwhile.
+        """
+        articles_df = self.cache.get(cache_params)
+        if articles_df is None:
+            articles_df = self._run_query(query, query_parameters, cache_params)
+        return articles_df
+
+
+    def _cache_params(self, **params):
+        """
+        Normalizes query parameters into a cache key, or returns None if the result must not be cached.
+
+        Only closed partitions are cached: a partition is considered closed once a full day
+        has passed since its date ended, so that late GKG updates are not missed.
+        """
+        if self.cache is None:
+            return None
+
+        try:
+            articles_date = parse_partition_date(params['articles_date'])
+        except (TypeError, ValueError):
+            return None
+
+        if articles_date >= (datetime.now(timezone.utc) - timedelta(days=1)).date():
+            return None
+
+        params['articles_date'] = articles_date.strftime('%Y%m%d')
+
+        # Several countries or themes are keyed by their resolved pairs only
+        pairs = self._resolve_pairs(params['primary_location_country'], params['theme'], params.pop('pairs', None))
+        if pairs is not None:
+            del params['primary_location_country'], params['theme']
+            params['pairs'] = [list(pair) for pair in pairs]
+
+        # A projection is part of the key, but the full projection keeps the original key
+        columns = self._resolve_columns(params.pop('columns', None))
+        if columns is not None:
+            params['columns'] = columns
+
+        group_by = self._resolve_group_by(params.pop('group_by', None), pairs)
+        if group_by is not None:
+            params['group_by'] = group_by
+
+        return params
+
+
+    @staticmethod
+    def _resolve_pairs(primary_location_country, theme, pairs):
+        """
+        Resolves the (country, theme) pairs to match, or None for a single country and theme.
+        """
+        if pairs is None:
+            if isinstance(primary_location_country, str) and isinstance(theme, str):
+                return None
+            countries = [primary_location_country] if isinstance(primary_location_country, str) else primary_location_country
+            themes = [theme] if isinstance(theme, str) else theme
+            pairs = product(countries, themes)
+
+        # Deduplicate while keeping a stable order, so that equal requests build equal queries
+        pairs = sorted({(str(country), str(pair_theme)) for country, pair_theme in pairs})
+        if not pairs:
+            raise ValueError("At least one (country, theme) pair is required")
+        return pairs
+
+
+    @classmethod
+    def _resolve_group_by(cls, group_by, pairs):
+        """
+        Validates aggregation dimensions and returns them as a list, or None to return rows.
+        """
+        if group_by is None:
+            return None
+
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        if not group_by:
+            raise ValueError("At least one dimension is required to group by")
+
+        unknown_dimensions = set(group_by) - set(cls.GKG_AGGREGATIONS)
+        if unknown_dimensions:
+            raise ValueError(f"Unknown dimensions {sorted(unknown_dimensions)}. Valid dimensions are {list(cls.GKG_AGGREGATIONS)}")
+        if "matched_pair" in group_by and pairs is None:
+            raise ValueError("Grouping by matched_pair requires several countries, themes or explicit pairs")
+
+        return group_by
+
+
+    @classmethod
+    def _resolve_columns(cls, columns):
+        """
+        Validates a column projection and returns it in GKG_COLUMNS order, or None for all columns.
+        """
+        if columns is None:
+            return None
+
+        unknown_columns = set(columns) - set(cls.GKG_COLUMNS)
+        if unknown_columns:
+            raise ValueError(f"Unknown GKG columns {sorted(unknown_columns)}. Valid columns are {cls.GKG_COLUMNS}")
+        if not columns:
+            raise ValueError("At least one GKG column is required")
+
+        columns = [column for column in cls.GKG_COLUMNS if column in columns]
+        return None if columns == cls.GKG_COLUMNS else columns
 
-            ),
 
+    def _build_gkg_query(
+            self,
+            *,
+            database_name: str,
+            dataset_name: str,
+            articles_date,
+            primary_location_country,
+            theme,
+            pairs=None,
+            columns=None,
+            group_by=None
+        ) -> tuple[str, list]:
+        """
+        Builds the SQL that filters a single gkg_partitioned partition, and its query parameters.
+
+        The query returns the filtered articles, or their counts per group when group_by is given.
+        Countries and themes are passed as query parameters rather than pasted into the SQL, so
+        that any value, quotes included, is matched as is.
+        """
+        articles_date = format_partition_date(articles_date)
+        pairs = self._resolve_pairs(primary_location_country, theme, pairs)
+
+        group_by = self._resolve_group_by(group_by, pairs)
+        if group_by is not None:
+            columns = [column for dimension in group_by for column in self.GKG_AGGREGATIONS[dimension]["requires"]]
+            columns.append("gdelt_gkg_article_id")
+
+        # Only read the requested columns, plus the ones the filters need
+        output_columns = self._resolve_columns(columns) or self.GKG_COLUMNS
+        source_columns = ",\n".join(
+            f"{' ' * 20}{expression}"
+            for column, expression in self.GKG_SOURCE_COLUMNS.items()
+            if column in output_columns or column in self.GKG_FILTER_COLUMNS
+        )
+
+        if pairs is None:
+            filters = f"""
             filter_locations as (
 
                 select * from primary_locations
-                where primary_location like '%{primary_location_country}%'
+                where primary_location like concat('%', @primary_location_country, '%')
 
             ),
 
@@ -118,42 +849,141 @@ class GDELTSource:
 
                 select * from filter_locations
                 where (
-                    select true 
+                    select true
                     from unnest(split(themes, ';')) theme with offset
                     where offset < 10
-                    and theme = '{theme}'
+                    and theme = @theme
                     limit 1
                 ) is not null
 
             )
+        """
+            filtered_articles = "filter_themes"
+            query_parameters = [
+                bigquery.ScalarQueryParameter("primary_location_country", "STRING", primary_location_country),
+                bigquery.ScalarQueryParameter("theme", "STRING", theme),
+            ]
+        else:
+            filters = f"""
+            top_themes as (
+
+                select
+                    *,
+                    array(
+                        select theme
+                        from unnest(split(themes, ';')) theme with offset
+                        where offset < 10
+                    ) as top_themes
+
+                from primary_locations
+
+            ),
+
+            filter_pairs as (
+
+                select
+                    * except (top_themes),
+                    array(
+                        select as struct tracked_pair.primary_location_country, tracked_pair.theme
+                        from unnest(@pairs) as tracked_pair
+                        where primary_location like concat('%', tracked_pair.primary_location_country, '%')
+                        and tracked_pair.theme in unnest(top_themes)
+                    ) as matched_pairs
+
+                from top_themes
+
+            ),
+
+            filter_matched_pairs as (
+
+                select * from filter_pairs
+                where array_length(matched_pairs) > 0
 
-            select *
-            from filter_themes
+            )
+        """
+            filtered_articles = "filter_matched_pairs"
+            output_columns = output_columns + ["matched_pairs"]
+            query_parameters = [
+                bigquery.ArrayQueryParameter("pairs", "STRUCT", [
+                    bigquery.StructQueryParameter(
+                        None,
+                        bigquery.ScalarQueryParameter("primary_location_country", "STRING", country),
+                        bigquery.ScalarQueryParameter("theme", "STRING", pair_theme),
+                    )
+                    for country, pair_theme in pairs
+                ])
+            ]
+
+        if group_by is None:
+            final_select = f"""
+            select {", ".join(output_columns)}
+            from {filtered_articles}
             order by gdelt_gkg_article_id
         """
+        else:
+            # Count articles per group on the server, instead of returning every row
+            dimensions = [self.GKG_AGGREGATIONS[dimension] for dimension in group_by]
+            group_columns = ", ".join(
+                alias for dimension in dimensions for alias in dimension["columns"]
+            )
+            group_expressions = ",\n".join(
+                f"{' ' * 16}{expression}" for dimension in dimensions for expression in dimension["select"]
+            )
+            joins = "".join(
+                f"\n{' ' * 12}{dimension['join']}" for dimension in dimensions if "join" in dimension
+            )
+            final_select = f"""
+            select
+{group_expressions},
+                count(distinct gdelt_gkg_article_id) as article_count
 
-        # Create a JobConfig object and set the dry_run flag to True
-        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+            from {filtered_articles}{joins}
 
-        # API request - starts the query, but doesn't run it because of the dry_run flag set to True
-        query_job = self.client.query(query, job_config=job_config)
+            group by {group_columns}
+            order by {group_columns}
+        """
 
-        # Check how much data the query will process
-        estimated_data_bytes = query_job.total_bytes_processed
-        estimated_data_gb = estimated_data_bytes / 2**30
+        query = f"""
+            with s_articles as (
 
-        # Log the estimated data usage
-        logging.info(f"Estimated data usage for query: {estimated_data_gb:.3f} GB.")
+                select
+{source_columns}
 
-        # Check how much data the query will process
-        if estimated_data_bytes > data_limit_bytes:
-            raise ValueError(f"Query will process {estimated_data_gb:.3f} GB, which exceeds the limit of {data_limit_gb} GB")
+                from `{database_name}.{dataset_name}.gkg_partitioned`
 
-        # If the data processed is under the limit, run the query for real
-        job_config.dry_run = False
-        query_job = self.client.query(query, job_config=job_config)
+                where _PARTITIONTIME = parse_timestamp('%Y%m%d%H%M%S', concat('{articles_date}', '000000'))
 
-        # Wait for the query to finish
-        articles_df = query_job.result().to_dataframe()
+            ),
+
+            filter_source_collections as (
+
+                select * from s_articles
+                where source_collection_id = 1
+
+            ),
+
+            primary_locations as (
+
+                select
+                    * except (source_collection_id),
+                    (
+                        select split_location
+                        from unnest(split(locations, ';')) as split_location
+                        order by
+                            case substr(split_location, 1, 1)
+                            when '3' then 1
+                            when '4' then 2
+                            when '2' then 3
+                            when '5' then 4
+                            when '1' then 5
+                            else 6
+                            end
+                        limit 1
+                    ) as primary_location
+
+                from filter_source_collections
+
+            ),
+{filters.rstrip(' ')}{final_select}"""
 
-        return articles_df
\ No newline at end of file
+        return query, query_parameters
@@ -0,0 +1,472 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "cmpid", "ocid"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Scheme, network location, host, port, path and query of an absolute URL, whose fragment is ignored
+URL_PATTERN = (
+    r"^(?P<scheme>[A-Za-z][A-Za-z0-9+.\-]*)://"
+    r"(?P<netloc>(?:[^/?#@]*@)?(?P<host>\[[^\]/?#]*\]|[^:/?#]*)(?::(?P<port>[^/?#]*))?)"
+    r"(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?"
+)
+
+
+def canonicalize_urls(urls: pd.Series) -> pd.Series:
+    """
+    Normalize URLs so that variants of the same address compare equal, with vectorized string operations.
+
+    The scheme and host are lowercased, 'www.', user info, default ports, fragments, trailing
+    slashes and tracking parameters (utm_*, fbclid, ...) are dropped, the other query parameters
+    are sorted, and http and https are treated as the same. Percent-encoding is kept as is.
+
+    Parameters:
+    - urls: The URLs to normalize.
+
+    Returns:
+    A Series of the canonical forms, with the index of urls. Values that are not absolute URLs are kept as they are.
+    """
+    index = urls.index
+    urls = urls.reset_index(drop=True)
+    parts = urls.str.strip().str.extract(URL_PATTERN)
+    matched = parts["netloc"].fillna("") != ""
+
+    scheme = parts["scheme"].str.lower()
+    host = parts["host"].str.lower().str.replace(r"^www\.", "", regex=True)
+    port = pd.to_numeric(parts["port"].where(parts["port"].str.fullmatch(r"\d+", na=False)), errors="coerce")
+    explicit_port = (port <= 65535) & (port != scheme.map(DEFAULT_PORTS))
+    host = host.mask(explicit_port, host + ":" + port.fillna(0).astype(np.int64).astype(str))
+
+    # Query parameters are exploded to one row each, filtered and sorted, then pivoted to one
+    # column per rank within their URL, so that they are joined back a column at a time
+    pairs = parts["query"][matched].str.split("&").explode()
+    pairs = pairs[pairs.notna() & (pairs != "")].str.extract(r"^(?P<key>[^=]*)=?(?P<value>.*)$")
+    pairs["url"] = pairs.index
+    lowered = pairs["key"].str.lower()
+    pairs = pairs[~lowered.str.startswith("utm_") & ~lowered.isin(TRACKING_PARAMS)]
+    pairs = pairs.sort_values(["url", "key", "value"])
+    pairs["pair"] = pairs["key"] + "=" + pairs["value"]
+    pairs["rank"] = pairs.groupby("url").cumcount()
+    ranked = pairs.pivot(index="url", columns="rank", values="pair").reindex(urls.index)
+    query = pd.Series("", index=urls.index, dtype=object)
+    for rank in ranked.columns:
+        separator = "&" if rank else ""
+        query = query + (separator + ranked[rank]).fillna("")
+
+    canonical = (
+        scheme.replace("https", "http") + "://" + host
+        + parts["path"].str.replace(r"/+$", "", regex=True)
+        + ("?" + query).where(query != "", "")
+    )
+    return canonical.where(matched, urls).set_axis(index)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so that variants of the same address compare equal (see canonicalize_urls).
+
+    Parameters:
+    - url: The URL to normalize.
+
+    Returns:
+    The canonical form of the URL, or url itself if it cannot be parsed.
+    """
+    return canonicalize_urls(pd.Series([url], dtype=object)).iloc[0]
+
+
+class URLDeduplicator:
+    """
+    Incremental exact deduplication of URLs, after canonicalization.
+
+    Batches are canonicalized with canonicalize_urls and compared by the 64-bit hashes of their
+    canonical forms, with pd.util.hash_array. The hashes seen so far are kept in NumPy arrays,
+    in insertion order and sorted for lookups, bounded to max_items by forgetting the oldest
+    ones first, so that it can follow a stream of batches indefinitely.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_items: int = 1_000_000,
+    ):
+        """
+        Constructor for the URLDeduplicator class.
+
+        Parameters:
+        - max_items: Maximum number of canonical URLs remembered (default is 1,000,000).
+        """
+        if max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        self.max_items = max_items
+        # Hashes of the canonical URLs remembered, oldest first, and the same hashes sorted
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._sorted_hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def duplicated(self, urls) -> np.ndarray:
+        """
+        Flag the URLs already seen, in this batch or a previous one, and remember the new ones.
+
+        Parameters:
+        - urls: The URLs of a batch.
+
+        Returns:
+        A bool array, True for every URL whose canonical form was already seen.
+        """
+        urls = pd.Series(urls, dtype=object)
+        present = urls.notna().to_numpy()
+        hashes = pd.util.hash_array(canonicalize_urls(urls[present]).to_numpy(dtype=object))
+
+        # Later copies of a URL of the batch, and URLs of earlier batches still remembered
+        duplicated = pd.Series(hashes).duplicated().to_numpy()
+        if len(self._sorted_hashes):
+            positions = np.searchsorted(self._sorted_hashes, hashes).clip(max=len(self._sorted_hashes) - 1)
+            duplicated |= self._sorted_hashes[positions] == hashes
+        self._remember(hashes[~duplicated])
+
+        flags = np.zeros(len(urls), dtype=bool)
+        flags[present] = duplicated
+        return flags
+
+    def _remember(self, hashes: np.ndarray) -> None:
+        # hashes are unique and new, so every one of them has a single place in the sorted array
+        hashes = hashes[len(hashes) - min(len(hashes), self.max_items):]
+        n_forgotten = max(0, len(self._hashes) + len(hashes) - self.max_items)
+        forgotten = self._hashes[:n_forgotten]
+        self._hashes = np.concatenate([self._hashes[n_forgotten:], hashes])
+
+        sorted_hashes = np.delete(self._sorted_hashes, np.searchsorted(self._sorted_hashes, forgotten))
+        hashes = np.sort(hashes)
+        self._sorted_hashes = np.insert(sorted_hashes, np.searchsorted(sorted_hashes, hashes), hashes)
+
+
+class MinHashDeduplicator:
+    """
+    Incremental near-duplicate detection of short texts with MinHash signatures and LSH banding.
+
+    Every text is reduced to num_perm minimum hashes of its character shingles, computed with
+    NumPy. The signatures are split into bands, and texts sharing any band are compared on
+    their whole signature, whose fraction of equal values estimates their Jaccard similarity.
+    Signatures of the texts kept are stored in a NumPy ring buffer of at most max_items rows,
+    the oldest being overwritten first. The LSH index holds, for every band, the band keys of
+    the kept texts in a sorted uint64 array next to their ring buffer slots, so that a whole
+    batch is looked up with np.searchsorted and candidates within the batch are found by
+    grouping it on its band keys. A text is compared with at most BUCKET_SIZE texts per band:
+    the most recent ones of the index sharing its key, and the first ones of its batch.
+    """
+
+    # Signature value of empty texts, which never match anything
+    EMPTY = np.iinfo(np.uint32).max
+    # Number of texts compared per band, bounding the candidates of frequent band keys
+    BUCKET_SIZE = 8
+    # Number of shingles hashed at once by signatures
+    CHUNK_SHINGLES = 1 << 16
+    # Number of candidate pairs whose signatures are compared at once
+    CHUNK_PAIRS = 1 << 16
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        max_items: int = 100_000,
+        seed: int = 1,
+    ):
+        """
+        Constructor for the MinHashDeduplicator class.
+
+        Parameters:
+        - threshold: Estimated Jaccard similarity above which a text is a duplicate (default is 0.8).
+        - num_perm: Number of hash functions of a signature (default is 64).
+        - bands: Number of LSH bands, which must divide num_perm. More bands find less similar
+          candidates, at the cost of more comparisons (default is 16).
+        - shingle_size: Number of characters per shingle (default is 5).
+        - max_items: Maximum number of signatures kept in the index (default is 100,000).
+        - seed: Seed of the hash functions (default is 1).
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be between 0 and 1")
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        if max_items < 1:
+            raise ValueError("max_items must be at least 1")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.max_items = max_items
+
+        rng = np.random.default_rng(seed)
+        # One multiply-add hash per permutation, wrapping around modulo 2**32
+        self._a = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32) | np.uint32(1)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32)
+        self._shingle_powers = np.uint32(257) ** np.arange(shingle_size, dtype=np.uint32)
+        self._band_coefficients = rng.integers(1, 1 << 63, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+
+        # Ring buffer of the kept signatures, grown up to max_items, and of their item numbers
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._item_ids = np.empty(0, dtype=np.int64)
+        # LSH index: one row per band of the kept band keys, sorted by key then age, and of their slots
+        self._slot_dtype = np.int32 if max_items <= np.iinfo(np.int32).max else np.int64
+        self._index_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._index_slots = np.empty((bands, 0), dtype=self._slot_dtype)
+        self._n_items = 0
+        self._n_kept = 0
+
+    def __len__(self) -> int:
+        return min(self._n_kept, self.max_items)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        Drop what differs between copies of a tweet: case, retweet prefixes, mentions, links and extra whitespace.
+        """
+        text = text.lower()
+        text = re.sub(r"^rt @\w+:\s*", "", text)
+        text = re.sub(r"https?://\S+|@\w+", " ", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def signatures(self, texts) -> np.ndarray:
+        """
+        Compute the MinHash signatures of texts.
+
+        Returns:
+        A (len(texts), num_perm) uint32 array. Empty texts get a signature of EMPTY values, which is never a duplicate.
+        """
+        signatures = np.full((len(texts), self.num_perm), self.EMPTY, dtype=np.uint32)
+        encoded = [
+            self.normalize_text(text).encode("utf-8") if isinstance(text, str) else b""
+            for text in texts
+        ]
+        # Texts shorter than a shingle are padded to a single shingle
+        encoded = [text.ljust(self.shingle_size, b"\0") if text else text for text in encoded]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        n_shingles = np.maximum(lengths - self.shingle_size + 1, 0)
+        if not n_shingles.any():
+            return signatures
+
+        # Polynomial hash of every shingle of every text at once, without crossing text boundaries
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        text_starts = np.cumsum(lengths) - lengths
+        shingle_offsets = np.cumsum(n_shingles) - n_shingles
+        starts = np.repeat(text_starts - shingle_offsets, n_shingles) + np.arange(n_shingles.sum())
+        # Accumulated a character at a time, wrapping around modulo 2**32, to keep one array per shingle
+        shingle_hashes = np.zeros(len(starts), dtype=np.uint32)
+        for offset, power in enumerate(self._shingle_powers):
+            shingle_hashes += np.multiply(buffer[starts + offset], power, dtype=np.uint32)
+        shingle_hashes = self._mix(shingle_hashes)
+
+        # Min-hash chunks of texts, to bound the (num_perm, shingles) intermediate array
+        non_empty = np.flatnonzero(n_shingles)
+        chunk_ends = np.cumsum(n_shingles[non_empty])
+        position = 0
+        while position < len(non_empty):
+            end = max(position + 1, np.searchsorted(chunk_ends, chunk_ends[position] + self.CHUNK_SHINGLES, side="right"))
+            chunk = non_empty[position:end]
+            first, last = shingle_offsets[chunk[0]], shingle_offsets[chunk[-1]] + n_shingles[chunk[-1]]
+            hashes = self._a[:, None] * shingle_hashes[None, first:last]
+            hashes += self._b[:, None]
+            signatures[chunk] = np.minimum.reduceat(hashes, shingle_offsets[chunk] - first, axis=1).T
+            position = end
+        return signatures
+
+    def duplicate_of(self, texts) -> np.ndarray:
+        """
+        Find, for every text, an earlier near-duplicate, in this batch or a previous one still in the index.
+
+        Texts without a duplicate are added to the index, so that later copies of them are found.
+        The whole batch is compared with the index as it was before the batch, even when adding
+        its new texts overwrites older ones.
+
+        Parameters:
+        - texts: The texts of a batch.
+
+        Returns:
+        An int64 array with, for every text, the item number of the text it duplicates, or -1.
+        Item numbers count every text given to the deduplicator, from 0.
+        """
+        signatures = self.signatures(texts)
+        band_keys = self._compute_band_keys(signatures)
+        first_item_id = self._n_items
+        self._n_items += len(signatures)
+        duplicate_of = np.full(len(signatures), -1, dtype=np.int64)
+        pending = np.flatnonzero(~(signatures == self.EMPTY).all(axis=1))
+
+        # Texts of previous batches: the best match among the index candidates, the oldest on ties
+        if self._index_keys.shape[1] and len(pending):
+            positions, slots = self._index_candidates(band_keys, pending)
+            similarities = self._similarities(signatures, positions, self._signatures, slots)
+            matched = similarities >= self.threshold
+            positions, slots, similarities = positions[matched], slots[matched], similarities[matched]
+            item_ids = self._item_ids[slots]
+            best = np.lexsort((item_ids, -similarities, positions))
+            positions, first = np.unique(positions[best], return_index=True)
+            duplicate_of[positions] = item_ids[best[first]]
+            pending = pending[duplicate_of[pending] < 0]
+
+        # Texts of this batch: a text duplicates its best earlier match that is not a duplicate itself
+        positions, earlier = self._batch_candidates(band_keys, pending)
+        similarities = self._similarities(signatures, positions, signatures, earlier)
+        matched = similarities >= self.threshold
+        positions, earlier, similarities = positions[matched], earlier[matched], similarities[matched]
+        best = np.lexsort((earlier, -similarities, positions))
+        for position, candidate in zip(positions[best].tolist(), earlier[best].tolist()):
+            if duplicate_of[position] < 0 and duplicate_of[candidate] < 0:
+                duplicate_of[position] = first_item_id + candidate
+
+        kept = pending[duplicate_of[pending] < 0]
+        self._add(first_item_id + kept, signatures[kept], band_keys[kept])
+        return duplicate_of
+
+    def duplicated(self, texts) -> np.ndarray:
+        """
+        Flag the texts that are near-duplicates of an earlier one (see duplicate_of).
+
+        Returns:
+        A bool array, True for every duplicate text.
+        """
+        return self.duplicate_of(texts) >= 0
+
+    @staticmethod
+    def _mix(hashes: np.ndarray) -> np.ndarray:
+        # MurmurHash3 finalizer, so that similar shingles get unrelated hashes before the linear permutations
+        hashes = hashes ^ (hashes >> np.uint32(16))
+        hashes *= np.uint32(0x85EBCA6B)
+        hashes ^= hashes >> np.uint32(13)
+        hashes *= np.uint32(0xC2B2AE35)
+        hashes ^= hashes >> np.uint32(16)
+        return hashes
+
+    def _compute_band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        rows = signatures.reshape(len(signatures), self.bands, self.num_perm // self.bands).astype(np.uint64)
+        # Multiplications wrap around modulo 2**64, which is fine for bucketing
+        return (rows * self._band_coefficients).sum(axis=2, dtype=np.uint64)
+
+    @staticmethod
+    def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # Concatenation of range(start, start + count) for every start and count
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    @staticmethod
+    def _distinct_pairs(firsts: np.ndarray, seconds: np.ndarray, n_seconds: int):
+        # Pairs are deduplicated as single int64 codes, much faster to sort than rows
+        codes = np.unique(firsts.astype(np.int64) * n_seconds + seconds)
+        return codes // n_seconds, codes % n_seconds
+
+    def _index_candidates(self, band_keys: np.ndarray, positions: np.ndarray):
+        """
+        Pair texts of a batch with the slots of the most recent kept texts sharing one of their band keys.
+
+        Returns:
+        The batch positions and slots of the distinct candidate pairs.
+        """
+        pair_positions, pair_slots = [], []
+        for band in range(self.bands):
+            keys = band_keys[positions, band]
+            ends = np.searchsorted(self._index_keys[band], keys, side="right")
+            starts = np.maximum(np.searchsorted(self._index_keys[band], keys, side="left"), ends - self.BUCKET_SIZE)
+            pair_positions.append(np.repeat(positions, ends - starts))
+            pair_slots.append(self._index_slots[band][self._expand_ranges(starts, ends - starts)])
+        return self._distinct_pairs(np.concatenate(pair_positions), np.concatenate(pair_slots), len(self._signatures))
+
+    def _batch_candidates(self, band_keys: np.ndarray, positions: np.ndarray):
+        """
+        Pair texts of a batch with the first earlier texts of the batch sharing one of their band keys.
+
+        Returns:
+        The batch positions and earlier batch positions of the distinct candidate pairs.
+        """
+        pair_positions, pair_earlier = [], []
+        for band in range(self.bands):
+            keys = band_keys[positions, band]
+            order = np.lexsort((positions, keys))
+            sorted_keys, sorted_positions = keys[order], positions[order]
+            # Rank of every text in its group of equal keys, and where that group starts
+            group_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            starts = np.repeat(group_starts, np.diff(np.r_[group_starts, len(sorted_keys)]))
+            counts = np.minimum(np.arange(len(sorted_keys)) - starts, self.BUCKET_SIZE)
+            pair_positions.append(np.repeat(sorted_positions, counts))
+            pair_earlier.append(sorted_positions[self._expand_ranges(starts, counts)])
+        return self._distinct_pairs(np.concatenate(pair_positions), np.concatenate(pair_earlier), len(band_keys))
+
+    def _similarities(self, signatures: np.ndarray, rows: np.ndarray, others: np.ndarray, other_rows: np.ndarray) -> np.ndarray:
+        # Fraction of equal values of signatures[rows] and others[other_rows], a chunk of pairs at a time
+        similarities = np.empty(len(rows), dtype=np.float64)
+        for start in range(0, len(rows), self.CHUNK_PAIRS):
+            stop = start + self.CHUNK_PAIRS
+            equal = signatures[rows[start:stop]] == others[other_rows[start:stop]]
+            similarities[start:stop] = equal.sum(axis=1) / self.num_perm
+        return similarities
+
+    def _add(self, item_ids: np.ndarray, signatures: np.ndarray, band_keys: np.ndarray) -> None:
+        # Only the last max_items texts of a batch fit in the ring buffer
+        skipped = max(0, len(item_ids) - self.max_items)
+        item_ids, signatures, band_keys = item_ids[skipped:], signatures[skipped:], band_keys[skipped:]
+        n_before = len(self)
+        self._n_kept += skipped
+        slots = ((self._n_kept + np.arange(len(item_ids))) % self.max_items).astype(self._slot_dtype)
+        self._n_kept += len(item_ids)
+
+        if len(self) > len(self._signatures):
+            # Grow the buffers geometrically, so that a small stream does not allocate max_items rows
+            capacity = min(self.max_items, max(1024, 2 * len(self._signatures), len(self)))
+            self._signatures = np.resize(self._signatures, (capacity, self.num_perm))
+            self._item_ids = np.resize(self._item_ids, capacity)
+
+        # Forget the texts being overwritten; every band loses the same slots, so rows stay aligned
+        overwritten = np.zeros(len(self._signatures), dtype=bool)
+        overwritten[slots[slots < n_before]] = True
+        if overwritten.any():
+            kept = ~overwritten[self._index_slots]
+            self._index_keys = self._index_keys[kept].reshape(self.bands, -1)
+            self._index_slots = self._index_slots[kept].reshape(self.bands, -1)
+
+        self._signatures[slots] = signatures
+        self._item_ids[slots] = item_ids
+
+        # Merge the new keys in, after the older equal keys so that the most recent come last
+        index_keys = np.empty((self.bands, self._index_keys.shape[1] + len(slots)), dtype=np.uint64)
+        index_slots = np.empty(index_keys.shape, dtype=self._slot_dtype)
+        for band in range(self.bands):
+            order = np.argsort(band_keys[:, band], kind="stable")
+            keys = band_keys[order, band]
+            positions = np.searchsorted(self._index_keys[band], keys, side="right")
+            index_keys[band] = np.insert(self._index_keys[band], positions, keys)
+            index_slots[band] = np.insert(self._index_slots[band], positions, slots[order])
+        self._index_keys, self._index_slots = index_keys, index_slots
+
+
+def dedupe(
+    df: pd.DataFrame,
+    column: str,
+    deduplicator,
+    mode: str = "drop",
+) -> pd.DataFrame:
+    """
+    Remove or flag the rows of a batch whose column is a duplicate of an earlier value.
+
+    Parameters:
+    - df: A batch of rows, such as XSource tweets or GDELTSource articles.
+    - column: The column to deduplicate on, such as 'tweet_text' or 'article_url'.
+    - deduplicator: The URLDeduplicator or MinHashDeduplicator to use, kept across batches.
+    - mode: 'drop' to remove duplicates, or 'flag' to add a boolean is_duplicate column (default is 'drop').
+
+    Returns:
+    The deduplicated or flagged DataFrame.
+    """
+    if mode not in ("drop", "flag"):
+        raise ValueError(f"Unknown mode {mode}. Valid modes are ['drop', 'flag']")
+
+    duplicated = deduplicator.duplicated(df[column].tolist())
+    if mode == "flag":
+        return df.assign(is_duplicate=duplicated)
+    return df[~duplicated]
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+
+
+def format_partition_date(value) -> str:
+    """
+    Format a partition date as the '%Y%m%d' string used by daily partitions.
+
+    Parameters:
+    - value: A datetime, a date or a date string ('%Y%m%d' or '%Y-%m-%d').
+
+    Returns:
+    The date formatted as '%Y%m%d'. Values of any other type are passed through str().
+    """
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y%m%d')
+    if isinstance(value, str):
+        return value.replace('-', '')
+    return str(value)
+
+
+def parse_partition_date(value) -> date:
+    """
+    Parse a partition date given as a datetime, a date or a date string.
+
+    Parameters:
+    - value: A datetime, a date or a date string ('%Y%m%d' or '%Y-%m-%d').
+
+    Returns:
+    The corresponding date.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(format_partition_date(value), '%Y%m%d').date()
+
+
+def partition_dates(start_date, end_date) -> list[str]:
+    """
+    List the daily partition dates between two dates, both included.
+
+    Parameters:
+    - start_date: The first date, as a datetime, a date or a date string.
+    - end_date: The last date, as a datetime, a date or a date string.
+
+    Returns:
+    A list of dates formatted as '%Y%m%d', in ascending order.
+    """
+    start = parse_partition_date(start_date)
+    end = parse_partition_date(end_date)
+    if end < start:
+        raise ValueError(f"end_date {end} is before start_date {start}")
+
+    return [
+        (start + timedelta(days=offset)).strftime('%Y%m%d')
+        for offset in range((end - start).days + 1)
+    ]
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from social_signals.common.instrumentation import record
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second, up to `capacity`. Every request takes one
+    token, waiting for it if the bucket is empty, so any number of threads sharing a bucket
+    stay within `rate` requests per second on average, with bursts of at most `capacity`.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float,
+        capacity: float = 1,
+    ):
+        """
+        Constructor for the TokenBucket class.
+
+        Parameters:
+        - rate: Number of tokens added per second.
+        - capacity: Maximum number of tokens the bucket holds, i.e. the largest burst (default is 1).
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, waiting until they are available.
+
+        Parameters:
+        - tokens: Number of tokens to take (default is 1).
+
+        Returns:
+        The number of seconds spent waiting.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            # Reserve the tokens now, so that waiting threads are served in arrival order
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+
+        if wait > 0:
+            time.sleep(wait)
+            record("rate_limit_wait_s", wait)
+        return wait
+
+
+class RateLimitWindow:
+    """
+    Thread-safe request budget for an API announcing fixed rate limit windows in its responses.
+
+    After each response, the number of requests left and the time the window resets are fed to
+    update. Requests then take a slot with acquire, which spreads the remaining requests evenly
+    until the reset instead of bursting through them, and waits for the next window once the
+    budget is spent. Any number of threads or clients sharing a window share its budget.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the RateLimitWindow class. The budget is unknown, and not enforced, until the first update.
+        """
+        self._remaining = None
+        self._reset_at = None
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a request slot, waiting until it is due.
+
+        Returns:
+        The number of seconds spent waiting.
+        """
+        with self._lock:
+            now = time.time()
+            if self._reset_at is None or now >= self._reset_at:
+                # The window is unknown or over, and the next response will tell the new budget
+                self._remaining = None
+                self._reset_at = None
+                wait = 0.0
+            elif self._remaining > 0:
+                # Spread the remaining requests evenly over what is left of the window
+                slot = max(now, self._next_at)
+                self._next_at = slot + (self._reset_at - slot) / self._remaining
+                self._remaining -= 1
+                wait = slot - now
+            else:
+                wait = self._reset_at - now
+                self._next_at = self._reset_at
+
+        if wait > 0:
+            time.sleep(wait)
+            record("rate_limit_wait_s", wait)
+        return wait
+
+    def update(self, remaining: int, reset_at: float) -> None:
+        """
+        Record the budget announced by a response.
+
+        Parameters:
+        - remaining: Number of requests left in the current window.
+        - reset_at: Unix timestamp at which the window resets.
+        """
+        with self._lock:
+            # Responses of concurrent requests arrive out of order, so keep the lowest budget of a window
+            if self._reset_at is not None and reset_at == self._reset_at and self._remaining is not None:
+                remaining = min(remaining, self._remaining)
+            self._remaining = remaining
+            self._reset_at = reset_at
@@ -0,0 +1,205 @@
+import re
+
+import requests
+
+from social_signals.common.instrumentation import record
+from social_signals.utils.rate_limit import TokenBucket
+
+
+class MediaWikiClient:
+    """
+    Minimal client for the MediaWiki action API, which fetches many pages per request.
+
+    One query asks for up to MAX_TITLES (50) titles at once, with their url, categories, links
+    and external links combined, and follows continuation tokens until every property of every
+    page is complete. Content is not batched: the API only returns one whole-article plain text
+    extract per request, so _get_extract still sends one request per page.
+    """
+
+    # Largest number of titles a non-bot client may ask for in one request
+    MAX_TITLES = 50
+    # Query modules needed by each WikipediaSource column
+    COLUMN_PROPS = {
+        "pageid": [],
+        "title": [],
+        "url": ["info"],
+        "categories": ["categories"],
+        "links": ["links"],
+        "references": ["extlinks"],
+        # Fetched page by page, see _get_extract
+        "content": [],
+        "revid": ["info"],
+        "redirects": ["redirects"],
+    }
+
+    def __init__(
+        self,
+        *,
+        lang: str = "en",
+        api_url: str = None,
+        rate_limiter: TokenBucket = None,
+        session: requests.Session = None,
+        timeout: float = 30,
+    ):
+        """
+        Constructor for the MediaWikiClient class.
+
+        Parameters:
+        - lang: Language code for Wikipedia language edition (default is English 'en').
+        - api_url: URL of the api.php endpoint (default is the Wikipedia API of lang).
+        - rate_limiter: Token bucket taken from before every request (default is no rate limiting).
+        - session: The requests session to use (default is a new session).
+        - timeout: Timeout of every request in seconds (default is 30).
+        """
+        self.api_url = api_url or f"https://{lang}.wikipedia.org/w/api.php"
+        self.rate_limiter = rate_limiter
+        self.session = session or requests.Session()
+        self.session.headers.setdefault("User-Agent", "social_signals (https://github.com/republicofdata-io/social_signals)")
+        self.timeout = timeout
+
+    def request(self, params: dict) -> dict:
+        """
+        Send a single API request and return its decoded JSON response.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        response = self.session.get(
+            self.api_url,
+            params={"action": "query", "format": "json", "formatversion": 2, **params},
+            timeout=self.timeout,
+        )
+        record("http_requests")
+        record("http_bytes_received", len(response.content))
+        response.raise_for_status()
+        json_response = response.json()
+
+        if "error" in json_response:
+            raise ValueError(f"MediaWiki API error: {json_response['error']}")
+        return json_response
+
+    def continued_query(self, params: dict):
+        """
+        Run a query and every continuation of it.
+
+        Returns:
+        An iterator of the 'query' part of each response.
+        """
+        continuation = {}
+        while True:
+            json_response = self.request({**params, **continuation})
+            if "query" in json_response:
+                yield json_response["query"]
+            if "continue" not in json_response:
+                return
+            continuation = json_response["continue"]
+
+    def get_pages(self, titles: list[str], columns: list[str]) -> list[dict]:
+        """
+        Fetch pages by title, many titles per request.
+
+        Parameters:
+        - titles: The page titles. Each request asks for at most MAX_TITLES of them.
+        - columns: The WikipediaSource columns to fetch, plus 'revid' for the last revision id and
+          'redirects' for the titles of the pages redirecting to each page.
+
+        Returns:
+        One dict per title, in the order of titles. Each dict has the requested columns, plus the
+        requested_title, a missing flag and a disambiguation flag.
+        """
+        props = ["pageprops"] + sorted({prop for col in columns for prop in self.COLUMN_PROPS[col]})
+        params = {
+            "prop": "|".join(props),
+            "redirects": 1,
+            "ppprop": "disambiguation",
+        }
+        if "url" in columns:
+            params["inprop"] = "url"
+        if "categories" in props:
+            params["cllimit"] = "max"
+        if "links" in props:
+            params.update({"pllimit": "max", "plnamespace": 0})
+        if "extlinks" in props:
+            params["ellimit"] = "max"
+        if "redirects" in props:
+            params.update({"rdlimit": "max", "rdnamespace": 0, "rdprop": "title"})
+
+        records = []
+        for start in range(0, len(titles), self.MAX_TITLES):
+            batch = titles[start:start + self.MAX_TITLES]
+            records.extend(self._get_batch(batch, params, columns))
+        return records
+
+    def _get_extract(self, title: str):
+        """
+        Fetch the plain text extract of a single page, or None if it has none.
+        """
+        json_response = self.request({"prop": "extracts", "explaintext": 1, "titles": title})
+        pages = json_response.get("query", {}).get("pages", [])
+        return pages[0].get("extract") if pages else None
+
+    def _get_batch(self, titles: list[str], params: dict, columns: list[str]) -> list[dict]:
+        pages = {}
+        title_map = {}
+        for query in self.continued_query({**params, "titles": "|".join(titles)}):
+            # Follow title normalization and redirects back to the requested titles
+            for key in ("normalized", "redirects"):
+                for mapping in query.get(key, []):
+                    title_map[mapping["from"]] = mapping["to"]
+
+            # Continuation responses repeat the pages, with the next slice of each property
+            for page in query.get("pages", []):
+                merged = pages.setdefault(page["title"], {})
+                for key, value in page.items():
+                    if isinstance(value, list):
+                        merged.setdefault(key, []).extend(value)
+                    else:
+                        merged[key] = value
+
+        if "content" in columns:
+            # Asking for the extracts of a batch would return them one per continuation anyway
+            for title, page in pages.items():
+                if not (page.get("missing") or page.get("invalid")) and "disambiguation" not in page.get("pageprops", {}):
+                    page["extract"] = self._get_extract(title)
+
+        records = []
+        for title in titles:
+            resolved_title = title
+            seen = set()
+            while resolved_title in title_map and resolved_title not in seen:
+                seen.add(resolved_title)
+                resolved_title = title_map[resolved_title]
+            records.append(self._page_record(title, pages.get(resolved_title, {"missing": True}), columns))
+        return records
+
+    @staticmethod
+    def _page_record(requested_title: str, page: dict, columns: list[str]) -> dict:
+        row = {
+            "requested_title": requested_title,
+            "missing": bool(page.get("missing") or page.get("invalid")),
+            "disambiguation": "disambiguation" in page.get("pageprops", {}),
+        }
+        values = {
+            # The wikipedia library exposes page ids as strings
+            "pageid": lambda: str(page["pageid"]),
+            "title": lambda: page["title"],
+            "url": lambda: page["fullurl"],
+            "categories": lambda: [
+                re.sub(r"^Category:", "", category["title"]) for category in page.get("categories", [])
+            ],
+            "links": lambda: [link["title"] for link in page.get("links", [])],
+            "references": lambda: [
+                "http:" + link["url"] if link["url"].startswith("//") else link["url"]
+                for link in page.get("extlinks", [])
+            ],
+            "content": lambda: page["extract"],
+            "revid": lambda: page["lastrevid"],
+            # Titles of the pages redirecting to this one
+            "redirects": lambda: [redirect["title"] for redirect in page.get("redirects", [])],
+        }
+        for col in columns:
+            try:
+                row[col] = values[col]()
+            except KeyError:
+                row[col] = None
+        return row
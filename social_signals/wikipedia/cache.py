@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+
+class WikipediaPageCache:
+    """
+    Persistent SQLite cache of Wikipedia page records and search results.
+
+    Page records are keyed by (lang, title) and stored with the revision id they were fetched
+    at, so that they can be revalidated with a cheap last revision id check and only downloaded
+    again when the page changed. Search results expire after a TTL. Once the cache grows past
+    max_bytes or max_entries, the least recently used pages are evicted.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str,
+        max_bytes: int = 2**30,
+        max_entries: int = None,
+        search_ttl: timedelta = timedelta(hours=1),
+        revalidate_after: timedelta = timedelta(0),
+    ):
+        """
+        Constructor for the WikipediaPageCache class.
+
+        Parameters:
+        - path: Path of the SQLite database file. Created if missing.
+        - max_bytes: Maximum total size of the cached page records in bytes (default is 1 GB).
+        - max_entries: Maximum number of cached pages (default is no limit).
+        - search_ttl: How long search results stay valid (default is 1 hour).
+        - revalidate_after: How long a page is used without checking its revision again (default is 0, always check).
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.search_ttl = search_ttl
+        self.revalidate_after = revalidate_after
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                create table if not exists pages (
+                    lang text not null,
+                    title text not null,
+                    revid integer,
+                    record text not null,
+                    size integer not null,
+                    validated_at real not null,
+                    accessed_at real not null,
+                    primary key (lang, title)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                create table if not exists searches (
+                    lang text not null,
+                    search_term text not null,
+                    n_pages integer not null,
+                    results text not null,
+                    created_at real not null,
+                    primary key (lang, search_term, n_pages)
+                )
+                """
+            )
+
+    def get_pages(self, lang: str, titles: list[str]) -> dict:
+        """
+        Read cached page records.
+
+        Parameters:
+        - lang: Language code of the pages.
+        - titles: The requested page titles.
+
+        Returns:
+        A dict mapping each cached title to a (revid, record, needs_revalidation) tuple.
+        """
+        if not titles:
+            return {}
+
+        now = time.time()
+        cached = {}
+        with self._lock:
+            for start in range(0, len(titles), 500):
+                batch = titles[start:start + 500]
+                rows = self._connection.execute(
+                    f"select title, revid, record, validated_at from pages "
+                    f"where lang = ? and title in ({', '.join('?' * len(batch))})",
+                    [lang, *batch],
+                ).fetchall()
+                for title, revid, record, validated_at in rows:
+                    needs_revalidation = now - validated_at >= self.revalidate_after.total_seconds()
+                    cached[title] = (revid, json.loads(record), needs_revalidation)
+
+            with self._connection:
+                self._connection.executemany(
+                    "update pages set accessed_at = ? where lang = ? and title = ?",
+                    [(now, lang, title) for title in cached],
+                )
+        return cached
+
+    def put_pages(self, lang: str, records: dict) -> None:
+        """
+        Store page records, then evict least recently used pages if needed.
+
+        Parameters:
+        - lang: Language code of the pages.
+        - records: A dict mapping each requested title to a (revid, record) tuple. Records must be JSON serializable.
+        """
+        now = time.time()
+        rows = []
+        for title, (revid, record) in records.items():
+            payload = json.dumps(record)
+            rows.append((lang, title, revid, payload, len(payload), now, now))
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "insert or replace into pages values (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+
+    def mark_validated(self, lang: str, titles: list[str]) -> None:
+        """
+        Record that cached pages were found unchanged.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "update pages set validated_at = ? where lang = ? and title = ?",
+                [(now, lang, title) for title in titles],
+            )
+
+    def get_search(self, lang: str, search_term: str, n_pages: int):
+        """
+        Read cached search results.
+
+        Returns:
+        The list of page names, or None if the search is not cached or has expired.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "select results, created_at from searches where lang = ? and search_term = ? and n_pages = ?",
+                (lang, search_term, n_pages),
+            ).fetchone()
+
+        if row is None or time.time() - row[1] >= self.search_ttl.total_seconds():
+            return None
+        return json.loads(row[0])
+
+    def put_search(self, lang: str, search_term: str, n_pages: int, results: list[str]) -> None:
+        """
+        Store search results.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "insert or replace into searches values (?, ?, ?, ?, ?)",
+                (lang, search_term, n_pages, json.dumps(results), now),
+            )
+            self._connection.execute(
+                "delete from searches where created_at <= ?",
+                (now - self.search_ttl.total_seconds(),),
+            )
+
+    def size(self) -> int:
+        """
+        Total size of the cached page records in bytes.
+        """
+        with self._lock:
+            return self._connection.execute("select coalesce(sum(size), 0) from pages").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("select count(*) from pages").fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self) -> None:
+        # Called with the lock held, inside a transaction
+        total_bytes, total_entries = self._connection.execute(
+            "select coalesce(sum(size), 0), count(*) from pages"
+        ).fetchone()
+
+        evicted = []
+        rows = self._connection.execute(
+            "select lang, title, size from pages order by accessed_at"
+        )
+        for lang, title, size in rows:
+            over_entries = self.max_entries is not None and total_entries > self.max_entries
+            if total_bytes <= self.max_bytes and not over_entries:
+                break
+            evicted.append((lang, title))
+            total_bytes -= size
+            total_entries -= 1
+
+        self._connection.executemany("delete from pages where lang = ? and title = ?", evicted)
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from social_signals.wikipedia.api import MediaWikiClient
+
+
+def normalize_names(names) -> np.ndarray:
+    """
+    Normalize entity names for matching, e.g. 'Joe_Biden', 'JOE BIDEN' and 'joe biden' all become 'joe biden'.
+
+    Accents are removed, case is folded, and every run of punctuation, underscores and spaces
+    becomes a single space. Normalization is vectorized.
+
+    Parameters:
+    - names: An array-like of names. Missing names are normalized to ''.
+
+    Returns:
+    A numpy object array of normalized names.
+    """
+    normalized = (
+        pd.Series(names, dtype=object)
+        .fillna("")
+        .astype(str)
+        .str.normalize("NFKD")
+        .str.replace(r"[\u0300-\u036f]", "", regex=True)
+        .str.casefold()
+        .str.replace(r"[\W_]+", " ", regex=True)
+        .str.strip()
+    )
+    return normalized.to_numpy()
+
+
+def hash_names(normalized_names) -> np.ndarray:
+    """
+    Hash normalized names to uint64 keys, with a fixed key so that hashes are stable across runs.
+    """
+    return pd.util.hash_array(np.asarray(normalized_names, dtype=object), hash_key=EntityIndex.HASH_KEY)
+
+
+class EntityIndex:
+    """
+    Lookup of Wikipedia page ids by entity name, to link GDELT persons and organizations to Wikipedia pages.
+
+    Surface forms are normalized with normalize_names and stored as sorted 64-bit hashes, so
+    resolving a batch of names is a vectorized hash and binary search, done once per distinct
+    name. Each page is known by its title, the titles of its redirects and its title without a
+    trailing qualifier ('Python (programming language)' is also 'python'). When several pages
+    share a surface form, titles win over redirects, and redirects over qualifier-free titles;
+    a form still shared by several pages is ambiguous and resolves to nothing, as do the forms
+    of disambiguation pages, which are never added.
+
+    The index is updated incrementally with add_pages, and saved to a single .npz file.
+    """
+
+    # Priority of each kind of surface form, lowest first
+    TITLE = 0
+    REDIRECT = 1
+    UNQUALIFIED_TITLE = 2
+    # Page id of ambiguous surface forms, and of unresolved names
+    UNRESOLVED = -1
+    # 16 bytes key of the name hashes, fixed so that saved indexes stay valid
+    HASH_KEY = "social_signals01"
+
+    def __init__(self):
+        """
+        Constructor for the EntityIndex class. The index starts empty.
+        """
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.pageids = np.empty(0, dtype=np.int64)
+        self.priorities = np.empty(0, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add_pages(self, pages: pd.DataFrame) -> None:
+        """
+        Add Wikipedia pages to the index.
+
+        Parameters:
+        - pages: A DataFrame with pageid and title columns, such as WikipediaSource.data, and optionally
+          a redirects column of lists of redirect titles and a disambiguation column of booleans.
+          Disambiguation pages and pages without a page id are skipped.
+        """
+        pages = pages[pages["pageid"].notna()]
+        if "disambiguation" in pages.columns:
+            pages = pages[~pages["disambiguation"].fillna(False).astype(bool)]
+        pageids = pages["pageid"].astype(np.int64).to_numpy()
+        titles = pages["title"].to_numpy(dtype=object)
+
+        names = [titles]
+        name_pageids = [pageids]
+        name_priorities = [np.full(len(pages), self.TITLE, dtype=np.int8)]
+
+        if "redirects" in pages.columns:
+            redirects = pages["redirects"].explode().dropna()
+            positions = pd.Series(np.arange(len(pages)), index=pages.index).reindex(redirects.index).to_numpy()
+            names.append(redirects.to_numpy(dtype=object))
+            name_pageids.append(pageids[positions])
+            name_priorities.append(np.full(len(redirects), self.REDIRECT, dtype=np.int8))
+
+        unqualified = pd.Series(titles, dtype=object).str.replace(r"\s*\([^()]*\)$", "", regex=True).to_numpy()
+        qualified = unqualified != titles
+        names.append(unqualified[qualified])
+        name_pageids.append(pageids[qualified])
+        name_priorities.append(np.full(qualified.sum(), self.UNQUALIFIED_TITLE, dtype=np.int8))
+
+        self._add(np.concatenate(names), np.concatenate(name_pageids), np.concatenate(name_priorities))
+
+    def add_wikipedia_pages(self, client: MediaWikiClient, titles: list[str]) -> None:
+        """
+        Fetch pages with their redirects and add them to the index.
+
+        The requested titles that redirect to a page are added as redirects of it.
+
+        Parameters:
+        - client: The MediaWikiClient to fetch the pages with, e.g. WikipediaSource.api.
+        - titles: The titles of the pages.
+        """
+        records = [
+            record for record in client.get_pages(list(titles), ["pageid", "title", "redirects"]) if not record["missing"]
+        ]
+        if not records:
+            return
+        pages = pd.DataFrame.from_records(
+            records, columns=["requested_title", "pageid", "title", "redirects", "disambiguation"]
+        )
+        pages["redirects"] = [
+            redirects + ([requested] if requested != title else [])
+            for requested, title, redirects in zip(pages["requested_title"], pages["title"], pages["redirects"])
+        ]
+        self.add_pages(pages)
+
+    def resolve(self, names) -> np.ndarray:
+        """
+        Resolve entity names to Wikipedia page ids.
+
+        Parameters:
+        - names: An array-like of names, in any case or spelling normalize_names handles.
+
+        Returns:
+        A numpy int64 array of page ids, UNRESOLVED (-1) for unknown and ambiguous names.
+        """
+        # Mentions repeat a lot, so only distinct names are normalized and hashed
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+        resolved = self._lookup(normalize_names(uniques))
+        return np.where(codes >= 0, resolved[codes], self.UNRESOLVED)
+
+    def link(self, entity_df: pd.DataFrame, column: str) -> pd.DataFrame:
+        """
+        Add the Wikipedia page id of every entity of a GKG entity table.
+
+        Parameters:
+        - entity_df: A table returned by explode_gkg_entities, such as its persons or organizations table.
+        - column: The name column, such as 'person' or 'organization'.
+
+        Returns:
+        A copy of entity_df with a pageid column (nullable Int64, missing when unresolved).
+        """
+        values = entity_df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Categories are already the distinct names
+            resolved = np.append(self.resolve(values.cat.categories), self.UNRESOLVED)
+            pageids = resolved[values.cat.codes.to_numpy()]
+        else:
+            pageids = self.resolve(values.to_numpy())
+
+        linked_df = entity_df.copy()
+        linked_df["pageid"] = pd.arrays.IntegerArray(pageids, pageids == self.UNRESOLVED)
+        return linked_df
+
+    def save(self, path: str) -> None:
+        """
+        Save the index to a .npz file. The .npz extension is added to path if it is missing.
+        """
+        np.savez(path, keys=self.keys, pageids=self.pageids, priorities=self.priorities)
+
+    @classmethod
+    def load(cls, path: str) -> "EntityIndex":
+        """
+        Load an index saved with save.
+        """
+        index = cls()
+        with np.load(path) as arrays:
+            index.keys = arrays["keys"]
+            index.pageids = arrays["pageids"]
+            index.priorities = arrays["priorities"]
+        return index
+
+    def _add(self, names: np.ndarray, pageids: np.ndarray, priorities: np.ndarray) -> None:
+        normalized = normalize_names(names)
+        valid = normalized != ""
+
+        keys = np.concatenate([self.keys, hash_names(normalized[valid])])
+        pageids = np.concatenate([self.pageids, pageids[valid]])
+        priorities = np.concatenate([self.priorities, priorities[valid]])
+
+        # Sort by key, then priority, then page id, and keep the best priority of every key
+        order = np.lexsort((pageids, priorities, keys))
+        keys, pageids, priorities = keys[order], pageids[order], priorities[order]
+        group_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        best_priorities = np.repeat(priorities[group_starts], np.diff(np.r_[group_starts, len(keys)]))
+        best = priorities == best_priorities
+        keys, pageids, priorities = keys[best], pageids[best], priorities[best]
+
+        # Drop repeated (key, page id) pairs, then keep one entry per key, ambiguous if several pages hold it
+        distinct = np.r_[True, (keys[1:] != keys[:-1]) | (pageids[1:] != pageids[:-1])]
+        keys, pageids, priorities = keys[distinct], pageids[distinct], priorities[distinct]
+        new_key = keys[1:] != keys[:-1]
+        first = np.flatnonzero(np.r_[True, new_key])
+        ambiguous = ~np.r_[new_key, True][first]
+
+        self.keys = keys[first]
+        self.pageids = np.where(ambiguous, self.UNRESOLVED, pageids[first])
+        self.priorities = priorities[first]
+
+    def _lookup(self, normalized_names: np.ndarray) -> np.ndarray:
+        keys = hash_names(normalized_names)
+        if len(self.keys) == 0:
+            return np.full(len(keys), self.UNRESOLVED, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = (self.keys[positions] == keys) & (normalized_names != "")
+        return np.where(found, self.pageids[positions], self.UNRESOLVED)
@@ -0,0 +1,97 @@
+import numpy as np
+from pandas import DataFrame
+
+
+class LinkGraph:
+    """
+    Directed graph of links between Wikipedia pages, stored in compressed sparse row (CSR) form.
+
+    Pages are identified by integer node ids, which index titles. The out-links of node i are
+    indices[indptr[i]:indptr[i + 1]], so the whole graph takes two NumPy arrays instead of one
+    Python list of title strings per page.
+    """
+
+    def __init__(
+        self,
+        *,
+        titles: list[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        expanded: np.ndarray = None,
+    ):
+        """
+        Constructor for the LinkGraph class.
+
+        Parameters:
+        - titles: The page title of each node id.
+        - indptr: int64 array of len(titles) + 1 offsets into indices.
+        - indices: int32 array of the target node id of each link, grouped by source node.
+        - expanded: bool array telling which nodes had their links fetched. Nodes left on the
+          frontier of a crawl have no out-links (default is every node expanded).
+        """
+        if len(indptr) != len(titles) + 1:
+            raise ValueError("indptr must have one more element than titles")
+        if indptr[-1] != len(indices):
+            raise ValueError("The last element of indptr must be the number of links")
+
+        self.titles = list(titles)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.expanded = np.ones(len(titles), dtype=bool) if expanded is None else np.asarray(expanded, dtype=bool)
+        self._node_ids = None
+
+    @classmethod
+    def from_adjacency(cls, titles: list[str], adjacency: list, expanded: np.ndarray = None) -> "LinkGraph":
+        """
+        Build a graph from the array of target node ids of each node.
+        """
+        degrees = np.fromiter((len(targets) for targets in adjacency), dtype=np.int64, count=len(adjacency))
+        indptr = np.zeros(len(adjacency) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = (
+            np.concatenate([np.asarray(targets, dtype=np.int32) for targets in adjacency])
+            if len(adjacency) else np.empty(0, dtype=np.int32)
+        )
+        return cls(titles=titles, indptr=indptr, indices=indices, expanded=expanded)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @property
+    def n_links(self) -> int:
+        """
+        Number of links between the nodes of the graph.
+        """
+        return len(self.indices)
+
+    def node_id(self, title: str) -> int:
+        """
+        Node id of a page title. Raises a KeyError if the page is not in the graph.
+        """
+        if self._node_ids is None:
+            self._node_ids = {title: node_id for node_id, title in enumerate(self.titles)}
+        return self._node_ids[title]
+
+    def out_degrees(self) -> np.ndarray:
+        """
+        Number of out-links of every node.
+        """
+        return np.diff(self.indptr)
+
+    def neighbors(self, title: str) -> list[str]:
+        """
+        Titles of the pages a page links to, within the graph.
+        """
+        node_id = self.node_id(title)
+        return [self.titles[target] for target in self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]]
+
+    def edges(self) -> DataFrame:
+        """
+        DataFrame of every link as a pair of source and target node ids.
+        """
+        return DataFrame(
+            {
+                "source": np.repeat(np.arange(len(self), dtype=np.int32), self.out_degrees()),
+                "target": self.indices,
+            }
+        )
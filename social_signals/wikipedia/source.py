@@ -1,9 +1,20 @@
 import wikipedia
-from pandas import DataFrame
+from pandas import DataFrame, concat
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import numpy as np
 from numpy import nan as NUMPY_NAN
 import warnings
 
+from social_signals.common.checkpoint import CheckpointStore
+from social_signals.common.instrumentation import Instrumentation, bind, record, traced
+from social_signals.utils.rate_limit import TokenBucket
+from social_signals.wikipedia.api import MediaWikiClient
+from social_signals.wikipedia.cache import WikipediaPageCache
+from social_signals.wikipedia.graph import LinkGraph
+
 
 class WikipediaSource:
     WIKIPEDIA_COLUMNS = [
@@ -15,6 +26,10 @@ class WikipediaSource:
         "references",
         "content",
     ]
+    # Columns loaded lazily by the wikipedia library, each with its own request(s)
+    LAZY_COLUMNS = ["categories", "links", "references", "content"]
+    # Pages have no timestamp to order them by
+    TIMESTAMP_COLUMN = None
 
     def __init__(
         self,
@@ -22,6 +37,12 @@ class WikipediaSource:
         lang: str = "en",
         rate_limit: bool = True,
         min_wait=timedelta(milliseconds=50),
+        max_workers: int = 1,
+        rate_limiter: TokenBucket = None,
+        api_url: str = None,
+        cache: WikipediaPageCache = None,
+        fields: list[str] = None,
+        instrumentation: Instrumentation = None,
     ):
         """
         Constructor for the WikipediaSource class.
@@ -30,13 +51,98 @@ class WikipediaSource:
         - lang: Language code for Wikipedia language edition (default is English 'en').
         - rate_limit: Whether to apply rate limiting to Wikipedia API requests (default is True).
         - min_wait: Minimum time to wait between Wikipedia API requests (default is 50 milliseconds).
+        - max_workers: Number of pages fetched concurrently (default is 1).
+        - rate_limiter: Token bucket shared by every request, which can also be shared with other
+          sources (default is a bucket allowing one request per min_wait). Batched fetches take a
+          token per request. Single page fetches go through the wikipedia library, and take a token
+          per page load and per lazily loaded property: the continuation and redirect requests the
+          library sends on its own are paced by its process-wide limiter, which rate_limit turns on
+          with min_wait (see wikipedia.set_rate_limiting). For a single rate over every request,
+          use get_wikipedia_pages_data(batch_size=...).
+        - api_url: URL of the MediaWiki api.php endpoint used by batched fetches (default is the Wikipedia API of lang).
+        - cache: Optional persistent cache of page records and search results. When set, every page is
+          fetched with batched API requests, and cached pages are only downloaded again if their
+          revision changed (default is None, no caching).
+        - fields: The WIKIPEDIA_COLUMNS to fetch and store. Properties outside of it are never
+          downloaded, and data only has these columns (default is all WIKIPEDIA_COLUMNS).
+        - instrumentation: Receives a span per public call, with HTTP requests, bytes received, cache
+          hits, rate limit waits and rows (default is no hooks). Single page fetches count one
+          request per page load and lazily loaded property, without the library's own follow-ups.
         """
-        # Initialize an empty DataFrame to store Wikipedia page data
-        self.data = DataFrame(columns=self.WIKIPEDIA_COLUMNS)
-        # Configure rate limiting and language for Wikipedia API requests
-        wikipedia.set_rate_limiting(rate_limit=rate_limit, min_wait=min_wait)
+        self.instrumentation = instrumentation or Instrumentation()
+        self.fields = self._resolve_fields(fields, self.WIKIPEDIA_COLUMNS)
+
+        # Initialize an empty DataFrame to store Wikipedia page data. New pages are collected
+        # in a columnar buffer and only added to the DataFrame when data is read
+        self._data = DataFrame(columns=self.fields)
+        self._buffer = {col: [] for col in self.fields}
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+
+        # Rate limit with a token bucket shared by all workers, and the library's own limiter for
+        # the requests it sends itself. The latter is a process-wide setting of every user of the
+        # library, so it is only ever turned on here, never off
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = rate_limiter or TokenBucket(rate=1 / min_wait.total_seconds())
+            wikipedia.set_rate_limiting(rate_limit=True, min_wait=min_wait)
         wikipedia.set_lang(lang)
+        self.lang = lang
+        self.cache = cache
+
+        # Client for batched fetches, sharing the same rate limiter
+        self.api = MediaWikiClient(lang=lang, api_url=api_url, rate_limiter=self.rate_limiter)
+
+    @property
+    def data(self) -> DataFrame:
+        """
+        DataFrame of the Wikipedia page data retrieved so far, one row per page.
+        """
+        if self._buffer[self.fields[0]]:
+            new_data = DataFrame(self._buffer, columns=self.fields)
+            if self._data.empty:
+                self._data = new_data
+            else:
+                self._data = concat([self._data, new_data], ignore_index=True)
+            self._buffer = {col: [] for col in self.fields}
+        return self._data
+
+    @data.setter
+    def data(self, value: DataFrame) -> None:
+        self._data = value
+        self._buffer = {col: [] for col in self.fields}
+
+    def _append_page_data(self, page_data: list) -> None:
+        # Appending to lists is amortized O(1), unlike growing the DataFrame row by row
+        for col, value in zip(self.fields, page_data):
+            self._buffer[col].append(value)
+        record("rows")
+
+    @staticmethod
+    def _resolve_fields(fields, allowed_fields: list[str]) -> list[str]:
+        """
+        Validates a field selection and returns it in WIKIPEDIA_COLUMNS order.
+        """
+        if fields is None:
+            return list(allowed_fields)
+
+        unknown_fields = set(fields) - set(allowed_fields)
+        if unknown_fields:
+            raise ValueError(f"Unknown or unavailable fields {sorted(unknown_fields)}. Valid fields are {allowed_fields}")
+        if not fields:
+            raise ValueError("At least one field is required")
 
+        return [col for col in allowed_fields if col in fields]
+
+    def _wait_for_rate_limit(self) -> None:
+        # Called before every page load and lazy property access of the wikipedia library, which
+        # does not expose its responses, nor the continuation and redirect requests it sends itself
+        record("http_requests")
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    @traced("wikipedia.search")
     def search(self, search_term: str, n_pages: int = 100) -> list[str]:
         """
         Search Wikipedia for page names related to a given search term.
@@ -48,10 +154,22 @@ class WikipediaSource:
         Returns:
         A list of Wikipedia page names related to the search term.
         """
+        if self.cache is not None:
+            search_results = self.cache.get_search(self.lang, search_term, n_pages)
+            if search_results is not None:
+                record("cache_hits")
+                return search_results
+            record("cache_misses")
+
         # Perform a Wikipedia search and get a list of related page names
+        self._wait_for_rate_limit()
         search_results = wikipedia.search(search_term, results=n_pages)
 
+        if self.cache is not None and search_results:
+            self.cache.put_search(self.lang, search_term, n_pages, search_results)
+
         if len(search_results) == 0:
+            self._wait_for_rate_limit()
             warnings.warn(
                 f"0 search results found. Did you mean {wikipedia.suggest(search_term)}?",
                 category=UserWarning,
@@ -59,8 +177,9 @@ class WikipediaSource:
 
         return search_results
 
+    @traced("wikipedia.get_wikipedia_page_data")
     def get_wikipedia_page_data(
-        self, page_name: str, auto_suggest: bool = False
+        self, page_name: str, auto_suggest: bool = False, fields: list[str] = None
     ) -> None:
         """
         Retrieve data for a single Wikipedia page and add it to the DataFrame.
@@ -68,19 +187,48 @@ class WikipediaSource:
         Parameters:
         - page_name: The name of the Wikipedia page.
         - auto_suggest: Whether to automatically suggest alternative page names (default is False).
+          Ignored when the source has a cache, since cached pages are fetched by exact title.
+        - fields: The fields to fetch for this call, among the source's fields. The others are left
+          empty (default is the fields given to the constructor).
+        """
+        fields = self._resolve_fields(fields, self.fields)
+
+        if self.cache is not None:
+            for page_data in self._iter_pages_data_batched([page_name], max_workers=1, batch_size=1, fields=fields):
+                self._append_page_data(page_data)
+            return
+
+        page_data = self._fetch_page_data(page_name, auto_suggest=auto_suggest, fields=fields)
+        if page_data is not None:
+            self._append_page_data(page_data)
+
+    def _fetch_page_data(self, page_name: str, auto_suggest: bool = False, fields: list[str] = None):
+        """
+        Fetch the values of the source's fields for a single Wikipedia page.
+
+        Only the properties in fields are accessed, so the lazy ones outside of it are never
+        downloaded. Returns None, with a warning, if the page name is ambiguous. Safe to call
+        from several threads.
         """
+        fields = fields or self.fields
         try:
+            self._wait_for_rate_limit()
             page = wikipedia.page(page_name, auto_suggest=auto_suggest)
 
-            # Extract data for each specified column and add it to the DataFrame
+            # Extract data for each specified column
             page_data = []
-            for col in self.WIKIPEDIA_COLUMNS:
+            for col in self.fields:
+                if col not in fields:
+                    page_data.append(NUMPY_NAN)
+                    continue
+                if col in self.LAZY_COLUMNS:
+                    self._wait_for_rate_limit()
                 try:
                     page_data.append(getattr(page, col))
                 except:
                     page_data.append(NUMPY_NAN)  # if page has no col data, insert None
 
-            self.data.loc[len(self.data)] = page_data
+            return page_data
         except wikipedia.exceptions.DisambiguationError as error:
             # Handle disambiguation errors (when the search term is ambiguous)
             warning_msg = (
@@ -88,18 +236,323 @@ class WikipediaSource:
                 "Change the search term to something more specific. Skipped."
             )
             warnings.warn(warning_msg, category=UserWarning)
+            return None
 
-    def get_related_wikipedia_pages_data(self, search_term: str, n_pages: int) -> None:
+    @traced("wikipedia.get_related_wikipedia_pages_data")
+    def get_related_wikipedia_pages_data(
+        self,
+        search_term: str,
+        n_pages: int,
+        max_workers: int = None,
+        batch_size: int = None,
+        fields: list[str] = None,
+    ) -> None:
         """
         Retrieve data from multiple related Wikipedia pages and add them to the DataFrame.
 
         Parameters:
         - search_term: The search term to query on Wikipedia.
         - n_pages: The number of related pages to retrieve and add to the DataFrame.
+        - max_workers: Number of pages (or batches) fetched concurrently (default is the max_workers given to the constructor).
+        - batch_size: If set, fetch this many pages per MediaWiki API request (see get_wikipedia_pages_data).
+        - fields: The fields to fetch for this call, among the source's fields (default is the fields given to the constructor).
         """
         # Get a list of Wikipedia page names related to the search term
         related_pages = self.search(search_term, n_pages)
 
         # Retrieve and add data for each related Wikipedia page to the DataFrame
-        for page in related_pages:
-            self.get_wikipedia_page_data(page)
+        self.get_wikipedia_pages_data(related_pages, max_workers=max_workers, batch_size=batch_size, fields=fields)
+
+    @traced("wikipedia.get_wikipedia_pages_data")
+    def get_wikipedia_pages_data(
+        self,
+        page_names: list[str],
+        max_workers: int = None,
+        batch_size: int = None,
+        fields: list[str] = None,
+    ) -> None:
+        """
+        Retrieve data for several Wikipedia pages concurrently and add them to the DataFrame.
+
+        All workers share the source's rate limiter, and pages are added in the order of page_names.
+
+        Parameters:
+        - page_names: The names of the Wikipedia pages.
+        - max_workers: Number of pages (or batches) fetched concurrently (default is the max_workers given to the constructor).
+        - batch_size: If set, fetch this many pages per MediaWiki API request, with all columns combined,
+          instead of loading each page and property separately (at most MediaWikiClient.MAX_TITLES).
+          The API returns one whole-article extract per request, so content still costs a request per page.
+        - fields: The fields to fetch for this call, among the source's fields (default is the fields given to the constructor).
+        """
+        for page_data in self._iter_pages_data(page_names, max_workers, batch_size, fields):
+            self._append_page_data(page_data)
+
+    def fetch(self, query: dict):
+        """
+        Fetch Wikipedia pages as a stream of DataFrames, without adding them to the source's DataFrame.
+
+        Parameters:
+        - query: Either page_names, or a search_term and optional n_pages (default is 100), plus any of
+          the max_workers, batch_size and fields arguments of get_wikipedia_pages_data.
+
+        Returns:
+        An iterator of DataFrames of at most MediaWikiClient.MAX_TITLES pages each, in page order.
+        """
+        query = dict(query)
+        page_names = query.pop("page_names", None)
+        if page_names is None:
+            page_names = self.search(query.pop("search_term"), query.pop("n_pages", 100))
+
+        pages_data = self._iter_pages_data(page_names, **query)
+        while True:
+            rows = list(islice(pages_data, MediaWikiClient.MAX_TITLES))
+            if not rows:
+                return
+            record("rows", len(rows))
+            yield DataFrame(rows, columns=self.fields)
+
+    @traced("wikipedia.harvest_to")
+    def harvest_to(self, sink, query: dict, *, checkpoint: CheckpointStore, job: str, source_name: str = "wikipedia") -> int:
+        """
+        Fetch Wikipedia pages into a sink, checkpointing them so that an interrupted harvest resumes where it stopped.
+
+        Pages are fetched in batches of MediaWikiClient.MAX_TITLES. Each batch is flushed to the
+        sink, then its pages are marked as completed, so only one batch is ever held in memory
+        and a resumed harvest only fetches the pages that were not completed yet.
+
+        Parameters:
+        - sink: The PartitionedSink the pages are written to, in the partition of the current date.
+        - query: The query, as for fetch: page_names, or a search_term and optional n_pages (default is 100),
+          plus any of the max_workers, batch_size and fields arguments of get_wikipedia_pages_data.
+        - checkpoint: The store of the progress of the harvest. The results of a search are stored
+          as well, so that a resumed harvest fetches the same pages.
+        - job: Name of the harvest in checkpoint. Reusing it resumes the harvest.
+        - source_name: Source name of the pages in the sink (default is 'wikipedia').
+
+        Returns:
+        The number of pages written by this run.
+        """
+        query = dict(query)
+        page_names = query.pop("page_names", None)
+        search_term = query.pop("search_term", None)
+        n_pages = query.pop("n_pages", 100)
+        if page_names is None:
+            page_names = checkpoint.get_cursor(job)
+            if page_names is None:
+                page_names = self.search(search_term, n_pages)
+                checkpoint.put_cursor(job, page_names)
+
+        completed = checkpoint.completed(job)
+        pending = [page_name for page_name in dict.fromkeys(page_names) if page_name not in completed]
+
+        n_written = 0
+        for start in range(0, len(pending), MediaWikiClient.MAX_TITLES):
+            batch = pending[start:start + MediaWikiClient.MAX_TITLES]
+            rows = list(self._iter_pages_data(batch, **query))
+            if rows:
+                n_written += sink.write(source_name, DataFrame(rows, columns=self.fields))
+                sink.flush()
+            # Skipped pages, missing or ambiguous, are completed as well
+            checkpoint.mark_completed(job, batch)
+            record("rows", len(rows))
+        return n_written
+
+    def _iter_pages_data(
+        self,
+        page_names: list[str],
+        max_workers: int = None,
+        batch_size: int = None,
+        fields: list[str] = None,
+    ):
+        """
+        Fetch the rows of several Wikipedia pages, in the order of page_names, skipping the unusable pages.
+        """
+        max_workers = max_workers or self.max_workers
+        fields = self._resolve_fields(fields, self.fields)
+        if batch_size is None and self.cache is not None:
+            batch_size = MediaWikiClient.MAX_TITLES
+
+        if batch_size is not None:
+            yield from self._iter_pages_data_batched(page_names, max_workers, batch_size, fields=fields)
+            return
+
+        fetch_page_data = partial(self._fetch_page_data, fields=fields)
+        if max_workers == 1:
+            pages_data = map(fetch_page_data, page_names)
+            yield from (page_data for page_data in pages_data if page_data is not None)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for page_data in executor.map(bind(fetch_page_data), page_names):
+                if page_data is not None:
+                    yield page_data
+
+    def _iter_pages_data_batched(
+        self, page_names: list[str], max_workers: int, batch_size: int, fields: list[str] = None
+    ):
+        """
+        Fetch the rows of several Wikipedia pages with batched MediaWiki API requests.
+        """
+        if not 1 <= batch_size <= MediaWikiClient.MAX_TITLES:
+            raise ValueError(f"batch_size must be between 1 and {MediaWikiClient.MAX_TITLES}")
+
+        batches = [page_names[start:start + batch_size] for start in range(0, len(page_names), batch_size)]
+
+        fields = fields or self.fields
+        fetch_page_records = bind(partial(self._fetch_page_records, fields=fields))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for records in executor.map(fetch_page_records, batches):
+                for row in records:
+                    page_data = self._record_page_data(row, fields)
+                    if page_data is not None:
+                        yield page_data
+
+    def _fetch_page_records(self, titles: list[str], fields: list[str]) -> list[dict]:
+        """
+        Fetch MediaWikiClient page records with the given fields, going through the cache when there is one.
+
+        Cached pages are revalidated with a single batched revision id check, and only the
+        pages that are not cached, cached without some of the fields, or whose revision changed
+        are downloaded.
+        """
+        if self.cache is None:
+            return self.api.get_pages(titles, fields)
+
+        cached = {
+            title: cached_page
+            for title, cached_page in self.cache.get_pages(self.lang, titles).items()
+            if all(col in cached_page[1] for col in fields)
+        }
+        records = {
+            title: row for title, (_, row, needs_revalidation) in cached.items() if not needs_revalidation
+        }
+
+        # Keep the cached pages whose last revision is still the cached one
+        to_revalidate = [title for title, (_, _, needs_revalidation) in cached.items() if needs_revalidation]
+        if to_revalidate:
+            unchanged = [
+                current["requested_title"]
+                for current in self.api.get_pages(to_revalidate, ["revid"])
+                if not current["missing"] and current["revid"] == cached[current["requested_title"]][0]
+            ]
+            self.cache.mark_validated(self.lang, unchanged)
+            records.update({title: cached[title][1] for title in unchanged})
+
+        to_fetch = [title for title in dict.fromkeys(titles) if title not in records]
+        record("cache_hits", len(records))
+        record("cache_misses", len(to_fetch))
+        if to_fetch:
+            fetched = self.api.get_pages(to_fetch, fields + ["revid"])
+            self.cache.put_pages(
+                self.lang,
+                {row["requested_title"]: (row["revid"], row) for row in fetched if not row["missing"]},
+            )
+            records.update({row["requested_title"]: row for row in fetched})
+
+        return [records[title] for title in titles]
+
+    def _record_page_data(self, row: dict, fields: list[str] = None):
+        """
+        Turn a MediaWikiClient page record into page data, or warn and return None if the page is unusable.
+
+        Columns outside of fields are left empty, even if a cached record has them.
+        """
+        fields = fields or self.fields
+        if row["missing"]:
+            warnings.warn(
+                f'Page "{row["requested_title"]}" does not exist. Skipped.',
+                category=UserWarning,
+            )
+            return None
+        if row["disambiguation"]:
+            warning_msg = (
+                f'Search term "{row["requested_title"]}" is ambiguous and has multiple pages related to it. '
+                "Change the search term to something more specific. Skipped."
+            )
+            warnings.warn(warning_msg, category=UserWarning)
+            return None
+
+        return [
+            NUMPY_NAN if col not in fields or row.get(col) is None else row[col]  # if page has no col data, insert None
+            for col in self.fields
+        ]
+
+    @traced("wikipedia.crawl_link_graph")
+    def crawl_link_graph(
+        self,
+        seeds: list[str] = None,
+        search_term: str = None,
+        n_pages: int = 100,
+        max_depth: int = 2,
+        max_nodes: int = 10000,
+        max_workers: int = None,
+        batch_size: int = MediaWikiClient.MAX_TITLES,
+    ) -> LinkGraph:
+        """
+        Crawl the links between Wikipedia pages breadth-first, starting from seed pages.
+
+        Each level of the crawl is fetched with batched MediaWiki API requests, several batches at
+        a time, all sharing the source's rate limiter (and cache, if any). Page data is not added
+        to the DataFrame.
+
+        Parameters:
+        - seeds: The titles of the pages to start from.
+        - search_term: If set, also start from the pages returned by searching this term.
+        - n_pages: The number of search results to start from (default is 100).
+        - max_depth: How many links away from the seeds to crawl (default is 2). The links of the
+          pages at max_depth are not fetched, and the graph marks them as not expanded.
+        - max_nodes: Maximum number of pages in the graph. Links to further pages are dropped (default is 10000).
+        - max_workers: Number of batches fetched concurrently (default is the max_workers given to the constructor).
+        - batch_size: Number of pages per API request (default is MediaWikiClient.MAX_TITLES).
+
+        Returns:
+        A LinkGraph of the crawled pages and of the links between them.
+        """
+        max_workers = max_workers or self.max_workers
+        if not 1 <= batch_size <= MediaWikiClient.MAX_TITLES:
+            raise ValueError(f"batch_size must be between 1 and {MediaWikiClient.MAX_TITLES}")
+
+        seeds = list(seeds or [])
+        if search_term is not None:
+            seeds.extend(self.search(search_term, n_pages))
+        if not seeds:
+            raise ValueError("Either seeds or a search_term with results is required")
+
+        # Titles are mapped to node ids as they are discovered, which also dedupes the frontier
+        node_ids = {}
+        titles = []
+        adjacency = []
+        for title in seeds:
+            if title not in node_ids and len(titles) < max_nodes:
+                node_ids[title] = len(titles)
+                titles.append(title)
+                adjacency.append(None)
+
+        frontier = list(titles)
+        fetch_page_records = bind(partial(self._fetch_page_records, fields=["title", "links"]))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in range(max_depth):
+                if not frontier:
+                    break
+                batches = [frontier[start:start + batch_size] for start in range(0, len(frontier), batch_size)]
+
+                next_frontier = []
+                for records in executor.map(fetch_page_records, batches):
+                    for row in records:
+                        targets = []
+                        for link in row.get("links") or []:
+                            if link not in node_ids:
+                                if len(titles) >= max_nodes:
+                                    continue
+                                node_ids[link] = len(titles)
+                                titles.append(link)
+                                adjacency.append(None)
+                                next_frontier.append(link)
+                            targets.append(node_ids[link])
+                        adjacency[node_ids[row["requested_title"]]] = np.unique(np.asarray(targets, dtype=np.int32))
+                frontier = next_frontier
+
+        # Pages left on the frontier were not fetched, and have no out-links
+        expanded = np.array([targets is not None for targets in adjacency], dtype=bool)
+        adjacency = [np.empty(0, dtype=np.int32) if targets is None else targets for targets in adjacency]
+        return LinkGraph.from_adjacency(titles, adjacency, expanded=expanded)
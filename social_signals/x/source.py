@@ -1,6 +1,22 @@
+import queue
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from social_signals.common.checkpoint import CheckpointStore
+from social_signals.common.errors import XAPIError
+from social_signals.common.instrumentation import Instrumentation, bind, record, traced
+from social_signals.utils.rate_limit import RateLimitWindow
+from social_signals.x.state import XWatermarkStore
+
 class XSource:
     TWEET_COLUMNS = [
         "tweet_id",
@@ -13,20 +29,72 @@ class XSource:
         "author_created_at",
         "author_public_metrics"        
     ]
+    # Public metrics flattened into their own columns by typed parsing
+    TWEET_METRICS = ["retweet_count", "reply_count", "like_count", "quote_count", "bookmark_count", "impression_count"]
+    AUTHOR_METRICS = ["followers_count", "following_count", "tweet_count", "listed_count", "like_count"]
+    TYPED_TWEET_COLUMNS = [
+        "tweet_id",
+        "tweet_created_at",
+        "tweet_text",
+        *[f"tweet_{metric}" for metric in TWEET_METRICS],
+        "author_id",
+        "author_username",
+        "author_description",
+        "author_created_at",
+        *[f"author_{metric}" for metric in AUTHOR_METRICS],
+    ]
+    # Author fields repeated for every tweet of an author
+    TYPED_CATEGORY_COLUMNS = ["author_id", "author_username", "author_description"]
     SEARCH_URL = "https://api.twitter.com/2/tweets/search/recent"
+    # Column holding the timestamp of each tweet
+    TIMESTAMP_COLUMN = "tweet_created_at"
+    # Bounds of max_results for a single page of the recent search endpoint
+    MIN_PAGE_SIZE = 10
+    MAX_PAGE_SIZE = 100
+    # Statuses worth retrying: rate limited, or a transient server error
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
 
     def __init__(
         self,
         *,
-        x_bearer_token: str
+        x_bearer_token: str,
+        session: requests.Session = None,
+        rate_limit_window: RateLimitWindow = None,
+        max_retries: int = 5,
+        backoff_factor: float = 1.0,
+        pool_maxsize: int = 10,
+        typed: bool = False,
+        instrumentation: Instrumentation = None,
     ):
         """
         Constructor for the XSource class.
 
         Parameters:
         - x_bearer_token: The bearer token for the X API.
+        - session: The requests session to use, which keeps connections alive between requests
+          (default is a new session with a pool of pool_maxsize connections).
+        - rate_limit_window: Budget of requests fed by the x-rate-limit-* response headers, which can be
+          shared with other sources using the same token (default is a window of this source only).
+        - max_retries: Number of times a rate limited or failed request is retried (default is 5).
+        - backoff_factor: Seconds to wait before the first retry, doubled for each next one (default is 1).
+        - pool_maxsize: Number of connections kept alive by the default session (default is 10).
+        - typed: Whether to return TYPED_TWEET_COLUMNS, with public metrics flattened into integer columns,
+          timestamps parsed and author fields categorical, instead of TWEET_COLUMNS (default is False).
+        - instrumentation: Receives a span per public call, with HTTP requests, bytes received, retries,
+          rate limit waits and rows (default is no hooks).
         """
+        self.instrumentation = instrumentation or Instrumentation()
         self.x_bearer_token =x_bearer_token
+        self.typed = typed
+        self.rate_limit_window = rate_limit_window or RateLimitWindow()
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+        self.session = session
     
 
     def bearer_oauth(self, r):
@@ -39,6 +107,7 @@ class XSource:
         return r
 
 
+    @traced("x.search")
     def search(self, search_term: str, start_time: str, n_results: int = 10) -> list[str]:
         """
         Get recent tweets based on a search term.
@@ -52,6 +121,236 @@ class XSource:
         A list of recent tweets related to the search term.
         """
 
+        query_params = self._search_params(search_term, start_time, n_results)
+        json_response = self._get_search_page(query_params)
+        return self._parse_response_to_dataframe(json_response)
+
+
+    def iter_search(
+        self,
+        search_term: str,
+        start_time: str,
+        end_time: str = None,
+        n_results: int = None,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: int = 1,
+        since_id: str = None,
+    ):
+        """
+        Get recent tweets based on a search term, following the pagination of the X API.
+
+        Pages are requested by a background thread, up to prefetch pages ahead of the caller, so
+        that processing a batch overlaps with downloading the next ones. The x.iter_search span
+        covers the background thread, from the first page requested to the last.
+
+        Parameters:
+        - search_term: The search term to use for the X API query.
+        - start_time: The start of the time window of the X API query.
+        - end_time: The end of the time window of the X API query (default is now).
+        - n_results: The maximum number of results to return over all pages (default is every result in the time window).
+        - page_size: The number of results requested per page, between 10 and 100 (default is 100).
+        - prefetch: The number of pages fetched ahead of the caller (default is 1).
+        - since_id: If set, only return tweets newer than this tweet id, in which case start_time may be None.
+
+        Returns:
+        An iterator of DataFrames, one per page of recent tweets related to the search term.
+        """
+        for df, _ in self._iter_search_pages(
+            search_term, start_time, end_time, n_results, page_size, prefetch, since_id
+        ):
+            if not df.empty:
+                yield df
+
+
+    def fetch(self, query: dict):
+        """
+        Get recent tweets as a stream of DataFrames, for harvesting alongside other sources.
+
+        Parameters:
+        - query: Keyword arguments of iter_search, such as search_term, start_time and n_results.
+
+        Returns:
+        An iterator of DataFrames, one per page of recent tweets.
+        """
+        yield from self.iter_search(**query)
+
+
+    @traced("x.poll")
+    def poll(
+        self,
+        search_term: str,
+        state: XWatermarkStore,
+        start_time: str = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> pd.DataFrame:
+        """
+        Get the tweets related to a search term that are newer than the previous poll of it.
+
+        The newest tweet id of each search term is kept in state, and passed as since_id so that
+        only new tweets are requested. Every page is fetched before the watermark moves, so a
+        failed poll can simply be retried, and no tweet is ever returned twice.
+
+        Parameters:
+        - search_term: The search term to use for the X API query, also the key of its watermark.
+        - state: The store of the watermark of each search term.
+        - start_time: The start date for the first poll of a search term, ignored once it has a watermark
+          (default is the X API default of the last week).
+        - page_size: The number of results requested per page, between 10 and 100 (default is 100).
+
+        Returns:
+        A DataFrame of the new tweets, newest first.
+        """
+        since_id = state.get(search_term)
+        if since_id is not None:
+            start_time = None
+
+        batches = list(self.iter_search(search_term, start_time, page_size=page_size, since_id=since_id))
+        if not batches:
+            return self._parse_response_to_dataframe({})
+        df = pd.concat(batches, ignore_index=True)
+        if self.typed:
+            # Pages have their own categories, which concat turns back into objects
+            df = df.astype({col: "category" for col in self.TYPED_CATEGORY_COLUMNS})
+
+        # Pages may overlap when tweets arrive during pagination
+        tweet_ids = df['tweet_id'].astype('int64')
+        keep = ~df['tweet_id'].duplicated()
+        if since_id is not None:
+            keep &= tweet_ids > int(since_id)
+        df = df[keep.to_numpy()].reset_index(drop=True)
+
+        if not df.empty:
+            state.put(search_term, str(tweet_ids.max()))
+        return df
+
+
+    @traced("x.harvest_to")
+    def harvest_to(self, sink, query: dict, *, checkpoint: CheckpointStore, job: str, source_name: str = "x") -> int:
+        """
+        Get recent tweets into a sink, checkpointing the pagination so that an interrupted search resumes where it stopped.
+
+        Every page is flushed to the sink before its next_token is stored in checkpoint, so only
+        the pages being fetched are held in memory, and a resumed search starts from the first
+        page that was not written yet. Next tokens expire along with the search window, so
+        resume within the time window of the query.
+
+        Parameters:
+        - sink: The PartitionedSink the tweets are written to, partitioned by the date of TIMESTAMP_COLUMN.
+        - query: Keyword arguments of iter_search, such as search_term, start_time and n_results.
+        - checkpoint: The store of the progress of the search.
+        - job: Name of the search in checkpoint. Reusing it resumes the search, and does nothing once it is complete.
+        - source_name: Source name of the tweets in the sink (default is 'x').
+
+        Returns:
+        The number of tweets written by this run.
+        """
+        query = dict(query)
+        next_token = None
+        cursor = checkpoint.get_cursor(job)
+        if cursor is not None:
+            if cursor['next_token'] is None:
+                return 0
+            next_token = cursor['next_token']
+            query['n_results'] = cursor['remaining']
+
+        n_written = 0
+        for df, cursor in self._iter_search_pages(**query, next_token=next_token):
+            if not df.empty:
+                n_written += sink.write(source_name, df, timestamp_column=self.TIMESTAMP_COLUMN)
+                sink.flush()
+            checkpoint.put_cursor(job, cursor)
+        return n_written
+
+
+    def _iter_search_pages(
+        self,
+        search_term: str,
+        start_time: str,
+        end_time: str = None,
+        n_results: int = None,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: int = 1,
+        since_id: str = None,
+        next_token: str = None,
+    ):
+        """
+        Get the pages of a search, each with the pagination cursor that resumes the search after it.
+
+        Yields (DataFrame, cursor) tuples, where cursor is a dict of the next_token of the next page
+        (None after the last page) and of the number of results still to return (None when unbounded).
+        Empty pages are yielded as well, since they move the cursor.
+        """
+        if not self.MIN_PAGE_SIZE <= page_size <= self.MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between {self.MIN_PAGE_SIZE} and {self.MAX_PAGE_SIZE}")
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            # Give up once the caller stopped iterating, rather than blocking on a full queue forever
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch_pages() -> None:
+            with self.instrumentation.span("x.iter_search", search_term=search_term):
+                fetch_all_pages()
+
+        def fetch_all_pages() -> None:
+            try:
+                remaining = n_results
+                token = next_token
+                while remaining is None or remaining > 0:
+                    max_results = page_size if remaining is None else max(self.MIN_PAGE_SIZE, min(page_size, remaining))
+                    query_params = self._search_params(search_term, start_time, max_results)
+                    if end_time is not None:
+                        query_params['end_time'] = end_time
+                    if since_id is not None:
+                        query_params['since_id'] = since_id
+                    if token is not None:
+                        query_params['next_token'] = token
+
+                    json_response = self._get_search_page(query_params)
+                    df = self._parse_response_to_dataframe(json_response)
+                    if remaining is not None:
+                        df = df.iloc[:remaining]
+                        remaining -= len(df)
+                    record("rows", len(df))
+
+                    token = json_response.get('meta', {}).get('next_token')
+                    if not put((df, {'next_token': token, 'remaining': remaining})):
+                        return
+                    if token is None:
+                        break
+            except Exception as error:
+                put(error)
+                return
+            put(done)
+
+        # The span of the background thread is a child of the caller's span
+        thread = threading.Thread(target=bind(fetch_pages), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+
+    def _search_params(self, search_term: str, start_time: str, n_results: int) -> dict:
         query_params = {
             'query': f'{search_term}', 
             'start_time': start_time, 
@@ -60,17 +359,53 @@ class XSource:
             'expansions': 'author_id',
             'user.fields': 'id,name,username,description,created_at,public_metrics'
         }
+        if start_time is None:
+            del query_params['start_time']
+        return query_params
 
-        response = requests.get(self.SEARCH_URL, auth=self.bearer_oauth, params=query_params)
 
-        if response.status_code != 200:
-            raise Exception(response.status_code, response.text)
-        
-        json_response = response.json()
-        return self._parse_response_to_dataframe(json_response)
+    def _get_search_page(self, query_params: dict) -> dict:
+        """
+        Send a search request within the rate limit window, retrying rate limited and failed requests.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limit_window.acquire()
+            response = self.session.get(self.SEARCH_URL, auth=self.bearer_oauth, params=query_params)
+            record("http_requests")
+            record("http_bytes_received", len(response.content))
+            announced_window = self._update_rate_limit_window(response)
+
+            if response.status_code == 200:
+                return orjson.loads(response.content) if orjson is not None else response.json()
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                break
+
+            # A rate limited request waits for the next window in acquire when the reset is known
+            record("http_retries")
+            if response.status_code != 429 or not announced_window:
+                backoff = self.backoff_factor * 2**attempt
+                time.sleep(backoff)
+                record("retry_backoff_s", backoff)
+
+        raise XAPIError(response.status_code, response.text)
+
+
+    def _update_rate_limit_window(self, response) -> bool:
+        remaining = response.headers.get('x-rate-limit-remaining')
+        reset_at = response.headers.get('x-rate-limit-reset')
+        if remaining is None or reset_at is None:
+            return False
+
+        # A rate limited response means no request is left, whatever the headers say
+        remaining = 0 if response.status_code == 429 else int(remaining)
+        self.rate_limit_window.update(remaining, float(reset_at))
+        return True
     
 
     def _parse_response_to_dataframe(self, json_response) -> pd.DataFrame:
+        if self.typed:
+            return self._parse_typed_response_to_dataframe(json_response)
+
         data = json_response.get('data', [])
         includes = json_response.get('includes', {}).get('users', [])
 
@@ -96,4 +431,37 @@ class XSource:
 
         # Convert the list of dictionaries into a DataFrame
         df = pd.DataFrame(rows, columns=self.TWEET_COLUMNS)
-        return df
\ No newline at end of file
+        return df
+
+
+    def _parse_typed_response_to_dataframe(self, json_response) -> pd.DataFrame:
+        # Flatten the nested metrics of every tweet and user at once, instead of row by row
+        tweets = pd.json_normalize(json_response.get('data', []))
+        users = pd.json_normalize(json_response.get('includes', {}).get('users', []))
+        tweets = tweets.reindex(columns=['id', 'created_at', 'text', 'author_id', *[f'public_metrics.{metric}' for metric in self.TWEET_METRICS]])
+        users = users.reindex(columns=['id', 'username', 'description', 'created_at', *[f'public_metrics.{metric}' for metric in self.AUTHOR_METRICS]])
+
+        # Join authors to their tweets with an index lookup
+        authors = users.drop_duplicates('id').set_index('id').reindex(tweets['author_id'].to_numpy())
+
+        df = pd.DataFrame(
+            {
+                'tweet_id': tweets['id'].astype(object).to_numpy(),
+                'tweet_created_at': pd.to_datetime(tweets['created_at'], utc=True).array,
+                'tweet_text': tweets['text'].astype(object).to_numpy(),
+                **{
+                    f'tweet_{metric}': tweets[f'public_metrics.{metric}'].astype('Int64').array
+                    for metric in self.TWEET_METRICS
+                },
+                'author_id': pd.Categorical(tweets['author_id'].to_numpy()),
+                'author_username': pd.Categorical(authors['username'].to_numpy()),
+                'author_description': pd.Categorical(authors['description'].to_numpy()),
+                'author_created_at': pd.to_datetime(authors['created_at'], utc=True).array,
+                **{
+                    f'author_{metric}': authors[f'public_metrics.{metric}'].astype('Int64').array
+                    for metric in self.AUTHOR_METRICS
+                },
+            },
+            columns=self.TYPED_TWEET_COLUMNS,
+        )
+        return df
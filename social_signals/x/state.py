@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+
+class XWatermarkStore:
+    """
+    Persistent SQLite store of the newest tweet id seen by each polled X query.
+
+    Watermarks only move forward, so that a late or repeated update can never make a poll
+    return tweets that were already emitted.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str,
+    ):
+        """
+        Constructor for the XWatermarkStore class.
+
+        Parameters:
+        - path: Path of the SQLite database file. Created if missing.
+        """
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                create table if not exists watermarks (
+                    query text primary key,
+                    since_id text not null,
+                    updated_at real not null
+                )
+                """
+            )
+
+    def get(self, query: str):
+        """
+        Read the watermark of a query.
+
+        Returns:
+        The newest tweet id seen for the query, or None if it was never polled.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "select since_id from watermarks where query = ?",
+                (query,),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, query: str, since_id: str) -> None:
+        """
+        Move the watermark of a query forward to since_id. Older ids are ignored.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "select since_id from watermarks where query = ?",
+                (query,),
+            ).fetchone()
+            # Tweet ids are snowflakes, ordered by creation time, but too long to compare as text
+            if row is not None and int(row[0]) >= int(since_id):
+                return
+            self._connection.execute(
+                "insert or replace into watermarks values (?, ?, ?)",
+                (query, str(since_id), time.time()),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("select count(*) from watermarks").fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,123 @@
+import pandas as pd
+import pytest
+from unittest.mock import patch, Mock
+
+from social_signals.common.checkpoint import CheckpointStore
+from social_signals.common.sinks import PartitionedSink
+from social_signals.gdelt.source import GDELTSource
+from social_signals.wikipedia.api import MediaWikiClient
+from social_signals.wikipedia.source import WikipediaSource
+from social_signals.x.source import XSource
+from tests.test_x import _mock_search_pages
+
+
+def test_checkpoint_store(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    checkpoint = CheckpointStore(path=path)
+    checkpoint.mark_completed("backfill", ["20231101", "20231102"])
+    checkpoint.mark_completed("backfill", ["20231102"])
+    checkpoint.put_cursor("search", {"next_token": "abc", "remaining": None})
+    checkpoint.close()
+
+    # Progress survives a restart
+    checkpoint = CheckpointStore(path=path)
+    assert checkpoint.completed("backfill") == {"20231101", "20231102"}
+    assert checkpoint.completed("other") == set()
+    assert checkpoint.get_cursor("search") == {"next_token": "abc", "remaining": None}
+
+    checkpoint.reset("backfill")
+    assert checkpoint.completed("backfill") == set()
+    assert checkpoint.get_cursor("other") is None
+
+
+@patch.object(MediaWikiClient, "MAX_TITLES", 2)
+@patch("wikipedia.page")
+def test_wikipedia_resume(mock_page, tmp_path):
+    fetched = []
+    failures = ["Go"]
+
+    def page(title, auto_suggest=False):
+        fetched.append(title)
+        if title in failures:
+            failures.remove(title)
+            raise ConnectionError("connection reset")
+        return type("Page", (), {"title": title, "url": f"https://en.wikipedia.org/wiki/{title}"})()
+    mock_page.side_effect = page
+
+    source = WikipediaSource(rate_limit=False, fields=["title", "url"])
+    checkpoint = CheckpointStore(path=str(tmp_path / "checkpoints.sqlite"))
+    sink = PartitionedSink(root=tmp_path / "sink")
+    query = {"page_names": ["Python", "Rust", "Go", "Java"]}
+
+    with pytest.raises(ConnectionError):
+        source.harvest_to(sink, query, checkpoint=checkpoint, job="languages")
+    # The first batch was flushed before the failure
+    assert sink.read("wikipedia").column("title").to_pylist() == ["Python", "Rust"]
+
+    fetched.clear()
+    assert source.harvest_to(sink, query, checkpoint=checkpoint, job="languages") == 2
+    assert fetched == ["Go", "Java"]
+    assert sink.read("wikipedia").column("title").to_pylist() == ["Python", "Rust", "Go", "Java"]
+    # Pages are not kept in memory
+    assert source.data.empty
+
+
+@patch('requests.Session.get')
+def test_x_resume(mock_get, tmp_path):
+    get_page = _mock_search_pages(3)
+    mock_get.side_effect = [get_page(None, params={"max_results": 10}), ConnectionError("connection reset")]
+
+    source = XSource(x_bearer_token="token")
+    checkpoint = CheckpointStore(path=str(tmp_path / "checkpoints.sqlite"))
+    sink = PartitionedSink(root=tmp_path / "sink")
+    query = {"search_term": "protest", "start_time": "2023-12-04T00:00:00Z", "page_size": 10}
+
+    with pytest.raises(ConnectionError):
+        source.harvest_to(sink, query, checkpoint=checkpoint, job="protest")
+    assert checkpoint.get_cursor("protest") == {"next_token": "1", "remaining": None}
+
+    # The search resumes from the stored next_token
+    mock_get.side_effect = get_page
+    assert source.harvest_to(sink, query, checkpoint=checkpoint, job="protest") == 20
+    assert [call.kwargs["params"].get("next_token") for call in mock_get.call_args_list[-2:]] == ["1", "2"]
+    assert sink.read("x").num_rows == 30
+
+    # A complete search does nothing
+    assert source.harvest_to(sink, query, checkpoint=checkpoint, job="protest") == 0
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_gdelt_resume(mock_credentials, mock_client, tmp_path):
+    queries = []
+
+    def query(query, job_config=None):
+        mock_job = Mock()
+        mock_job.total_bytes_processed = 2**20
+        if not job_config.dry_run:
+            queries.append(query)
+            if "20231102" in query and len(queries) == 2:
+                mock_job.result.side_effect = RuntimeError("query failed")
+            articles_date = "2023-11-01" if "20231101" in query else "2023-11-02"
+            mock_job.result.return_value.to_dataframe.return_value = pd.DataFrame(
+                {"gdelt_gkg_article_id": ["1"], "creation_ts": [pd.Timestamp(articles_date, tz="UTC")]}
+            )
+        return mock_job
+    mock_client().query.side_effect = query
+
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+    checkpoint = CheckpointStore(path=str(tmp_path / "checkpoints.sqlite"))
+    sink = PartitionedSink(root=tmp_path / "sink")
+
+    with pytest.raises(RuntimeError):
+        gdelt_source.harvest_to(sink, "20231101", "20231102", checkpoint=checkpoint, job="backfill", max_workers=1)
+    assert checkpoint.completed("backfill") == {"20231101"}
+
+    # Only the failed partition is queried again
+    assert gdelt_source.harvest_to(sink, "20231101", "20231102", checkpoint=checkpoint, job="backfill") == 1
+    assert len(queries) == 3 and "20231102" in queries[-1]
+    assert sink.dates("gdelt") == ["20231101", "20231102"]
+
+    # Projections always keep the timestamp the sink partitions by
+    gdelt_source.harvest_to(sink, "20231101", "20231101", checkpoint=checkpoint, job="ids", columns=["gdelt_gkg_article_id"])
+    assert "select gdelt_gkg_article_id, creation_ts" in queries[-1]
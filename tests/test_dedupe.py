@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+from social_signals.utils.dedupe import MinHashDeduplicator, URLDeduplicator, canonicalize_url, canonicalize_urls, dedupe
+
+
+def test_canonicalize_url():
+    assert canonicalize_url("HTTPS://www.Example.com:443/news/story/?utm_source=x&b=2&a=1#top") == (
+        "http://example.com/news/story?a=1&b=2"
+    )
+    assert canonicalize_url("http://example.com:8080/news?fbclid=abc") == "http://example.com:8080/news"
+    assert canonicalize_url("not a url") == "not a url"
+
+    # Whole batches are canonicalized at once, keeping their index
+    urls = pd.Series(["https://user@Example.com/a//?b=1&ref=x&a", None, "mailto:someone@example.com"], index=[3, 1, 2])
+    canonical = canonicalize_urls(urls)
+    assert list(canonical.index) == [3, 1, 2]
+    assert list(canonical) == ["http://example.com/a?a=&b=1", None, "mailto:someone@example.com"]
+
+
+def test_url_deduplicator():
+    deduplicator = URLDeduplicator(max_items=2)
+
+    duplicated = deduplicator.duplicated([
+        "https://www.example.com/a?utm_medium=social",
+        "http://example.com/a/",
+        None,
+        "https://example.com/b",
+    ])
+    assert list(duplicated) == [False, True, False, False]
+
+    # Later batches are checked against the earlier ones, within the bound of the index
+    assert list(deduplicator.duplicated(["https://example.com/b", "https://example.com/c"])) == [True, False]
+    assert len(deduplicator) == 2
+    assert list(deduplicator.duplicated(["https://example.com/a"])) == [False]
+
+
+def test_minhash_deduplicator():
+    deduplicator = MinHashDeduplicator(threshold=0.8)
+
+    duplicate_of = deduplicator.duplicate_of([
+        "Protesters gather in Wellington against the new housing bill https://t.co/abc",
+        "Completely different tweet about football results tonight",
+        "RT @news: Protesters gather in Wellington against the new housing bill https://t.co/xyz",
+        "",
+    ])
+    assert list(duplicate_of) == [-1, -1, 0, -1]
+
+    # Near-duplicates are found across batches, by item number
+    duplicate_of = deduplicator.duplicate_of([
+        "protesters gather in Wellington against the new housing bill!!",
+        "Football results tonight were completely different",
+    ])
+    assert list(duplicate_of) == [0, -1]
+    assert len(deduplicator) == 3
+
+    # Signatures are computed for the whole batch at once, in chunks
+    texts = [f"tweet number {i} about something else entirely" for i in range(50)]
+    deduplicator.CHUNK_SHINGLES = 100
+    batched = deduplicator.signatures(texts)
+    assert batched.dtype == np.uint32
+    assert (batched == np.vstack([deduplicator.signatures([text]) for text in texts])).all()
+
+    with pytest.raises(ValueError):
+        MinHashDeduplicator(num_perm=64, bands=10)
+
+
+def test_minhash_deduplicator_eviction():
+    deduplicator = MinHashDeduplicator(max_items=2)
+    texts = [
+        "The first story about the elections in the capital",
+        "A second story, about the weather over the weekend",
+        "Third story: markets rally after the central bank decision",
+    ]
+
+    assert list(deduplicator.duplicate_of(texts)) == [-1, -1, -1]
+    assert len(deduplicator) == 2
+
+    # The oldest text was forgotten, the newer ones are still found
+    assert list(deduplicator.duplicate_of(texts[::-1])) == [2, 1, -1]
+    assert list(deduplicator.duplicate_of([])) == []
+
+
+def test_minhash_deduplicator_buckets():
+    deduplicator = MinHashDeduplicator(max_items=10)
+    # Every text falls in the same buckets, as unrelated texts sharing bands do
+    deduplicator._compute_band_keys = lambda signatures: np.zeros((len(signatures), deduplicator.bands), dtype=np.uint64)
+    texts = [
+        "The first story about the elections in the capital",
+        "A second story, about the weather over the weekend",
+        "Third story: markets rally after the central bank decision",
+    ]
+
+    assert list(deduplicator.duplicate_of(texts)) == [-1, -1, -1]
+    # Older texts are still candidates, although newer ones share their buckets
+    assert list(deduplicator.duplicate_of(texts[:1])) == [0]
+
+    # Buckets only list their most recent texts
+    deduplicator = MinHashDeduplicator(max_items=10)
+    deduplicator._compute_band_keys = lambda signatures: np.zeros((len(signatures), deduplicator.bands), dtype=np.uint64)
+    deduplicator.BUCKET_SIZE = 2
+    assert list(deduplicator.duplicate_of(texts)) == [-1, -1, -1]
+    assert list(deduplicator.duplicate_of(texts[::-1])) == [2, 1, -1]
+
+
+def test_dedupe():
+    tweets = pd.DataFrame({
+        "tweet_id": ["1", "2", "3"],
+        "tweet_text": [
+            "Protesters gather in Wellington against the new housing bill",
+            "RT @news: Protesters gather in Wellington against the new housing bill",
+            "Something else",
+        ],
+    })
+
+    flagged = dedupe(tweets, "tweet_text", MinHashDeduplicator(), mode="flag")
+    assert list(flagged["is_duplicate"]) == [False, True, False]
+
+    deduplicator = MinHashDeduplicator()
+    assert list(dedupe(tweets, "tweet_text", deduplicator)["tweet_id"]) == ["1", "3"]
+    assert dedupe(tweets, "tweet_text", deduplicator).empty
+
+    with pytest.raises(ValueError):
+        dedupe(tweets, "tweet_text", deduplicator, mode="collapse")
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from unittest.mock import Mock
+
+from social_signals.gdelt.entities import explode_gkg_entities
+from social_signals.wikipedia.entity_index import EntityIndex, normalize_names
+
+PAGES = pd.DataFrame(
+    {
+        "pageid": ["1", "2", "3", "4", "5"],
+        "title": [
+            "Joe Biden",
+            "Python (programming language)",
+            "Python (genus)",
+            "Emmanuel Macron",
+            "Michael Jordan (disambiguation)",
+        ],
+        "redirects": [["Biden", "Joseph R. Biden Jr."], [], ["Python"], None, []],
+        "disambiguation": [False, False, False, False, True],
+    }
+)
+
+
+def test_normalize_names():
+    assert list(normalize_names(["Joe_Biden", " JOSÉ  Martí ", "Kim Jong-un", None])) == [
+        "joe biden", "jose marti", "kim jong un", ""
+    ]
+
+
+def test_resolve():
+    index = EntityIndex()
+    index.add_pages(PAGES)
+
+    resolved = index.resolve(["joe biden", "JOSEPH R BIDEN JR", "python", "python programming language", "emmanuel macron"])
+    # Redirects win over titles stripped of their qualifier
+    assert list(resolved) == [1, 1, 3, 2, 4]
+    # Disambiguation pages, unknown names and missing names resolve to nothing
+    assert list(index.resolve(["michael jordan disambiguation", "nobody", "", None])) == [-1] * 4
+
+    # Forms shared by several pages of the same priority become ambiguous
+    index.add_pages(pd.DataFrame({"pageid": [6], "title": ["Joseph Biden Sr."], "redirects": [["Biden"]]}))
+    assert list(index.resolve(["biden", "joe biden", "joseph biden sr"])) == [-1, 1, 6]
+    # Adding a page again changes nothing
+    n_forms = len(index)
+    index.add_pages(PAGES)
+    assert len(index) == n_forms
+
+
+def test_link_and_persist(tmp_path):
+    index = EntityIndex()
+    index.add_pages(PAGES)
+    articles_df = pd.DataFrame(
+        {
+            "gdelt_gkg_article_id": ["a", "b"],
+            "persons": ["joe biden;emmanuel macron", "john doe;joe biden"],
+        }
+    )
+    persons_df = explode_gkg_entities(articles_df, ["persons"])["persons"]
+
+    linked_df = index.link(persons_df, "person")
+    assert list(linked_df["pageid"]) == [1, 4, pd.NA, 1]
+    assert str(linked_df["pageid"].dtype) == "Int64"
+    assert "pageid" not in persons_df.columns
+
+    index.save(str(tmp_path / "entities.npz"))
+    loaded = EntityIndex.load(str(tmp_path / "entities.npz"))
+    names = np.array(["joe biden", "python", "john doe"], dtype=object)
+    assert list(loaded.resolve(names)) == list(index.resolve(names)) == [1, 3, -1]
+
+
+def test_add_wikipedia_pages():
+    client = Mock()
+    client.get_pages.return_value = [
+        {"requested_title": "Barack", "missing": False, "disambiguation": False, "pageid": "7", "title": "Barack Obama", "redirects": ["Obama"]},
+        {"requested_title": "Nowhere", "missing": True, "disambiguation": False, "pageid": None, "title": None, "redirects": None},
+    ]
+    index = EntityIndex()
+    index.add_wikipedia_pages(client, ["Barack", "Nowhere"])
+
+    client.get_pages.assert_called_once_with(["Barack", "Nowhere"], ["pageid", "title", "redirects"])
+    # The requested title that redirected is a surface form as well
+    assert list(index.resolve(["barack obama", "obama", "barack"])) == [7, 7, 7]
@@ -1,7 +1,12 @@
+from social_signals.common.source import Source
+from social_signals.gdelt.cache import GKGQueryCache
+from social_signals.gdelt.entities import GKG_LOCATION_FIELDS, explode_gkg_entities
 from social_signals.gdelt.source import GDELTSource
 
+from datetime import datetime, timezone
 from google.cloud import bigquery
 from google.oauth2 import service_account
+import os
 import pandas as pd
 import pytest
 from unittest.mock import patch, Mock
@@ -80,4 +85,353 @@ def test_get_gkg_articles_over_limit(mock_credentials, mock_client):
     # Act & Assert
     with pytest.raises(ValueError) as excinfo:
         gdelt_source.get_gkg_articles(database_name, dataset_name, data_limit_gb)
-    assert f"exceeds the limit of {data_limit_gb}" in str(excinfo.value)
\ No newline at end of file
+    assert f"exceeds the limit of {data_limit_gb}" in str(excinfo.value)
+
+
+def _mock_partition_job(query, job_config=None):
+    # Return a mock job whose result carries the partition date found in the query
+    articles_date = query.split("concat('")[1][:8]
+    mock_job = Mock(spec=bigquery.QueryJob)
+    mock_job.total_bytes_processed = 2**20
+    mock_job.result.return_value.to_dataframe.return_value = pd.DataFrame(
+        {'gdelt_gkg_article_id': [f'{articles_date}-1', f'{articles_date}-2']}
+    )
+    return mock_job
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_range(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    result = gdelt_source.get_gkg_articles_range('20231101', '20231105', max_workers=2)
+
+    # One dry run and one real query per partition, results concatenated in partition order
+    assert mock_client().query.call_count == 10
+    assert list(result['gdelt_gkg_article_id']) == [
+        f'2023110{day}-{n}' for day in range(1, 6) for n in (1, 2)
+    ]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_range_as_iterator(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    results = gdelt_source.get_gkg_articles_range('2023-10-30', '2023-11-02', as_iterator=True)
+
+    assert [articles_date for articles_date, _ in results] == ['20231030', '20231031', '20231101', '20231102']
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_range_over_limit(mock_credentials, mock_client):
+    def mock_large_partition_job(query, job_config=None):
+        mock_job = _mock_partition_job(query, job_config)
+        mock_job.total_bytes_processed = 2**29
+        return mock_job
+
+    mock_client().query.side_effect = mock_large_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    # 3 partitions of 0.5 GB each exceed a 1 GB budget, even though each partition is under it
+    with pytest.raises(ValueError) as excinfo:
+        gdelt_source.get_gkg_articles_range('20231101', '20231103', data_limit_gb=1)
+    assert "exceeds the limit of 1" in str(excinfo.value)
+
+    # Only dry runs were submitted
+    assert all(call.kwargs['job_config'].dry_run for call in mock_client().query.call_args_list)
+
+
+def test_gkg_query_cache_eviction(tmp_path):
+    articles_df = pd.DataFrame({'gdelt_gkg_article_id': [str(n) for n in range(1000)]})
+    cache = GKGQueryCache(cache_dir=tmp_path)
+
+    cache.put({'articles_date': '20231101'}, articles_df)
+    entry_bytes = cache.size()
+    cache.max_bytes = 2 * entry_bytes
+
+    cache.put({'articles_date': '20231102'}, articles_df)
+    os.utime(cache._path({'articles_date': '20231101'}), ns=(1, 1))
+    os.utime(cache._path({'articles_date': '20231102'}), ns=(2, 2))
+
+    # Reading the oldest entry makes the other one the least recently used
+    assert cache.get({'articles_date': '20231101'}) is not None
+    cache.put({'articles_date': '20231103'}, articles_df)
+
+    assert cache.size() <= cache.max_bytes
+    assert {'articles_date': '20231101'} in cache
+    assert {'articles_date': '20231102'} not in cache
+    pd.testing.assert_frame_equal(cache.get({'articles_date': '20231103'}), articles_df)
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_cache_hit(mock_credentials, mock_client, tmp_path):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(
+        credentials_path='mock_credentials_path',
+        cache=GKGQueryCache(cache_dir=tmp_path),
+    )
+
+    first_df = gdelt_source.get_gkg_articles(articles_date='20231101')
+    assert mock_client().query.call_count == 2
+
+    # Closed partitions are served from the cache, whatever the date format
+    cached_df = gdelt_source.get_gkg_articles(articles_date=datetime(2023, 11, 1))
+    assert mock_client().query.call_count == 2
+    pd.testing.assert_frame_equal(cached_df, first_df)
+
+    # The range path only queries the partitions missing from the cache
+    range_df = gdelt_source.get_gkg_articles_range('20231101', '20231102')
+    assert mock_client().query.call_count == 4
+    assert list(range_df['gdelt_gkg_article_id']) == ['20231101-1', '20231101-2', '20231102-1', '20231102-2']
+
+    # Today's partition is still open and is never cached
+    today = datetime.now(timezone.utc).strftime('%Y%m%d')
+    gdelt_source.get_gkg_articles(articles_date=today)
+    gdelt_source.get_gkg_articles(articles_date=today)
+    assert mock_client().query.call_count == 8
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_iter_gkg_articles(mock_credentials, mock_client):
+    pages = [pd.DataFrame({'gdelt_gkg_article_id': ['1', '2']}), pd.DataFrame({'gdelt_gkg_article_id': ['3']})]
+    mock_job = Mock(spec=bigquery.QueryJob)
+    mock_job.total_bytes_processed = 2**20
+    mock_job.result.return_value.to_dataframe_iterable.return_value = iter(pages)
+    mock_client().query.return_value = mock_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    result = list(gdelt_source.iter_gkg_articles(articles_date='20231101', page_size=2))
+
+    # Rows are paged by the row iterator instead of materialized with to_dataframe()
+    mock_job.result.assert_called_with(page_size=2)
+    mock_job.result.return_value.to_dataframe.assert_not_called()
+    assert result == pages
+
+    # The default date is the day of the call, not the day the module was imported
+    with patch('social_signals.gdelt.source.datetime', wraps=datetime) as mock_datetime:
+        mock_datetime.today.return_value = datetime(2031, 1, 2)
+        gdelt_source.iter_gkg_articles()
+    assert "'20310102'" in mock_client().query.call_args.args[0]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_fetch(mock_credentials, mock_client):
+    pages = [pd.DataFrame({'gdelt_gkg_article_id': ['1'], 'creation_ts': [pd.Timestamp('2023-11-01 10:00')]})]
+    mock_job = Mock(spec=bigquery.QueryJob)
+    mock_job.total_bytes_processed = 2**20
+    mock_job.result.return_value.to_dataframe_iterable.return_value = iter(pages)
+    mock_client().query.return_value = mock_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    # The Source protocol streams the same DataFrame pages as iter_gkg_articles
+    assert isinstance(gdelt_source, Source)
+    assert list(gdelt_source.fetch({'articles_date': '20231101', 'page_size': 5})) == pages
+    mock_job.result.assert_called_with(page_size=5)
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_iter_gkg_articles_from_cache(mock_credentials, mock_client, tmp_path):
+    cache = GKGQueryCache(cache_dir=tmp_path)
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path', cache=cache)
+    cache_params = gdelt_source._cache_params(
+        database_name='gdelt-bq',
+        dataset_name='gdeltv2',
+        articles_date='20231101',
+        primary_location_country='united states',
+        theme='protest',
+    )
+    cache.put(cache_params, pd.DataFrame({'gdelt_gkg_article_id': [str(n) for n in range(5)]}))
+
+    batches = list(gdelt_source.iter_gkg_articles(articles_date='20231101', page_size=2, as_arrow=True))
+
+    mock_client().query.assert_not_called()
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_multiple_pairs(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    gdelt_source.get_gkg_articles(
+        articles_date='20231101',
+        primary_location_country=['united states', 'canada'],
+        theme=['protest', 'strike'],
+    )
+
+    # A single dry run and a single query scan the partition for every pair
+    assert mock_client().query.call_count == 2
+    query = mock_client().query.call_args.args[0]
+    assert query.count('gkg_partitioned') == 1
+    assert 'matched_pairs' in query
+    assert 'unnest(@pairs) as tracked_pair' in query
+
+    # The pairs are passed as an array of structs, to both the dry run and the real run
+    for call in mock_client().query.call_args_list:
+        (pairs_parameter,) = call.kwargs['job_config'].query_parameters
+        assert pairs_parameter.name == 'pairs'
+        assert [
+            (struct.struct_values['primary_location_country'], struct.struct_values['theme'])
+            for struct in pairs_parameter.values
+        ] == [('canada', 'protest'), ('canada', 'strike'), ('united states', 'protest'), ('united states', 'strike')]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_quoted_filters(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    gdelt_source.get_gkg_articles(articles_date='20231101', primary_location_country="cote d'ivoire", theme="protest' or true --")
+    gdelt_source.get_gkg_articles(articles_date='20231101', pairs=[("cote d'ivoire", 'protest')])
+
+    # Filter values never reach the SQL, they are bound as query parameters
+    for call in mock_client().query.call_args_list:
+        assert "cote d'ivoire" not in call.args[0]
+        assert 'or true' not in call.args[0]
+    single_parameters = mock_client().query.call_args_list[0].kwargs['job_config'].query_parameters
+    assert {parameter.name: parameter.value for parameter in single_parameters} == {
+        'primary_location_country': "cote d'ivoire",
+        'theme': "protest' or true --",
+    }
+    (pairs_parameter,) = mock_client().query.call_args.kwargs['job_config'].query_parameters
+    assert pairs_parameter.values[0].struct_values == {'primary_location_country': "cote d'ivoire", 'theme': 'protest'}
+
+
+def test_resolve_pairs():
+    assert GDELTSource._resolve_pairs('united states', 'protest', None) is None
+    assert GDELTSource._resolve_pairs(['canada', 'mexico'], 'protest', None) == [
+        ('canada', 'protest'), ('mexico', 'protest')
+    ]
+    assert GDELTSource._resolve_pairs('ignored', 'ignored', [('mexico', 'strike'), ('canada', 'protest'), ('mexico', 'strike')]) == [
+        ('canada', 'protest'), ('mexico', 'strike')
+    ]
+    with pytest.raises(ValueError):
+        GDELTSource._resolve_pairs('united states', [], None)
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_articles_columns(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    gdelt_source.get_gkg_articles(articles_date='20231101', columns=['creation_ts', 'article_url'])
+
+    # The dry run is made on the projected query, which skips the unrequested large columns
+    dry_run_query = mock_client().query.call_args_list[0].args[0]
+    for source_column in ('Persons', 'Organizations', 'SocialImageEmbeds', 'SocialVideoEmbeds'):
+        assert source_column not in dry_run_query
+    for source_column in ('Documentidentifier', '`DATE`', 'Themes', 'Locations', 'SourceCollectionIdentifier'):
+        assert source_column in dry_run_query
+    assert 'select article_url, creation_ts\n' in dry_run_query
+
+
+def test_resolve_columns():
+    assert GDELTSource._resolve_columns(None) is None
+    assert GDELTSource._resolve_columns(list(reversed(GDELTSource.GKG_COLUMNS))) is None
+    assert GDELTSource._resolve_columns(['creation_ts', 'gdelt_gkg_article_id']) == ['gdelt_gkg_article_id', 'creation_ts']
+    with pytest.raises(ValueError):
+        GDELTSource._resolve_columns(['tone'])
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_article_counts(mock_credentials, mock_client):
+    mock_client().query.side_effect = _mock_partition_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    gdelt_source.get_gkg_article_counts(articles_date='20231101', group_by=['hour', 'theme'])
+
+    # The dry run guard runs on the aggregated query, which only reads what the groups need
+    assert mock_client().query.call_args_list[0].kwargs['job_config'].dry_run
+    query = mock_client().query.call_args.args[0]
+    assert 'timestamp_trunc(creation_ts, hour) as creation_hour' in query
+    assert 'cross join unnest(split(themes, \';\')) as theme' in query
+    assert 'group by creation_hour, theme' in query
+    assert 'Persons' not in query and 'Documentidentifier' not in query
+
+    # The default date is the day of the call, not the day the module was imported
+    with patch('social_signals.gdelt.source.datetime', wraps=datetime) as mock_datetime:
+        mock_datetime.today.return_value = datetime(2031, 1, 2)
+        gdelt_source.get_gkg_article_counts()
+    assert "'20310102'" in mock_client().query.call_args.args[0]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_article_counts_invalid_dimension(mock_credentials, mock_client):
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    with pytest.raises(ValueError):
+        gdelt_source.get_gkg_article_counts(articles_date='20231101', group_by='minute')
+    # Grouping by matched pair needs several pairs
+    with pytest.raises(ValueError):
+        gdelt_source.get_gkg_article_counts(articles_date='20231101', group_by='matched_pair')
+    mock_client().query.assert_not_called()
+
+
+def test_explode_gkg_entities():
+    articles_df = pd.DataFrame({
+        'gdelt_gkg_article_id': ['a', 'b', 'c'],
+        'themes': ['protest;tax_fncact;', '', None],
+        'locations': [
+            '3#portland, oregon, united states#us#usor#45.52#-122.68#1136645;1#united states#us#us#39.83#-98.58#us',
+            None,
+            '1#france#fr#fr#46#2#fr',
+        ],
+    })
+
+    entity_tables = explode_gkg_entities(articles_df)
+
+    themes_df = entity_tables['themes']
+    assert list(themes_df['gdelt_gkg_article_id']) == ['a', 'a']
+    assert list(themes_df['theme']) == ['protest', 'tax_fncact']
+    assert list(themes_df['theme_offset']) == [0, 1]
+    assert themes_df['theme'].dtype == 'category'
+
+    locations_df = entity_tables['locations']
+    assert list(locations_df.columns) == ['gdelt_gkg_article_id', 'location_offset', *GKG_LOCATION_FIELDS]
+    assert list(locations_df['gdelt_gkg_article_id']) == ['a', 'a', 'c']
+    assert list(locations_df['location_type']) == [3, 1, 1]
+    assert list(locations_df['country_code']) == ['us', 'us', 'fr']
+    assert locations_df['latitude'].dtype == 'float32'
+    assert locations_df['latitude'].iloc[0] == pytest.approx(45.52)
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_get_gkg_entity_tables(mock_credentials, mock_client):
+    mock_job = Mock(spec=bigquery.QueryJob)
+    mock_job.total_bytes_processed = 2**20
+    mock_job.result.return_value.to_dataframe.return_value = pd.DataFrame(
+        {'gdelt_gkg_article_id': ['a'], 'persons': ['jane doe;john smith']}
+    )
+    mock_client().query.return_value = mock_job
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path')
+
+    entity_tables = gdelt_source.get_gkg_entity_tables(articles_date='20231101', entities=['persons'])
+
+    # Only the requested entity column is read
+    query = mock_client().query.call_args.args[0]
+    assert 'Persons' in query and 'Organizations' not in query
+    assert list(entity_tables) == ['persons']
+    assert list(entity_tables['persons']['person']) == ['jane doe', 'john smith']
+
+    # The default date is the day of the call, not the day the module was imported
+    with patch('social_signals.gdelt.source.datetime', wraps=datetime) as mock_datetime:
+        mock_datetime.today.return_value = datetime(2031, 1, 2)
+        gdelt_source.get_gkg_entity_tables(entities=['persons'])
+    assert "'20310102'" in mock_client().query.call_args.args[0]
+
+    with pytest.raises(ValueError):
+        gdelt_source.get_gkg_entity_tables(articles_date='20231101', entities=['primary_location'])
@@ -0,0 +1,124 @@
+from social_signals.gdelt.file_source import GDELTFileSource
+from social_signals.gdelt.source import GDELTSource
+
+from datetime import datetime
+import pandas as pd
+import pytest
+from unittest.mock import patch
+import zipfile
+
+
+def _gkg_row(record_id, source_collection_id=1, themes='', locations='', persons='', date='20231101123000'):
+    fields = dict.fromkeys(GDELTFileSource.GKG_FILE_COLUMNS, '')
+    fields.update({
+        'GKGRECORDID': record_id,
+        'DATE': date,
+        'SourceCollectionIdentifier': str(source_collection_id),
+        'DocumentIdentifier': f'https://example.com/{record_id}',
+        'Themes': themes,
+        'Locations': locations,
+        'Persons': persons,
+    })
+    return '\t'.join(fields[column] for column in GDELTFileSource.GKG_FILE_COLUMNS)
+
+
+US_CITY = '3#Portland, Oregon, United States#US#USOR#45.52#-122.68#1136645'
+US_COUNTRY = '1#United States#US#US#39.83#-98.58#US'
+CANADA_STATE = '2#Ontario, Canada#CA#CA08#43.65#-79.38#CA08'
+
+ROWS = [
+    # Matches: the city outranks the country, and PROTEST is among the first 10 themes
+    _gkg_row('20231101120000-1', themes='PROTEST;TAX_FNCACT', locations=f'{US_COUNTRY};{US_CITY}', persons='Jane Doe'),
+    # Not a web article
+    _gkg_row('20231101120000-2', source_collection_id=2, themes='PROTEST', locations=US_CITY),
+    # PROTEST is the 11th theme
+    _gkg_row('20231101120000-3', themes=';'.join([f'T{n}' for n in range(10)] + ['PROTEST']), locations=US_CITY),
+    # The state outranks the US country location
+    _gkg_row('20231101120000-4', themes='STRIKE;PROTEST', locations=f'{US_COUNTRY};{CANADA_STATE}'),
+    # No locations at all
+    _gkg_row('20231101120000-5', themes='PROTEST'),
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    (tmp_path / '20231101120000.gkg.csv').write_text('\n'.join(ROWS[:3]) + '\n', encoding='utf-8')
+    with zipfile.ZipFile(tmp_path / '20231101121500.gkg.csv.zip', 'w') as archive:
+        archive.writestr('20231101121500.gkg.csv', '\n'.join(ROWS[3:]) + '\n')
+    # A file from another day
+    (tmp_path / '20231102000000.gkg.csv').write_text(ROWS[0] + '\n', encoding='utf-8')
+    return tmp_path
+
+
+def test_list_files(data_dir):
+    source = GDELTFileSource(data_dir=str(data_dir))
+
+    assert [path.split('/')[-1] for path in source.list_files('20231101')] == [
+        '20231101120000.gkg.csv', '20231101121500.gkg.csv.zip'
+    ]
+
+
+def test_list_files_from_mirror():
+    source = GDELTFileSource(data_dir='http://data.gdeltproject.org/gdeltv2/')
+
+    files = source.list_files('2023-11-01')
+    assert len(files) == 96
+    assert files[1] == 'http://data.gdeltproject.org/gdeltv2/20231101001500.gkg.csv.zip'
+
+
+def test_get_gkg_articles(data_dir):
+    source = GDELTFileSource(data_dir=str(data_dir), chunksize=2)
+
+    articles_df = source.get_gkg_articles(articles_date='20231101', primary_location_country='united states', theme='protest')
+
+    # Same schema as the BigQuery source
+    assert list(articles_df.columns) == GDELTSource.GKG_COLUMNS
+    assert list(articles_df['gdelt_gkg_article_id']) == ['20231101120000-1']
+    article = articles_df.iloc[0]
+    assert article['primary_location'] == US_CITY.lower()
+    assert article['persons'] == 'jane doe'
+    assert article['creation_ts'] == pd.Timestamp('2023-11-01 12:30:00', tz='UTC')
+    assert article['bq_partition_id'] == pd.Timestamp('2023-11-01', tz='UTC')
+
+    # The default date is the day of the call, not the day the module was imported
+    with patch('social_signals.gdelt.file_source.datetime', wraps=datetime) as mock_datetime:
+        mock_datetime.today.return_value = datetime(2023, 11, 1)
+        assert source.get_gkg_articles().equals(articles_df)
+
+
+def test_get_gkg_articles_multiple_pairs(data_dir):
+    source = GDELTFileSource(data_dir=str(data_dir))
+
+    articles_df = source.get_gkg_articles(
+        articles_date='20231101',
+        primary_location_country=['united states', 'canada'],
+        theme=['protest', 'strike'],
+        columns=['gdelt_gkg_article_id'],
+    )
+
+    assert list(articles_df.columns) == ['gdelt_gkg_article_id', 'matched_pairs']
+    assert list(articles_df['gdelt_gkg_article_id']) == ['20231101120000-1', '20231101120000-4']
+    assert articles_df['matched_pairs'].iloc[1] == [
+        {'primary_location_country': 'canada', 'theme': 'protest'},
+        {'primary_location_country': 'canada', 'theme': 'strike'},
+    ]
+
+
+def test_get_gkg_articles_no_match(data_dir):
+    source = GDELTFileSource(data_dir=str(data_dir))
+
+    articles_df = source.get_gkg_articles(articles_date='20231101', theme='election')
+
+    assert articles_df.empty
+    assert list(articles_df.columns) == GDELTSource.GKG_COLUMNS
+
+
+def test_missing_file_is_skipped(data_dir):
+    source = GDELTFileSource(data_dir=str(data_dir))
+
+    with pytest.warns(UserWarning):
+        articles_df = source.get_gkg_articles(
+            articles_date='20231101',
+            files=[str(data_dir / '20231101120000.gkg.csv'), str(data_dir / '20231101123000.gkg.csv')],
+        )
+    assert list(articles_df['gdelt_gkg_article_id']) == ['20231101120000-1']
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+from unittest.mock import patch
+
+from social_signals.common.harvester import Harvester
+from social_signals.common.source import Source
+from social_signals.wikipedia.source import WikipediaSource
+from social_signals.x.source import XSource
+
+
+class FakeSource:
+    TIMESTAMP_COLUMN = "created_at"
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, query):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if query.get("fail"):
+                raise RuntimeError("fetch failed")
+            for batch in query["batches"]:
+                yield pd.DataFrame({"created_at": batch, "value": [query["name"]] * len(batch)})
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class FakeUntimedSource(FakeSource):
+    TIMESTAMP_COLUMN = None
+
+
+def test_sources_implement_protocol():
+    assert isinstance(XSource(x_bearer_token=None), Source)
+    assert isinstance(WikipediaSource(rate_limit=False), Source)
+    assert not isinstance(object(), Source)
+
+    with pytest.raises(ValueError):
+        Harvester(sources={"other": object()})
+
+
+def test_harvest_concurrently():
+    slow, fast = FakeSource(delay=0.2), FakeSource(delay=0.2)
+    harvester = Harvester(sources={"slow": slow, "fast": fast, "pages": FakeUntimedSource(delay=0)}, concurrency={"slow": 1})
+    tasks = [
+        ("slow", {"name": "s1", "batches": [["2023-12-04T10:00:00Z"]]}),
+        ("slow", {"name": "s2", "batches": [["2023-12-04T08:00:00Z"]]}),
+        ("fast", {"name": "f1", "batches": [["2023-12-04T09:00:00Z", "2023-12-04T11:00:00Z"]]}),
+        ("fast", {"name": "f2", "batches": [["2023-12-04T07:00:00Z"], ["2023-12-04T12:00:00Z"]]}),
+        ("pages", {"name": "p1", "batches": [[None]]}),
+    ]
+
+    start = time.monotonic()
+    df = harvester.harvest(tasks)
+    elapsed = time.monotonic() - start
+
+    # The fast queries run side by side, while the slow source runs one query at a time
+    assert slow.max_running == 1
+    assert fast.max_running == 2
+    assert elapsed >= 0.4
+
+    # Records of every source are merged in timestamp order, untimed ones last
+    assert list(df["value"]) == ["f2", "s2", "f1", "s1", "f1", "f2", "p1"]
+    assert list(df["source"]) == ["fast", "slow", "fast", "slow", "fast", "fast", "pages"]
+    assert list(df["query_index"][:2]) == [3, 1]
+    assert str(df["timestamp"].dtype) == "datetime64[ns, UTC]"
+    assert df["timestamp"].isna().sum() == 1
+
+
+def test_harvest_errors():
+    harvester = Harvester(sources={"source": FakeSource(delay=0)}, max_workers=2)
+
+    with pytest.raises(RuntimeError):
+        harvester.harvest([("source", {"name": "a", "fail": True}), ("source", {"name": "b", "batches": [["2023-12-04"]]})])
+    with pytest.raises(ValueError):
+        list(harvester.iter_batches([("unknown", {})]))
+    with pytest.raises(ValueError):
+        Harvester(sources={"source": FakeSource(delay=0)}, concurrency={"source": 0})
+
+    assert harvester.harvest([]).empty
+
+
+@patch("wikipedia.page")
+def test_harvest_wikipedia(mock_page):
+    mock_page.side_effect = lambda title, auto_suggest=False: type(
+        "Page", (), {"pageid": "1", "title": title, "url": f"https://en.wikipedia.org/wiki/{title}"}
+    )()
+    source = WikipediaSource(rate_limit=False, fields=["pageid", "title", "url"])
+    harvester = Harvester(sources={"wikipedia": source})
+
+    df = harvester.harvest([("wikipedia", {"page_names": ["Python", "Rust"]})])
+
+    # Fetched pages are returned, not added to the source's own DataFrame
+    assert list(df["title"]) == ["Python", "Rust"]
+    assert df["timestamp"].isna().all()
+    assert source.data.empty
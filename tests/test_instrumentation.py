@@ -0,0 +1,154 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from unittest.mock import patch, Mock
+
+from social_signals.common.harvester import Harvester
+from social_signals.common.instrumentation import Instrumentation, LoggingHook, OpenTelemetryHook, bind, current_span, record
+from social_signals.gdelt.source import GDELTSource
+from social_signals.x.source import XSource
+from tests.test_x import _mock_search_pages
+
+
+def test_spans():
+    spans = []
+    instrumentation = Instrumentation(hooks=[spans.append])
+
+    with instrumentation.span("outer", query="protest") as outer:
+        record("http_requests")
+        with instrumentation.span("inner") as inner:
+            assert current_span() is inner
+            record("http_requests", 2)
+            record("http_bytes_received", 100)
+            # Unknown values, such as missing response sizes, are ignored
+            record("http_bytes_received", None)
+
+        # Workers of a pool record into the span that submitted them
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(bind(lambda _: record("rows")), range(8)))
+        # Plain threads start without a span
+        thread = threading.Thread(target=record, args=("rows",))
+        thread.start()
+        thread.join()
+
+    assert current_span() is None
+    assert [span.name for span in spans] == ["inner", "outer"]
+    assert inner.metrics == {"http_requests": 2, "http_bytes_received": 100}
+    # Children roll up into their parent
+    assert outer.metrics == {"http_requests": 3, "http_bytes_received": 100, "rows": 8}
+    assert outer.attributes == {"query": "protest"}
+    assert outer.duration >= inner.duration > 0
+
+    # Errors are recorded on the span before being raised again
+    with pytest.raises(ValueError):
+        with instrumentation.span("failing"):
+            raise ValueError("budget exceeded")
+    assert spans[-1].attributes["error"] == "ValueError('budget exceeded')"
+
+    # Outside of any span, recording is a no-op
+    record("rows")
+
+
+def test_hooks(caplog):
+    tracer = Mock()
+    instrumentation = Instrumentation(hooks=[LoggingHook(), OpenTelemetryHook(tracer)])
+
+    with caplog.at_level(logging.INFO, logger="social_signals"):
+        with instrumentation.span("outer"):
+            with instrumentation.span("x.search", search_term="protest", page=Mock()):
+                record("http_requests")
+
+    assert "x.search took" in caplog.text
+    assert "http_requests=1" in caplog.text
+
+    name = tracer.start_span.call_args_list[0].args[0]
+    kwargs = tracer.start_span.call_args_list[0].kwargs
+    assert name == "x.search"
+    # Only attributes OpenTelemetry can export are kept
+    assert kwargs["attributes"] == {"search_term": "protest", "social_signals.http_requests": 1, "parent_span": "outer"}
+    end_time = tracer.start_span.return_value.end.call_args_list[0].kwargs["end_time"]
+    assert end_time >= kwargs["start_time"]
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_gdelt_spans(mock_credentials, mock_client):
+    mock_job = Mock()
+    mock_job.total_bytes_processed = 2**20
+    mock_job.total_bytes_billed = 10 * 2**20
+    mock_job.result.return_value.to_dataframe.return_value = pd.DataFrame({"gdelt_gkg_article_id": ["1", "2"]})
+    mock_client().query.return_value = mock_job
+
+    spans = []
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path', instrumentation=Instrumentation(hooks=[spans.append]))
+    gdelt_source.get_gkg_articles_range("20231101", "20231102", max_workers=2)
+
+    assert [span.name for span in spans] == ["gdelt.get_gkg_articles_range"]
+    assert spans[0].metrics == {
+        "bigquery_bytes_estimated": 2 * 2**20,
+        "bigquery_bytes_processed": 2 * 2**20,
+        "bigquery_bytes_billed": 20 * 2**20,
+        "rows": 4,
+    }
+
+
+@patch('google.cloud.bigquery.Client')
+@patch('google.oauth2.service_account.Credentials.from_service_account_file', return_value=Mock())
+def test_iterator_spans(mock_credentials, mock_client):
+    mock_job = Mock()
+    mock_job.total_bytes_processed = 2**20
+    mock_job.total_bytes_billed = 10 * 2**20
+    mock_job.result.return_value.to_dataframe.return_value = pd.DataFrame({"gdelt_gkg_article_id": ["1", "2"]})
+    mock_client().query.return_value = mock_job
+
+    spans = []
+    instrumentation = Instrumentation(hooks=[spans.append])
+    gdelt_source = GDELTSource(credentials_path='mock_credentials_path', instrumentation=instrumentation)
+
+    with instrumentation.span("outer") as outer:
+        partitions = gdelt_source.get_gkg_articles_range("20231101", "20231103", max_workers=1, as_iterator=True)
+        # Only the dry runs have run, and the span stays open until the partitions are consumed
+        assert spans == []
+        assert next(partitions)[0] == "20231101"
+        assert current_span() is outer
+        list(partitions)
+
+    range_span = spans[0]
+    assert [span.name for span in spans] == ["gdelt.get_gkg_articles_range", "outer"]
+    assert range_span.parent is outer
+    # The queries run while the partitions were consumed are recorded in the method's span
+    assert range_span.metrics == {
+        "bigquery_bytes_estimated": 3 * 2**20,
+        "bigquery_bytes_processed": 3 * 2**20,
+        "bigquery_bytes_billed": 30 * 2**20,
+        "rows": 6,
+    }
+    assert outer.metrics == range_span.metrics
+
+    # An iterator closed early ends its span as well
+    pages = gdelt_source.iter_gkg_articles(articles_date='20231101', page_size=1)
+    pages.close()
+    assert spans[-1].name == "gdelt.iter_gkg_articles"
+
+
+@patch('requests.Session.get')
+def test_x_and_harvester_spans(mock_get):
+    mock_get.side_effect = _mock_search_pages(2)
+    spans = []
+    instrumentation = Instrumentation(hooks=[spans.append])
+    source = XSource(x_bearer_token="token", instrumentation=instrumentation)
+    harvester = Harvester(sources={"x": source}, instrumentation=instrumentation)
+
+    df = harvester.harvest([("x", {"search_term": "protest", "start_time": "2023-12-04T00:00:00Z"})])
+
+    # The search runs in a background thread, but its span is still a child of the harvest's
+    assert [span.name for span in spans] == ["x.iter_search", "harvest.fetch"]
+    iter_search_span, fetch_span = spans
+    assert iter_search_span.parent is fetch_span
+    assert fetch_span.attributes == {"source": "x", "query_index": 0}
+    assert fetch_span.metrics["http_requests"] == 2
+    assert fetch_span.metrics["http_bytes_received"] > 0
+    assert fetch_span.metrics["rows"] == len(df)
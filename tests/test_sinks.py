@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from social_signals.common.harvester import Harvester
+from social_signals.common.sinks import PartitionedSink
+from tests.test_harvester import FakeSource, FakeUntimedSource
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_write_and_read(tmp_path, format):
+    sink = PartitionedSink(root=tmp_path, format=format)
+    first = pd.DataFrame({"created_at": ["2023-12-04T10:00:00Z", "2023-12-05T01:00:00Z"], "value": [1, 2]})
+    second = pa.table({"created_at": ["2023-12-04T11:00:00Z"], "value": [3]})
+
+    assert sink.write("x", first, timestamp_column="created_at") == 2
+    assert sink.write("x", second, timestamp_column="created_at") == 1
+    assert sink.write("x", first.iloc[0:0], timestamp_column="created_at") == 0
+
+    # Nothing is visible until the files are finished
+    assert sink.read("x").num_rows == 0
+    sink.close()
+
+    assert sink.sources() == ["x"]
+    assert sink.dates("x") == ["20231204", "20231205"]
+    assert sorted(path.name for path in (tmp_path / "source=x").iterdir()) == ["date=2023-12-04", "date=2023-12-05"]
+
+    table = sink.read("x")
+    assert table.column("value").to_pylist() == [1, 3, 2]
+    assert sink.read("x", start_date="20231205").column("value").to_pylist() == [2]
+    assert sink.read("x", end_date="2023-12-04", columns=["value"]).column_names == ["value"]
+
+
+def test_zero_copy_read(tmp_path):
+    with PartitionedSink(root=tmp_path, format="arrow") as sink:
+        sink.write("gdelt", pa.record_batch({"creation_ts": pa.array([0, 1], pa.timestamp("s", "UTC")), "id": [1, 2]}), "creation_ts")
+
+    # Arrow IPC columns point into the mapped file instead of being read into memory
+    allocated = pa.total_allocated_bytes()
+    table = sink.read("gdelt")
+    assert pa.total_allocated_bytes() == allocated
+    assert table.column("id").to_pylist() == [1, 2]
+
+
+def test_schema_changes(tmp_path):
+    with PartitionedSink(root=tmp_path) as sink:
+        sink.write("wikipedia", pd.DataFrame({"title": ["Python"], "links": [None]}))
+        sink.write("wikipedia", pd.DataFrame({"title": ["Rust"], "links": [["Cargo", "LLVM"]]}))
+        sink.write("wikipedia", pd.DataFrame({"title": ["Go"], "links": [np.nan]}))
+
+    # Untimed records are partitioned by the date they were written
+    assert len(sink.dates("wikipedia")) == 1
+    df = sink.read("wikipedia").to_pandas()
+    assert list(df["title"]) == ["Python", "Rust", "Go"]
+    assert list(df["links"][1]) == ["Cargo", "LLVM"]
+
+    with pytest.raises(ValueError):
+        PartitionedSink(root=tmp_path, format="csv")
+
+
+def test_harvest_to(tmp_path):
+    harvester = Harvester(sources={"timed": FakeSource(delay=0), "pages": FakeUntimedSource(delay=0)})
+    tasks = [
+        ("timed", {"name": "a", "batches": [["2023-12-04T10:00:00Z"], ["2023-12-05T10:00:00Z", "2023-12-04T09:00:00Z"]]}),
+        ("pages", {"name": "p", "batches": [[None, None]]}),
+    ]
+
+    with PartitionedSink(root=tmp_path, format="arrow") as sink:
+        assert harvester.harvest_to(sink, tasks) == {"timed": 3, "pages": 2}
+
+    assert sink.dates("timed") == ["20231204", "20231205"]
+    assert sink.read("timed", end_date="20231204").column("created_at").to_pylist() == [
+        "2023-12-04T10:00:00Z", "2023-12-04T09:00:00Z"
+    ]
+    assert sink.read("pages").num_rows == 2
@@ -1,4 +1,16 @@
+import json
+import numpy as np
 import pytest
+import threading
+import time
+import wikipedia
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from unittest.mock import patch
+from social_signals.utils.rate_limit import TokenBucket
+from social_signals.wikipedia.cache import WikipediaPageCache
 from social_signals.wikipedia.source import WikipediaSource
 
 
@@ -36,3 +48,345 @@ def test_get_related_wikipedia_pages_data(source):
 
     assert not source.data.empty
     assert list(source.data.columns) == WikipediaSource.WIKIPEDIA_COLUMNS
+
+
+class FakePage:
+    def __init__(self, title):
+        self.pageid = str(abs(hash(title)) % 10**6)
+        self.title = title
+        self.url = f"https://en.wikipedia.org/wiki/{title}"
+        self.categories = ["Category"]
+        self.links = ["Link"]
+        self.references = ["https://example.com"]
+        self.content = f"{title} content"
+
+
+def _fake_page(title, auto_suggest=False):
+    # Pages take a while to load, and come back out of order
+    time.sleep(0.01 * (len(title) % 3))
+    if title == "Mercury":
+        raise wikipedia.exceptions.DisambiguationError(title, ["Mercury (planet)", "Mercury (element)"])
+    return FakePage(title)
+
+
+@patch("wikipedia.page", side_effect=_fake_page)
+def test_get_wikipedia_pages_data_concurrently(mock_page):
+    source = WikipediaSource(max_workers=4, rate_limiter=TokenBucket(rate=1000, capacity=10))
+    page_names = ["Python", "Java", "Mercury", "Rust", "Go", "Haskell"]
+
+    with pytest.warns(UserWarning):
+        source.get_wikipedia_pages_data(page_names)
+
+    # Pages are added in order, and ambiguous ones are skipped
+    assert list(source.data["title"]) == ["Python", "Java", "Rust", "Go", "Haskell"]
+    assert list(source.data.columns) == WikipediaSource.WIKIPEDIA_COLUMNS
+
+
+def test_token_bucket_shared_between_threads():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        list(executor.map(lambda _: bucket.acquire(), range(21)))
+    elapsed = time.monotonic() - start
+
+    # The first token is available immediately, the 20 others come at 100 per second
+    assert elapsed >= 0.19
+
+
+def test_library_rate_limiting():
+    wikipedia.set_rate_limiting(rate_limit=True, min_wait=timedelta(milliseconds=20))
+    try:
+        # The library's limiter is a process-wide setting, which sources never turn off
+        WikipediaSource(rate_limit=False)
+        assert wikipedia.wikipedia.RATE_LIMIT
+        assert wikipedia.wikipedia.RATE_LIMIT_MIN_WAIT == timedelta(milliseconds=20)
+
+        # But rate limited sources turn it on, to pace the requests the library sends itself
+        wikipedia.set_rate_limiting(rate_limit=False)
+        WikipediaSource(rate_limit=True, min_wait=timedelta(milliseconds=30))
+        assert wikipedia.wikipedia.RATE_LIMIT
+        assert wikipedia.wikipedia.RATE_LIMIT_MIN_WAIT == timedelta(milliseconds=30)
+    finally:
+        wikipedia.set_rate_limiting(rate_limit=False)
+
+
+@patch("wikipedia.page", side_effect=_fake_page)
+def test_data_is_materialized_lazily(mock_page):
+    source = WikipediaSource(rate_limit=False)
+
+    source.get_wikipedia_pages_data(["Python", "Java"])
+    assert len(source.data) == 2
+
+    # Later pages extend the existing DataFrame
+    source.get_wikipedia_page_data("Rust")
+    assert list(source.data["title"]) == ["Python", "Java", "Rust"]
+    assert list(source.data.index) == [0, 1, 2]
+
+    # The attribute can still be reset by callers
+    source.data = source.data.iloc[0:0]
+    source.get_wikipedia_page_data("Go")
+    assert list(source.data["title"]) == ["Go"]
+
+
+FAKE_WIKI_PAGES = {
+    "Python (programming language)": {
+        "pageid": 23862,
+        "lastrevid": 1187000001,
+        "fullurl": "https://en.wikipedia.org/wiki/Python_(programming_language)",
+        "categories": [{"ns": 14, "title": "Category:Programming languages"}],
+        "links": [{"ns": 0, "title": "Guido van Rossum"}, {"ns": 0, "title": "CPython"}],
+        "extlinks": [{"url": "//www.python.org"}],
+        "extract": "Python is a programming language.",
+    },
+    "Rust (programming language)": {
+        "pageid": 29414838,
+        "lastrevid": 1187000002,
+        "fullurl": "https://en.wikipedia.org/wiki/Rust_(programming_language)",
+        "categories": [],
+        "links": [{"ns": 0, "title": "Mozilla"}],
+        "extlinks": [{"url": "https://www.rust-lang.org"}],
+        "extract": "Rust is a programming language.",
+    },
+    "Mercury": {
+        "pageid": 19694,
+        "fullurl": "https://en.wikipedia.org/wiki/Mercury",
+        "pageprops": {"disambiguation": ""},
+    },
+}
+FAKE_WIKI_REDIRECTS = {"Python language": "Python (programming language)"}
+
+
+class CountingFakePage(FakePage):
+    accessed = []
+
+    def __getattribute__(self, name):
+        if name in WikipediaSource.WIKIPEDIA_COLUMNS:
+            CountingFakePage.accessed.append(name)
+        return super().__getattribute__(name)
+
+
+@patch("wikipedia.page", side_effect=lambda title, auto_suggest=False: CountingFakePage(title))
+def test_selective_fields(mock_page):
+    CountingFakePage.accessed = []
+    source = WikipediaSource(rate_limit=False, fields=["url", "title"])
+
+    source.get_wikipedia_pages_data(["Python", "Java"])
+
+    # Only the selected properties are loaded, in WIKIPEDIA_COLUMNS order
+    assert sorted(set(CountingFakePage.accessed)) == ["title", "url"]
+    assert list(source.data.columns) == ["title", "url"]
+
+    # A call can narrow the fields further, leaving the others empty
+    CountingFakePage.accessed = []
+    source.get_wikipedia_page_data("Rust", fields=["title"])
+    assert CountingFakePage.accessed == ["title"]
+    assert source.data.iloc[-1]["title"] == "Rust"
+    assert source.data["url"].isna().iloc[-1]
+
+    with pytest.raises(ValueError):
+        source.get_wikipedia_page_data("Rust", fields=["content"])
+    with pytest.raises(ValueError):
+        WikipediaSource(rate_limit=False, fields=["views"])
+
+
+class FakeMediaWikiHandler(BaseHTTPRequestHandler):
+    requests_received = []
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        FakeMediaWikiHandler.requests_received.append(params)
+
+        # The first response only carries the first link of each page, the continuation the rest
+        continuing = "plcontinue" in params
+        has_links = "links" in params["prop"].split("|")
+        redirects = [
+            {"from": title, "to": FAKE_WIKI_REDIRECTS[title]}
+            for title in params["titles"].split("|") if title in FAKE_WIKI_REDIRECTS
+        ]
+        pages = []
+        for index, title in enumerate(params["titles"].split("|")):
+            title = FAKE_WIKI_REDIRECTS.get(title, title)
+            if title not in FAKE_WIKI_PAGES:
+                pages.append({"title": title, "missing": True})
+                continue
+            page = dict(FAKE_WIKI_PAGES[title], title=title)
+            page["links"] = page.get("links", [])[1:] if continuing else page.get("links", [])[:1]
+            if continuing:
+                page = {key: page[key] for key in ("pageid", "title", "links")}
+            if not has_links:
+                page = {key: value for key, value in page.items() if key in ("pageid", "title", "lastrevid", "pageprops")}
+            # Like the API, only one whole-article extract is returned per request
+            if "extracts" not in params["prop"].split("|") or index > 0:
+                page.pop("extract", None)
+            elif "extract" in FAKE_WIKI_PAGES[title]:
+                page["extract"] = FAKE_WIKI_PAGES[title]["extract"]
+            pages.append(page)
+
+        json_response = {"query": {"redirects": redirects, "pages": pages}}
+        if has_links and not continuing:
+            json_response["continue"] = {"plcontinue": "23862|0|CPython", "continue": "||"}
+
+        body = json.dumps(json_response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_mediawiki():
+    FakeMediaWikiHandler.requests_received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMediaWikiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_wikipedia_pages_data_batched(fake_mediawiki):
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False)
+
+    with pytest.warns(UserWarning) as warning_records:
+        source.get_wikipedia_pages_data(
+            ["Python language", "Mercury", "Rust (programming language)", "Nope"], batch_size=50
+        )
+
+    # One request plus one continuation for the four pages, then one extract request per usable page
+    assert len(FakeMediaWikiHandler.requests_received) == 4
+    assert [params["titles"] for params in FakeMediaWikiHandler.requests_received if params["prop"] == "extracts"] == [
+        "Python (programming language)", "Rust (programming language)"
+    ]
+    assert len(warning_records) == 2
+
+    assert list(source.data.columns) == WikipediaSource.WIKIPEDIA_COLUMNS
+    assert list(source.data["title"]) == ["Python (programming language)", "Rust (programming language)"]
+    python_page = source.data.iloc[0]
+    assert python_page["pageid"] == "23862"
+    assert python_page["categories"] == ["Programming languages"]
+    assert python_page["links"] == ["Guido van Rossum", "CPython"]
+    assert python_page["references"] == ["http://www.python.org"]
+    assert python_page["content"] == "Python is a programming language."
+    # Every page gets its content, although the API only returns one extract per request
+    assert source.data.iloc[1]["content"] == "Rust is a programming language."
+
+
+def test_get_wikipedia_pages_data_batch_size(fake_mediawiki):
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, max_workers=2)
+
+    source.get_wikipedia_pages_data(["Python (programming language)", "Rust (programming language)"], batch_size=1)
+
+    # One request, one continuation and one extract request per batch, with batches added in order
+    assert len(FakeMediaWikiHandler.requests_received) == 6
+    assert list(source.data["title"]) == ["Python (programming language)", "Rust (programming language)"]
+    with pytest.raises(ValueError):
+        source.get_wikipedia_pages_data(["Python (programming language)"], batch_size=51)
+
+
+def test_page_cache_revalidates_revisions(fake_mediawiki, tmp_path, monkeypatch):
+    cache = WikipediaPageCache(path=str(tmp_path / "wikipedia.sqlite"))
+    titles = ["Python (programming language)", "Rust (programming language)"]
+
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, cache=cache)
+    source.get_wikipedia_pages_data(titles)
+    assert len(FakeMediaWikiHandler.requests_received) == 4
+    assert len(cache) == 2
+
+    # Unchanged pages only cost one batched revision check
+    FakeMediaWikiHandler.requests_received = []
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, cache=cache)
+    source.get_wikipedia_pages_data(titles)
+    assert [params["prop"] for params in FakeMediaWikiHandler.requests_received] == ["pageprops|info"]
+    assert list(source.data["title"]) == titles
+    assert source.data.iloc[0]["links"] == ["Guido van Rossum", "CPython"]
+
+    # Only the page whose revision changed is downloaded again
+    monkeypatch.setitem(FAKE_WIKI_PAGES["Rust (programming language)"], "lastrevid", 1187000003)
+    monkeypatch.setitem(FAKE_WIKI_PAGES["Rust (programming language)"], "extract", "Rust is fast.")
+    FakeMediaWikiHandler.requests_received = []
+    source.get_wikipedia_page_data("Rust (programming language)")
+    assert [params["titles"] for params in FakeMediaWikiHandler.requests_received] == [
+        "Rust (programming language)"
+    ] * 4
+    assert source.data.iloc[-1]["content"] == "Rust is fast."
+
+
+def test_page_cache_eviction(tmp_path):
+    cache = WikipediaPageCache(path=str(tmp_path / "wikipedia.sqlite"), max_entries=2)
+
+    for revid, title in enumerate(["A", "B", "C"]):
+        cache.put_pages("en", {title: (revid, {"title": title})})
+        time.sleep(0.01)
+    cache.get_pages("en", ["B"])
+    cache.put_pages("en", {"D": (3, {"title": "D"})})
+
+    assert set(cache.get_pages("en", ["A", "B", "C", "D"])) == {"B", "D"}
+
+
+@patch("wikipedia.search", return_value=["Python (programming language)"])
+def test_search_cache_ttl(mock_search, tmp_path):
+    cache = WikipediaPageCache(path=str(tmp_path / "wikipedia.sqlite"), search_ttl=timedelta(hours=1))
+    source = WikipediaSource(rate_limit=False, cache=cache)
+
+    assert source.search("python", 5) == ["Python (programming language)"]
+    assert source.search("python", 5) == ["Python (programming language)"]
+    assert mock_search.call_count == 1
+
+    cache.search_ttl = timedelta(0)
+    source.search("python", 5)
+    assert mock_search.call_count == 2
+
+
+def test_selective_fields_batched(fake_mediawiki, tmp_path):
+    cache = WikipediaPageCache(path=str(tmp_path / "wikipedia.sqlite"))
+    titles = ["Python (programming language)", "Rust (programming language)"]
+
+    # Unselected properties are not requested, so there is no links continuation either
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, cache=cache, fields=["pageid", "title"])
+    source.get_wikipedia_pages_data(titles)
+    assert [params["prop"] for params in FakeMediaWikiHandler.requests_received] == ["pageprops|info"]
+    assert list(source.data.columns) == ["pageid", "title"]
+    assert list(source.data["pageid"]) == ["23862", "29414838"]
+
+    # Cached records without all the requested fields are downloaded again
+    FakeMediaWikiHandler.requests_received = []
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, cache=cache, fields=["title", "links"])
+    source.get_wikipedia_pages_data(titles)
+    assert [params["prop"] for params in FakeMediaWikiHandler.requests_received] == ["pageprops|info|links"] * 2
+    assert source.data.iloc[0]["links"] == ["Guido van Rossum", "CPython"]
+
+
+def test_crawl_link_graph(fake_mediawiki, monkeypatch):
+    monkeypatch.setitem(FAKE_WIKI_PAGES, "Guido van Rossum", {
+        "pageid": 12345,
+        "links": [{"ns": 0, "title": "Python (programming language)"}, {"ns": 0, "title": "Netherlands"}],
+    })
+    monkeypatch.setitem(FAKE_WIKI_PAGES, "CPython", {
+        "pageid": 12346,
+        "links": [{"ns": 0, "title": "Python (programming language)"}, {"ns": 0, "title": "C (programming language)"}],
+    })
+    source = WikipediaSource(api_url=fake_mediawiki, rate_limit=False, max_workers=2)
+
+    graph = source.crawl_link_graph(seeds=["Python (programming language)"], max_depth=2, batch_size=1)
+
+    assert graph.titles == [
+        "Python (programming language)", "Guido van Rossum", "CPython", "Netherlands", "C (programming language)"
+    ]
+    assert graph.indptr.dtype == np.int64 and graph.indices.dtype == np.int32
+    assert graph.n_links == 6
+    assert graph.neighbors("Python (programming language)") == ["Guido van Rossum", "CPython"]
+    assert graph.neighbors("CPython") == ["Python (programming language)", "C (programming language)"]
+    # The pages at max_depth are kept, without fetching their links
+    assert list(graph.expanded) == [True, True, True, False, False]
+    assert list(graph.out_degrees()) == [2, 2, 2, 0, 0]
+    assert list(graph.edges()["target"]) == [1, 2, 0, 3, 0, 4]
+
+    # The graph stops growing at max_nodes, keeping the links between the pages it has
+    graph = source.crawl_link_graph(seeds=["Python (programming language)"], max_nodes=2)
+    assert graph.titles == ["Python (programming language)", "Guido van Rossum"]
+    assert graph.neighbors("Guido van Rossum") == ["Python (programming language)"]
@@ -1,8 +1,13 @@
 import pytest
 from unittest.mock import patch, Mock
 from datetime import datetime, timedelta
+from social_signals.common.errors import XAPIError
+from social_signals.utils.rate_limit import RateLimitWindow
 from social_signals.x.source import XSource
+from social_signals.x.state import XWatermarkStore
 import json
+import time
+import pandas as pd
 
 
 @pytest.fixture
@@ -71,13 +76,20 @@ MOCK_RESPONSE = {
 }
 
 
-@patch('requests.get')
+def _mock_status_response(status_code, headers=None, json_response=MOCK_RESPONSE):
+    mock_response = Mock()
+    mock_response.status_code = status_code
+    mock_response.headers = headers or {}
+    mock_response.text = f"status {status_code}"
+    mock_response.content = json.dumps(json_response).encode("utf-8")
+    mock_response.json.side_effect = lambda: json.loads(mock_response.content)
+    return mock_response
+
+
+@patch('requests.Session.get')
 def test_search(mock_get, source):
     # Set up the mock to return a predefined response
-    mock_response = Mock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = MOCK_RESPONSE
-    mock_get.return_value = mock_response
+    mock_get.return_value = _mock_status_response(200)
 
     search_term = "protest"
     yesterday = datetime.now() - timedelta(days=1)
@@ -89,4 +101,201 @@ def test_search(mock_get, source):
     # Assertions
     mock_get.assert_called_once()
     assert tweets is not None
-    assert len(tweets) == len(MOCK_RESPONSE['data'])
\ No newline at end of file
+    assert len(tweets) == len(MOCK_RESPONSE['data'])
+
+
+def _mock_search_pages(n_pages):
+    # Each page holds one copy of the mock tweet per requested result, and links to the next page
+    def get(url, auth=None, params=None):
+        page = int(params.get('next_token', 0))
+        json_response = json.loads(json.dumps(MOCK_RESPONSE))
+        json_response['data'] = [
+            dict(MOCK_RESPONSE['data'][0], id=f"{page}-{i}") for i in range(params['max_results'])
+        ]
+        json_response['meta'] = {'result_count': params['max_results']}
+        if page + 1 < n_pages:
+            json_response['meta']['next_token'] = str(page + 1)
+
+        return _mock_status_response(200, json_response=json_response)
+    return get
+
+
+@patch('requests.Session.get')
+def test_iter_search(mock_get, source):
+    mock_get.side_effect = _mock_search_pages(n_pages=3)
+
+    batches = list(source.iter_search("protest", "2023-12-04T00:00:00Z", end_time="2023-12-05T00:00:00Z", page_size=10))
+
+    # Pages are followed until there is no next_token
+    assert [len(batch) for batch in batches] == [10, 10, 10]
+    assert list(batches[1]['tweet_id'][:2]) == ["1-0", "1-1"]
+    assert 'next_token' not in mock_get.call_args_list[0].kwargs['params']
+    assert mock_get.call_args_list[2].kwargs['params']['next_token'] == "2"
+    assert mock_get.call_args_list[0].kwargs['params']['end_time'] == "2023-12-05T00:00:00Z"
+
+
+@patch('requests.Session.get')
+def test_iter_search_n_results(mock_get, source):
+    mock_get.side_effect = _mock_search_pages(n_pages=10)
+
+    batches = list(source.iter_search("protest", "2023-12-04T00:00:00Z", n_results=25, page_size=10))
+
+    # The last page asks for the API minimum, and is cut down to the target count
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert [call.kwargs['params']['max_results'] for call in mock_get.call_args_list] == [10, 10, 10]
+
+    # Stopping early does not leave the prefetching thread hanging
+    mock_get.reset_mock()
+    for batch in source.iter_search("protest", "2023-12-04T00:00:00Z", page_size=10):
+        break
+    assert mock_get.call_count <= 3
+
+    with pytest.raises(ValueError):
+        next(source.iter_search("protest", "2023-12-04T00:00:00Z", page_size=500))
+
+
+@patch('time.sleep')
+@patch('requests.Session.get')
+def test_search_retries(mock_get, mock_sleep):
+    source = XSource(x_bearer_token=None, backoff_factor=0.5)
+    mock_get.side_effect = [_mock_status_response(503), _mock_status_response(502), _mock_status_response(200)]
+
+    tweets = source.search("protest", "2023-12-04T00:00:00Z")
+
+    # Server errors are retried with exponential backoff
+    assert len(tweets) == len(MOCK_RESPONSE['data'])
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 1.0]
+
+    # Other errors, and errors left after the last retry, raise an XAPIError
+    mock_get.side_effect = [_mock_status_response(400)]
+    with pytest.raises(XAPIError) as error:
+        source.search("protest", "2023-12-04T00:00:00Z")
+    assert error.value.status_code == 400
+
+    source.max_retries = 1
+    mock_get.side_effect = [_mock_status_response(500), _mock_status_response(500)]
+    with pytest.raises(XAPIError):
+        source.search("protest", "2023-12-04T00:00:00Z")
+
+
+@patch('time.sleep')
+@patch('requests.Session.get')
+def test_search_rate_limit_window(mock_get, mock_sleep):
+    window = RateLimitWindow()
+    sources = [XSource(x_bearer_token=None, rate_limit_window=window) for _ in range(2)]
+    reset_at = time.time() + 100
+    mock_get.side_effect = [
+        _mock_status_response(200, {'x-rate-limit-remaining': '1', 'x-rate-limit-reset': str(reset_at)}),
+        _mock_status_response(429, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(reset_at)}),
+        _mock_status_response(200, {'x-rate-limit-remaining': '449', 'x-rate-limit-reset': str(reset_at + 900)}),
+    ]
+
+    sources[0].search("protest", "2023-12-04T00:00:00Z")
+    assert not mock_sleep.called
+
+    # The sources share the budget, and once rate limited the retry waits for the reset rather than backing off
+    sources[1].search("protest", "2023-12-04T00:00:00Z")
+    waits = [call.args[0] for call in mock_sleep.call_args_list]
+    assert len(waits) == 1
+    assert 99 < waits[0] <= 100
+
+
+@patch('time.sleep')
+def test_rate_limit_window_pacing(mock_sleep):
+    window = RateLimitWindow()
+    window.update(4, time.time() + 8)
+
+    # The remaining requests are spread over what is left of the window
+    waits = [window.acquire() for _ in range(3)]
+    assert waits[0] == 0
+    assert 1.9 < waits[1] <= 2
+    assert 3.9 < waits[2] <= 4
+
+
+class FakeTimeline:
+    # Recent search over a growing list of tweets, newest first, honouring since_id and next_token
+    def __init__(self, n_tweets):
+        self.tweet_ids = list(range(1000, 1000 + n_tweets))
+
+    def get(self, url, auth=None, params=None):
+        since_id = int(params.get('since_id', 0))
+        matching = sorted((tweet_id for tweet_id in self.tweet_ids if tweet_id > since_id), reverse=True)
+        offset = int(params.get('next_token', 0))
+        page = matching[offset:offset + params['max_results']]
+
+        json_response = json.loads(json.dumps(MOCK_RESPONSE))
+        json_response['data'] = [dict(MOCK_RESPONSE['data'][0], id=str(tweet_id)) for tweet_id in page]
+        json_response['meta'] = {'result_count': len(page)}
+        if offset + len(page) < len(matching):
+            json_response['meta']['next_token'] = str(offset + len(page))
+        return _mock_status_response(200, json_response=json_response)
+
+
+@patch('requests.Session.get')
+def test_poll(mock_get, source, tmp_path):
+    state = XWatermarkStore(path=str(tmp_path / "x.sqlite"))
+    timeline = FakeTimeline(n_tweets=25)
+    mock_get.side_effect = timeline.get
+
+    tweets = source.poll("protest", state, start_time="2023-12-04T00:00:00Z", page_size=10)
+    assert len(tweets) == 25
+    assert state.get("protest") == "1024"
+    assert mock_get.call_args_list[0].kwargs['params']['start_time'] == "2023-12-04T00:00:00Z"
+
+    # The next poll only asks for, and returns, the tweets posted since
+    timeline.tweet_ids.extend([1025, 1026])
+    mock_get.reset_mock()
+    tweets = source.poll("protest", XWatermarkStore(path=str(tmp_path / "x.sqlite")), page_size=10)
+    assert list(tweets['tweet_id']) == ["1026", "1025"]
+    assert mock_get.call_count == 1
+    assert mock_get.call_args.kwargs['params']['since_id'] == "1024"
+    assert 'start_time' not in mock_get.call_args.kwargs['params']
+
+    # Nothing new leaves the watermark where it is
+    tweets = source.poll("protest", state, page_size=10)
+    assert tweets.empty
+    assert list(tweets.columns) == XSource.TWEET_COLUMNS
+    assert state.get("protest") == "1026"
+
+    # Watermarks never move backwards
+    state.put("protest", "999")
+    assert state.get("protest") == "1026"
+    assert len(state) == 1
+
+
+@patch('requests.Session.get')
+def test_search_typed(mock_get):
+    source = XSource(x_bearer_token=None, typed=True)
+    mock_get.return_value = _mock_status_response(200)
+
+    tweets = source.search("protest", "2023-12-04T00:00:00Z")
+
+    # Metrics are flattened into integer columns, joined to the right author
+    assert list(tweets.columns) == XSource.TYPED_TWEET_COLUMNS
+    tweet = tweets.iloc[0]
+    assert tweet['tweet_impression_count'] == 60
+    assert tweet['author_username'] == "WhiteStarPrime"
+    assert tweet['author_followers_count'] == 1942
+    assert str(tweets['tweet_created_at'].dtype) == "datetime64[ns, UTC]"
+    assert tweets['author_created_at'].iloc[0] == pd.Timestamp("2014-05-18T02:21:24Z")
+    assert tweets['author_id'].dtype == "category"
+    assert tweets['tweet_like_count'].dtype == "Int64"
+
+    # Tweets whose author is not included keep empty author fields, and empty pages keep the same dtypes
+    json_response = json.loads(json.dumps(MOCK_RESPONSE))
+    json_response['includes'] = {}
+    tweets = source._parse_response_to_dataframe(json_response)
+    assert tweets['author_followers_count'].isna().all()
+    empty = source._parse_response_to_dataframe({})
+    assert [dtype.name for dtype in empty.dtypes] == [dtype.name for dtype in tweets.dtypes]
+
+
+@patch('social_signals.x.source.orjson', None)
+@patch('requests.Session.get')
+def test_search_without_orjson(mock_get, source):
+    mock_get.return_value = _mock_status_response(200)
+
+    tweets = source.search("protest", "2023-12-04T00:00:00Z")
+
+    assert list(tweets['tweet_id']) == ["1731759856669884702"]
+    mock_get.return_value.json.assert_called_once()